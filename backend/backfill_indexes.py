@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+Order Index Backfill Utility
+Rebuilds the Redis secondary indexes (status, completed and tracking-ID
+lookups, and the active driver registry) for orders that were stored
+before the indexes existed. Safe to re-run: every index write is
+idempotent. Run it with the API stopped, as orders changing status
+while being indexed could be left in two status indexes.
+
+Usage:
+    python backfill_indexes.py
+"""
+
+import asyncio
+from redis_client import redis_client
+from services.order_index import rebuild_indexes
+
+
+async def main():
+    print("Connecting to Redis...")
+    await redis_client.connect()
+    print("✅ Connected to Redis\n")
+
+    try:
+        print("Rebuilding order indexes...")
+        indexed = await rebuild_indexes(redis_client.client)
+        print(f"✅ Indexed {indexed} orders")
+    finally:
+        await redis_client.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -4,12 +4,90 @@ import os
 from pathlib import Path
 
 class Settings(BaseSettings):
+    # A single Redis shard (standalone, or a primary with replicas). The
+    # Lua scripts build index keys at run time, so Redis Cluster is not
+    # supported.
     redis_host: str
     redis_port: int = 6379
     redis_username: Optional[str] = None
     redis_password: str = ""
     redis_db: int = 0
     
+    # Number of order keys fetched per MGET in bulk reads
+    order_fetch_chunk_size: int = 500
+    
+    # Order write durability: "fast" trusts the SET reply, "verified" reads
+    # the document back in the same transaction and, when
+    # order_write_replicas > 0, waits for that many replicas to acknowledge
+    order_write_mode: str = "fast"
+    order_write_replicas: int = 0
+    order_write_wait_timeout_ms: int = 100
+    
+    # Order document layout: "json" (one JSON string per order) or "hash"
+    # (one Redis hash per order, partial reads and writes). Convert existing
+    # data with migrate_order_storage.py before switching.
+    order_storage_mode: str = "json"
+    
+    # Serialization of stream events and cached state: "json", "orjson" or
+    # "msgpack" (the latter two need their optional packages installed)
+    serialization_codec: str = "json"
+    
+    # Tracking ID numbers reserved per Redis round trip by each process
+    tracking_id_block_size: int = 50
+    
+    # Source of /api/state: "events" serves the StateView read model kept
+    # up to date by the stream consumer, "indexes" recomputes the state from
+    # the order indexes (cached for a few seconds)
+    state_source: str = "events"
+    
+    # Cache of the index-based state (STATE_SOURCE=indexes). Entries are
+    # fresh for STATE_CACHE_TTL seconds, then served stale while being
+    # rebuilt in the background for up to STATE_CACHE_MAX_STALE seconds, and
+    # kept for STATE_CACHE_HARD_TTL seconds as a fallback if rebuilds fail.
+    # STATE_CACHE_REFRESH_INTERVAL > 0 keeps recently requested entries warm.
+    # Order events invalidate entries immediately, so the TTL only bounds
+    # how long a missed invalidation can go unnoticed.
+    state_cache_ttl: int = 300
+    state_cache_max_stale: int = 600
+    state_cache_hard_ttl: int = 1800
+    state_cache_refresh_interval: float = 0
+    
+    # Per-process LRU of serialized /api/state and delivery responses,
+    # also cleared by order events
+    response_cache_ttl: float = 15.0
+    response_cache_max_entries: int = 256
+    
+    # Run the stream consumer inside each API process. Set to false when
+    # running standalone consumers (python -m services.stream_consumer)
+    stream_consumer_embedded: bool = True
+    # Consumer name within the group; give each standalone consumer its own
+    # stable name so it picks up its pending messages after a restart
+    # (default: the hostname). Embedded consumers append a worker slot to it
+    stream_consumer_name: str = ""
+    # Consumers idle this long are removed from the group by the others
+    stream_consumer_idle_timeout_ms: int = 3600000
+    
+    # Stream consumer: concurrent handler tasks (events of one order always
+    # go to the same task) and messages read but not yet handled
+    stream_consumer_workers: int = 8
+    stream_consumer_max_in_flight: int = 100
+    # Queued messages a worker handles together; the handler writes of a
+    # batch go to Redis in one round trip, then one XACK for those that succeeded
+    stream_consumer_handler_batch: int = 50
+    # Largest XREADGROUP batch while a backlog is drained, and how long a
+    # read waits in Redis for new messages when the stream is idle
+    stream_consumer_max_batch: int = 200
+    stream_consumer_block_ms: int = 5000
+    # Pending messages idle for STREAM_CLAIM_IDLE_MS are taken over and
+    # retried every STREAM_CLAIM_INTERVAL seconds (0 disables); after
+    # STREAM_MAX_DELIVERIES attempts they go to the <stream>:dlq stream
+    stream_claim_idle_ms: int = 60000
+    stream_claim_interval: float = 30.0
+    stream_max_deliveries: int = 5
+    
+    # Automatic retries of a read-modify-write after a version conflict
+    order_cas_max_retries: int = 3
+    
     class Config:
         # Look for .env in backend directory
         env_file = Path(__file__).parent / ".env"
@@ -70,14 +70,10 @@ async def create_sample_order(order_service: OrderService, status: OrderStatus,
         await order_service.update_status(order_id, OrderStatus.IN_TRANSIT)
     
     if status == OrderStatus.DELIVERED:
-        await order_service.update_status(order_id, OrderStatus.DELIVERED)
-    
-    # Adjust timestamp if needed (for historical data)
-    if days_ago > 0:
-        order_obj = await order_service._get_order(order_id)
-        past_date = datetime.utcnow() - timedelta(days=days_ago)
-        order_obj.updated_at = past_date
-        await order_service._save_order(order_obj)
+        # Historical orders are backdated in the delivering transition itself,
+        # so the completed index and the event stream record the past time
+        delivered_at = datetime.utcnow() - timedelta(days=days_ago) if days_ago > 0 else None
+        await order_service.update_status(order_id, OrderStatus.DELIVERED, timestamp=delivered_at)
     
     return order_id
 
@@ -5,10 +5,11 @@ Provides tools to inspect, monitor, and manage Redis Streams in the event-driven
 """
 
 import asyncio
-import json
 import sys
 from datetime import datetime
 from redis_client import redis_client
+from services.codec import decode_stream_data
+from services.stream_consumer import dead_letter_stream, DEAD_LETTER_FIELDS
 
 class StreamInspector:
     """Utility class for inspecting and managing Redis Streams"""
@@ -65,7 +66,7 @@ class StreamInspector:
 
                 # Try to parse the data field
                 try:
-                    event_data = json.loads(data.get('data', '{}'))
+                    event_data = decode_stream_data(data)
                     if 'order' in event_data:
                         order = event_data['order']
                         print(f"Order ID: {order.get('id', 'N/A')}")
@@ -153,6 +154,41 @@ class StreamInspector:
         except Exception as e:
             print(f"Error clearing stream: {e}")
 
+    async def replay_dead_letters(self, stream_name: str, count: int = None) -> int:
+        """
+        Move dead-lettered messages back onto their stream to be handled again
+
+        Each message is re-added with its original fields (as a new entry)
+        and removed from the dead-letter stream in one transaction.
+        """
+        dlq = dead_letter_stream(stream_name)
+        replayed = 0
+        try:
+            entries = await self.redis.client.xrange(dlq, "-", "+", count=count)
+            for entry_id, data in entries:
+                fields = {key: value for key, value in data.items() if key not in DEAD_LETTER_FIELDS}
+                async with self.redis.client.pipeline(transaction=True) as pipe:
+                    pipe.xadd(stream_name, fields)
+                    pipe.xdel(dlq, entry_id)
+                    await pipe.execute()
+                replayed += 1
+            print(f"Replayed {replayed} messages from '{dlq}' onto '{stream_name}'")
+        except Exception as e:
+            print(f"Error replaying dead letters: {e}")
+        return replayed
+
+    async def purge_dead_letters(self, stream_name: str) -> int:
+        """Delete every dead-lettered message of a stream"""
+        dlq = dead_letter_stream(stream_name)
+        purged = 0
+        try:
+            purged = await self.redis.client.xlen(dlq)
+            await self.redis.client.delete(dlq)
+            print(f"Purged {purged} messages from '{dlq}'")
+        except Exception as e:
+            print(f"Error purging dead letters: {e}")
+        return purged
+
 async def main():
     if len(sys.argv) < 2:
         print("Usage: python inspect_streams.py <command> [args...]")
@@ -164,6 +200,9 @@ async def main():
         print("  create-group <stream> <group> [start_id] - Create consumer group")
         print("  trim <stream> <max_len>         - Trim stream to max length")
         print("  clear <stream>                  - Clear all entries from stream")
+        print("  dlq-read <stream> [count]       - Read dead-lettered messages of a stream")
+        print("  dlq-replay <stream> [count]     - Put dead-lettered messages back on the stream")
+        print("  dlq-purge <stream>              - Delete the dead-lettered messages of a stream")
         return
 
     inspector = StreamInspector()
@@ -195,6 +234,17 @@ async def main():
         elif command == "clear" and len(sys.argv) >= 3:
             await inspector.clear_stream(sys.argv[2])
 
+        elif command == "dlq-read" and len(sys.argv) >= 3:
+            count = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+            await inspector.read_recent_events(dead_letter_stream(sys.argv[2]), count)
+
+        elif command == "dlq-replay" and len(sys.argv) >= 3:
+            count = int(sys.argv[3]) if len(sys.argv) > 3 else None
+            await inspector.replay_dead_letters(sys.argv[2], count)
+
+        elif command == "dlq-purge" and len(sys.argv) >= 3:
+            await inspector.purge_dead_letters(sys.argv[2])
+
         else:
             print("Invalid command or arguments")
 
@@ -1,13 +1,19 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import PlainTextResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from redis_client import redis_client
+from config import settings
 from services.order_service import OrderService
+from services.order_repository import VersionConflictError
 from services.delivery_service import DeliveryService
 from services.state_service import StateService, CachedStateService
+from services.state_view import StateView
+from services.state_changes import StateChangeFeed
+from services.cache_invalidation import InvalidationListener, current_generation
 from services.metrics_service import MetricsService
 from services.stream_consumer import event_processor
 from models import PizzaOrder, OrderStatus, EventBatch, BatchResult
+from datetime import datetime
 import asyncio
 import logging
 
@@ -23,79 +29,168 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
 order_service = None
 delivery_service = None
 state_service = None
+state_changes = None
+invalidation_listener = None
 metrics_service = None
 
 @app.on_event("startup")
 async def startup():
     await redis_client.connect()
-    global order_service, delivery_service, state_service, metrics_service
+    global order_service, delivery_service, state_service, state_changes, metrics_service, invalidation_listener
     order_service = OrderService(redis_client)
+    await order_service.orders.load_scripts()
     delivery_service = DeliveryService(redis_client)
-    base_state_service = StateService(redis_client)
-    state_service = CachedStateService(base_state_service, redis_client)
+    if settings.state_source == "events":
+        # Kept current by the stream consumer, so no cache is needed
+        state_service = StateView(redis_client)
+        await state_service.ensure_built()
+    elif settings.state_source == "indexes":
+        base_state_service = StateService(redis_client)
+        state_service = CachedStateService(base_state_service, redis_client, settings.state_cache_ttl)
+        if settings.state_cache_refresh_interval > 0:
+            state_service.start_refresher(settings.state_cache_refresh_interval)
+    else:
+        raise ValueError(f"Unknown state source: {settings.state_source}")
+    state_changes = StateChangeFeed(redis_client, state_service)
     metrics_service = MetricsService(redis_client)
     
-    # Start the stream consumer for event processing
-    asyncio.create_task(event_processor.start())
-    logger.info("Stream consumer started")
+    # Drop in-process cached responses whenever an order changes
+    invalidation_listener = InvalidationListener(redis_client)
+    invalidation_listener.on_invalidate(delivery_service.responses.discard)
+    if isinstance(state_service, CachedStateService):
+        invalidation_listener.on_invalidate(state_service.clear_responses)
+    invalidation_listener.start()
+    
+    # Start the stream consumer for event processing, unless it runs as
+    # its own process (python -m services.stream_consumer)
+    if settings.stream_consumer_embedded:
+        # Workers share the configured consumer name, each claims a slot under it
+        asyncio.create_task(event_processor.start(per_worker=True))
+        logger.info("Stream consumer started")
 
 @app.on_event("shutdown")
 async def shutdown():
+    if isinstance(state_service, CachedStateService):
+        await state_service.stop_refresher()
+    if invalidation_listener is not None:
+        await invalidation_listener.stop()
     await event_processor.stop()
     await redis_client.disconnect()
 
+def _not_modified(request: Request, etag: str) -> bool:
+    """Whether the client's If-None-Match already names this version (weak comparison)"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in tags
+
+def _not_modified_response(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+def _state_etag(generation: int) -> str:
+    # The date is part of the tag because completed_today rolls over at midnight
+    return f'W/"state-{generation}-{datetime.utcnow().date().isoformat()}"'
+
+@app.exception_handler(VersionConflictError)
+async def version_conflict_handler(request: Request, exc: VersionConflictError):
+    """A transition was based on a stale version of the order"""
+    return JSONResponse(
+        status_code=409,
+        content={"detail": str(exc), "current_version": exc.current_version}
+    )
+
 @app.post("/api/orders")
 async def create_order(order: PizzaOrder):
     event = await order_service.create_order(order)
     return event.model_dump(mode='json')
 
 @app.post("/api/orders/{order_id}/supplier-respond")
-async def supplier_respond(order_id: str, accept: bool, notes: str = None, estimated_time: int = None):
+async def supplier_respond(order_id: str, accept: bool, notes: str = None, estimated_time: int = None,
+                           expected_version: int = None):
     try:
-        event = await order_service.supplier_respond(order_id, accept, notes, estimated_time)
+        event = await order_service.supplier_respond(order_id, accept, notes, estimated_time, expected_version)
         return event.model_dump(mode='json')
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
 
 @app.post("/api/orders/{order_id}/customer-accept")
-async def customer_accept(order_id: str, customer_name: str, delivery_address: str):
+async def customer_accept(order_id: str, customer_name: str, delivery_address: str, expected_version: int = None):
     try:
-        event = await order_service.customer_accept(order_id, customer_name, delivery_address)
+        event = await order_service.customer_accept(order_id, customer_name, delivery_address, expected_version)
         return event.model_dump(mode='json')
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/api/orders/{order_id}/dispatch")
-async def dispatch_order(order_id: str, driver_name: str):
+async def dispatch_order(order_id: str, driver_name: str, expected_version: int = None):
     try:
-        event = await order_service.dispatch_order(order_id, driver_name)
+        event = await order_service.dispatch_order(order_id, driver_name, expected_version)
         return event.model_dump(mode='json')
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
 
 @app.post("/api/orders/{order_id}/status")
-async def update_order_status(order_id: str, status: OrderStatus):
+async def update_order_status(order_id: str, status: OrderStatus, expected_version: int = None):
     try:
-        event = await order_service.update_status(order_id, status)
+        event = await order_service.update_status(order_id, status, expected_version)
         return event.model_dump(mode='json')
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
 
 @app.get("/api/orders")
-async def get_orders():
-    return await order_service.get_all_orders()
+async def get_orders(
+    request: Request,
+    response: Response,
+    cursor: str = None,
+    limit: int = Query(100, ge=1, le=500),
+    status: OrderStatus = None,
+    supplier: str = None,
+    driver: str = None
+):
+    """
+    Get one page of orders, newest first
+    
+    The body stays a plain list of orders; when more orders are available
+    the cursor for the next page is returned in the X-Next-Cursor header.
+    
+    The ETag is the ID of the newest order event, so a client polling with
+    If-None-Match gets a 304 until some order changes, without the page
+    being read.
+    """
+    etag = f'W/"orders-{await order_service.latest_event_id()}"'
+    if _not_modified(request, etag):
+        return _not_modified_response(etag)
+    
+    try:
+        orders, next_cursor = await order_service.list_orders(
+            cursor=cursor,
+            limit=limit,
+            status=status,
+            supplier_name=supplier,
+            driver_name=driver
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    return orders
 
 @app.get("/api/orders/{order_id}/delivery")
 async def get_delivery_info(order_id: str):
     """Get delivery tracking information for an order by UUID"""
     try:
-        delivery_info = await delivery_service.get_delivery_info(order_id)
-        return delivery_info
+        body = await delivery_service.get_delivery_info_response(order_id)
+        return Response(content=body, media_type="application/json")
     except ValueError as e:
         error_msg = str(e)
         if "not found" in error_msg:
@@ -115,8 +210,8 @@ async def track_by_tracking_id(tracking_id: str):
         
         # If dispatched, return full delivery info
         if order["status"] in ["dispatched", "in_transit", "delivered"]:
-            delivery_info = await delivery_service.get_delivery_info(order["id"])
-            return delivery_info
+            body = await delivery_service.get_delivery_info_response(order["id"])
+            return Response(content=body, media_type="application/json")
         else:
             # Return basic order info if not yet dispatched
             return {
@@ -133,14 +228,69 @@ async def track_by_tracking_id(tracking_id: str):
         raise HTTPException(status_code=404, detail=str(e))
 
 @app.get("/api/state")
-async def get_system_state(include_completed: bool = True, limit: int = None):
-    """Get complete system state with caching"""
+async def get_system_state(request: Request, include_completed: bool = True, limit: int = None):
+    """
+    Get complete system state with caching
+    
+    The ETag is the cache generation, which the stream consumer bumps after
+    applying each order event, plus the date (completed_today rolls over).
+    It is read before the state, so the body is never older than its tag;
+    a stale cached body being revalidated is tagged with the older
+    generation it was built from, so the next poll fetches the fresh one.
+    A client polling with If-None-Match gets a 304 without any state being
+    built or serialized.
+    """
     try:
-        state = await state_service.get_system_state(include_completed, limit)
-        return state.model_dump(mode='json')
+        generation = await current_generation(redis_client)
+        etag = _state_etag(generation)
+        if _not_modified(request, etag):
+            return _not_modified_response(etag)
+        body, built_generation = await state_service.get_system_state_response(include_completed, limit, generation)
+        if built_generation != generation:
+            etag = _state_etag(built_generation)
+        return Response(content=body, media_type="application/json",
+                        headers={"ETag": etag, "Cache-Control": "no-cache"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get system state: {str(e)}")
 
+@app.get("/api/state/orders")
+async def get_state_orders(
+    status: OrderStatus = None,
+    include_completed: bool = True,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=500)
+):
+    """
+    Get one page of orders per status, newest first
+    
+    Lets the dashboard page through a status column (`status`) without
+    loading the other columns or the orders before `offset`.
+    """
+    return await state_service.get_orders_by_status(include_completed, limit, offset, status)
+
+@app.get("/api/state/changes")
+async def get_state_changes(since: str = None, limit: int = Query(500, ge=1, le=1000)):
+    """
+    Get the orders and counters changed since a stream entry
+    
+    Pass the returned high_water_mark as `since` on the next call. Without
+    `since`, or when it is too old, the response has reset=true and the
+    client should reload /api/state.
+    """
+    try:
+        changes = await state_changes.get_changes(since, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return changes.model_dump(mode='json')
+
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    """Hit/miss/eviction counters of this worker's response caches"""
+    stats = {"delivery": delivery_service.responses.stats()}
+    if isinstance(state_service, CachedStateService):
+        stats["state"] = await state_service.get_cache_stats()
+    return stats
+
 @app.post("/api/events/batch")
 async def dispatch_event_batch(batch: EventBatch):
     """
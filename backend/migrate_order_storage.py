@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Order Storage Migration Utility
+Converts order documents between the "json" layout (one JSON string per
+order) and the "hash" layout (one Redis hash per order). Safe to re-run:
+orders already in the target layout are skipped, and an order modified
+while its batch is being converted is retried instead of overwritten.
+
+Stop the API and consumers (or at least writers) while migrating, then set
+ORDER_STORAGE_MODE to the target layout before starting them again.
+
+Usage:
+    python migrate_order_storage.py --to hash
+    python migrate_order_storage.py --to json
+"""
+
+import argparse
+import asyncio
+import json
+from typing import List
+from redis.exceptions import WatchError
+from redis_client import redis_client
+from services.order_index import ORDER_KEY_PREFIX
+from services.order_storage import (
+    encode_fields,
+    key_types,
+    read_documents,
+    STORAGE_JSON,
+    STORAGE_HASH,
+    STORAGE_MODES,
+)
+
+
+async def migrate_orders(client, target: str, batch_size: int = 200) -> int:
+    """
+    Convert every order document to the target layout
+
+    Args:
+        client: Raw redis.asyncio client
+        target: "json" or "hash"
+        batch_size: Number of orders converted per transaction
+
+    Returns:
+        Number of orders converted
+    """
+    if target not in STORAGE_MODES:
+        raise ValueError(f"Unknown order storage mode: {target}")
+    source_type = "string" if target == STORAGE_HASH else "hash"
+
+    converted = 0
+    cursor = 0
+    while True:
+        cursor, keys = await client.scan(cursor, match=f"{ORDER_KEY_PREFIX}*", count=batch_size)
+        if keys:
+            converted += await _migrate_batch(client, keys, source_type, target)
+        if cursor == 0:
+            break
+    return converted
+
+
+async def _migrate_batch(client, keys: List[str], source_type: str, target: str) -> int:
+    while True:
+        async with client.pipeline(transaction=True) as pipe:
+            await pipe.watch(*keys)
+            types = await key_types(client, keys)
+            pending = [key for key, key_type in zip(keys, types) if key_type == source_type]
+            if not pending:
+                return 0
+            documents = await read_documents(client, pending)
+
+            pipe.multi()
+            for key, document in zip(pending, documents):
+                pipe.delete(key)
+                if target == STORAGE_HASH:
+                    pipe.hset(key, mapping=encode_fields(document))
+                else:
+                    pipe.set(key, json.dumps(document, default=str))
+            try:
+                await pipe.execute()
+                return len(pending)
+            except WatchError:
+                continue
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Convert order documents between storage layouts")
+    parser.add_argument("--to", dest="target", required=True, choices=[STORAGE_JSON, STORAGE_HASH],
+                        help="Target storage layout")
+    parser.add_argument("--batch-size", type=int, default=200, help="Orders converted per transaction")
+    args = parser.parse_args()
+
+    print("Connecting to Redis...")
+    await redis_client.connect()
+    print("✅ Connected to Redis\n")
+
+    try:
+        print(f"Converting orders to the {args.target} layout...")
+        converted = await migrate_orders(redis_client.client, args.target, args.batch_size)
+        print(f"✅ Converted {converted} orders")
+        print(f"\nSet ORDER_STORAGE_MODE={args.target} before restarting the services")
+    finally:
+        await redis_client.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -33,6 +33,7 @@ class PizzaOrder(BaseModel):
     supplier_notes: Optional[str] = None
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
+    version: int = 0  # Incremented on every write, used for optimistic concurrency
 
 class OrderEvent(BaseModel):
     event_type: str
@@ -83,6 +84,18 @@ class SystemState(BaseModel):
     orders_by_status: dict[str, list[dict]]
     active_drivers: list[ActiveDriver]
     last_updated: datetime
+    # Stream entry the state is at least as new as, pass as `since` to /api/state/changes
+    changes_mark: Optional[str] = None
+
+class StateChanges(BaseModel):
+    """Changes to the system state since a stream entry"""
+    since: Optional[str] = None
+    high_water_mark: str  # ID of the last stream entry included, pass as `since` next time
+    reset: bool = False  # True if `since` is missing or too old; refetch the full state
+    has_more: bool = False  # True if more changes are waiting past high_water_mark
+    orders: list[dict]  # Current version of every order changed since `since`
+    statistics: SystemStatistics
+    active_drivers: list[ActiveDriver]
 
 class EventBatch(BaseModel):
     """Batch of events to be processed atomically"""
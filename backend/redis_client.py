@@ -10,7 +10,9 @@ class RedisClient:
             "host": settings.redis_host,
             "port": settings.redis_port,
             "db": settings.redis_db,
-            "decode_responses": True
+            "decode_responses": True,
+            # Binary values (msgpack payloads) survive the str round trip
+            "encoding_errors": "surrogateescape"
         }
         
         # Add username if provided
@@ -68,7 +70,7 @@ class RedisClient:
         return entries
     
     async def read_stream_group(self, stream_name: str, group_name: str, consumer_name: str, 
-                               count: int = 1, block: int = None) -> list:
+                               count: int = 1, block: int = None, start_id: str = ">") -> list:
         """
         Read events from a stream using consumer groups
         
@@ -78,13 +80,15 @@ class RedisClient:
             consumer_name: Consumer name
             count: Number of messages to read
             block: Block timeout in milliseconds
+            start_id: ">" for new messages, or an ID to re-read this
+                consumer's own pending messages after it
             
         Returns:
             List of pending messages for the consumer
         """
         try:
             messages = await self.client.xreadgroup(
-                group_name, consumer_name, {stream_name: ">"}, count=count, block=block
+                group_name, consumer_name, {stream_name: start_id}, count=count, block=block
             )
             return messages
         except redis.ResponseError as e:
@@ -93,7 +97,7 @@ class RedisClient:
                 await self.create_consumer_group(stream_name, group_name)
                 # Retry reading
                 messages = await self.client.xreadgroup(
-                    group_name, consumer_name, {stream_name: ">"}, count=count, block=block
+                    group_name, consumer_name, {stream_name: start_id}, count=count, block=block
                 )
                 return messages
             raise
@@ -106,12 +110,17 @@ class RedisClient:
             stream_name: Name of the stream
             group_name: Consumer group name
             start_id: Starting ID for the group
+            
+        Returns:
+            True if the group was created, False if it already existed
         """
         try:
             await self.client.xgroup_create(stream_name, group_name, start_id, mkstream=True)
+            return True
         except redis.ResponseError as e:
             if "BUSYGROUP" not in str(e):
                 raise
+            return False
     
     async def acknowledge_message(self, stream_name: str, group_name: str, message_ids: list):
         """
@@ -121,8 +130,11 @@ class RedisClient:
             stream_name: Name of the stream
             group_name: Consumer group name
             message_ids: List of message IDs to acknowledge
+            
+        Returns:
+            Number of messages that were acknowledged
         """
-        await self.client.xack(stream_name, group_name, *message_ids)
+        return await self.client.xack(stream_name, group_name, *message_ids)
     
     async def get_stream_info(self, stream_name: str) -> dict:
         """
@@ -0,0 +1,101 @@
+from services.order_scripts import BUMP_GENERATION_SCRIPT, BUMP_GENERATION_SCRIPT_SHA, run_script
+from typing import Callable, List, Optional
+import asyncio
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Bumped on every order change. Cache entries record the generation they
+# were built from and are outdated as soon as it moves on, so nothing ever
+# has to find and delete them.
+GENERATION_KEY = "state_cache:generation"
+# Carries every bump to the API workers so they can drop in-process entries
+INVALIDATION_CHANNEL = "state_cache:invalidations"
+
+
+async def bump_generation(redis_client, order_id: str = "") -> int:
+    """
+    Invalidate cached state after an order changed
+
+    Args:
+        redis_client: RedisClient instance
+        order_id: ID of the order that changed, passed on to listeners
+
+    Returns:
+        The new generation
+    """
+    return int(await run_script(
+        redis_client.client, BUMP_GENERATION_SCRIPT, BUMP_GENERATION_SCRIPT_SHA,
+        [GENERATION_KEY], [INVALIDATION_CHANNEL, order_id]
+    ))
+
+
+async def current_generation(redis_client) -> int:
+    """Get the current cache generation"""
+    return int(await redis_client.client.get(GENERATION_KEY) or 0)
+
+
+class InvalidationListener:
+    """
+    Receives generation bumps in an API worker
+
+    Callbacks are called with the ID of the changed order for every bump.
+    Missed messages (e.g. while reconnecting) only delay invalidation of
+    in-process entries until their TTL; Redis entries are checked against
+    the generation key itself.
+    """
+
+    def __init__(self, redis_client):
+        self.redis = redis_client
+        self.generation = 0
+        self._callbacks: List[Callable[[str], None]] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def on_invalidate(self, callback: Callable[[str], None]):
+        """Register a callback taking the ID of the changed order"""
+        self._callbacks.append(callback)
+
+    def start(self):
+        """Start listening in the background"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        """Stop listening"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def handle(self, message: str):
+        """Apply one invalidation message"""
+        try:
+            data = json.loads(message)
+        except ValueError:
+            logger.warning("Ignoring malformed invalidation message: %s", message)
+            return
+        self.generation = max(self.generation, int(data.get("generation", 0)))
+        for callback in self._callbacks:
+            callback(data.get("order_id") or "")
+
+    async def _listen(self):
+        while True:
+            try:
+                pubsub = await self.redis.subscribe(INVALIDATION_CHANNEL)
+                try:
+                    while True:
+                        message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                        if message:
+                            self.handle(message["data"])
+                finally:
+                    await pubsub.unsubscribe(INVALIDATION_CHANNEL)
+                    await pubsub.close()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Cache invalidation listener failed, reconnecting: %s", e)
+                await asyncio.sleep(1)
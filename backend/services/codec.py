@@ -0,0 +1,169 @@
+"""
+Pluggable serialization for events and cached state
+
+The codec is selected with SERIALIZATION_CODEC:
+
+- "json": standard library json, always available
+- "orjson": same JSON output, several times faster (requires orjson)
+- "msgpack": compact binary encoding (requires msgpack)
+
+Stream entries record the codec that wrote them in a `codec` /
+`codec_version` header, and readers pick the decoder from that header
+rather than from their own configuration. Entries written before the
+header existed are JSON. This lets producers and consumers switch codecs
+independently while old entries are still in the stream.
+
+Order documents and pub/sub messages always stay JSON: the order
+documents are read by the Lua transition scripts, and pub/sub messages
+are forwarded verbatim to browsers.
+"""
+
+from config import settings
+from datetime import date, datetime
+from functools import lru_cache
+from pydantic import BaseModel
+from typing import Any, Dict, Type, TypeVar, Union
+import json
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # optional dependency
+    msgpack = None
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+# Stream entry header fields
+CODEC_FIELD = "codec"
+CODEC_VERSION_FIELD = "codec_version"
+
+
+class Codec:
+    """Encodes plain data and pydantic models to Redis values and back"""
+
+    name = ""
+    version = 1
+    # Whether the encoded form is JSON text that browsers can consume
+    json_compatible = False
+
+    def dumps(self, obj: Any) -> Union[str, bytes]:
+        raise NotImplementedError
+
+    def loads(self, data: Union[str, bytes]) -> Any:
+        raise NotImplementedError
+
+    def dump_model(self, model: BaseModel) -> Union[str, bytes]:
+        return self.dumps(model.model_dump(mode='json'))
+
+    def load_model(self, model_class: Type[ModelT], data: Union[str, bytes]) -> ModelT:
+        return model_class.model_validate(self.loads(data))
+
+    def stream_header(self) -> Dict[str, str]:
+        """Header fields identifying this codec on a stream entry"""
+        return {CODEC_FIELD: self.name, CODEC_VERSION_FIELD: str(self.version)}
+
+
+class JsonCodec(Codec):
+    name = "json"
+    json_compatible = True
+
+    def dumps(self, obj: Any) -> str:
+        return json.dumps(obj, default=str)
+
+    def loads(self, data: Union[str, bytes]) -> Any:
+        return json.loads(data)
+
+    def dump_model(self, model: BaseModel) -> str:
+        # pydantic's serializer skips the intermediate dict
+        return model.model_dump_json()
+
+    def load_model(self, model_class: Type[ModelT], data: Union[str, bytes]) -> ModelT:
+        return model_class.model_validate_json(data)
+
+
+class OrjsonCodec(Codec):
+    name = "orjson"
+    json_compatible = True
+
+    def __init__(self):
+        if orjson is None:
+            raise RuntimeError("The orjson codec requires the orjson package")
+
+    def dumps(self, obj: Any) -> bytes:
+        return orjson.dumps(obj, default=str)
+
+    def loads(self, data: Union[str, bytes]) -> Any:
+        return orjson.loads(data)
+
+    def dump_model(self, model: BaseModel) -> bytes:
+        # orjson serializes datetimes and enums natively
+        return orjson.dumps(model.model_dump(), default=str)
+
+
+class MsgpackCodec(Codec):
+    name = "msgpack"
+
+    def __init__(self):
+        if msgpack is None:
+            raise RuntimeError("The msgpack codec requires the msgpack package")
+
+    def dumps(self, obj: Any) -> bytes:
+        return msgpack.packb(obj, default=_msgpack_default)
+
+    def loads(self, data: Union[str, bytes]) -> Any:
+        if isinstance(data, str):
+            # The Redis client decodes responses to str; surrogateescape
+            # (see RedisClient) makes that lossless for binary values
+            data = data.encode('utf-8', 'surrogateescape')
+        return msgpack.unpackb(data)
+
+    def dump_model(self, model: BaseModel) -> bytes:
+        return self.dumps(model.model_dump())
+
+
+def _msgpack_default(value: Any) -> str:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+CODECS: Dict[str, Type[Codec]] = {
+    codec.name: codec for codec in (JsonCodec, OrjsonCodec, MsgpackCodec)
+}
+
+
+def get_codec(name: str = None) -> Codec:
+    """
+    Get a codec by name (defaults to SERIALIZATION_CODEC)
+
+    Raises:
+        ValueError: If the codec is unknown
+        RuntimeError: If the codec's package is not installed
+    """
+    return _codec_instance(name or settings.serialization_codec)
+
+
+@lru_cache(maxsize=None)
+def _codec_instance(name: str) -> Codec:
+    if name not in CODECS:
+        raise ValueError(f"Unknown serialization codec: {name}")
+    return CODECS[name]()
+
+
+def decode_stream_data(message_data: Dict[str, str]) -> Any:
+    """
+    Decode the `data` field of a stream entry using the codec named in its header
+
+    Raises:
+        ValueError: If the payload is malformed or was written by a newer
+            version of its codec
+    """
+    codec = get_codec(message_data.get(CODEC_FIELD, JsonCodec.name))
+    version = int(message_data.get(CODEC_VERSION_FIELD, 1))
+    if version > codec.version:
+        raise ValueError(f"Unsupported {codec.name} codec version: {version}")
+    return codec.loads(message_data.get("data", "{}"))
@@ -1,12 +1,33 @@
 from models import PizzaOrder, OrderStatus
+from config import settings
+from services.response_cache import ResponseCache
 from datetime import datetime, timedelta
 from typing import Optional
+import json
 
 class DeliveryService:
     """Service for managing delivery tracking and information"""
     
-    def __init__(self, redis_client):
+    def __init__(self, redis_client, response_cache_ttl: Optional[float] = None):
         self.redis = redis_client
+        if response_cache_ttl is None:
+            response_cache_ttl = settings.response_cache_ttl
+        self.responses = ResponseCache(settings.response_cache_max_entries, response_cache_ttl)
+    
+    async def get_delivery_info_response(self, order_id: str) -> bytes:
+        """
+        Get the serialized delivery info response body
+        
+        Served from the in-process cache when possible. Errors are not cached.
+        
+        Raises:
+            ValueError: If order not found or not dispatched
+        """
+        body = self.responses.get(order_id)
+        if body is None:
+            body = json.dumps(await self.get_delivery_info(order_id)).encode()
+            self.responses.set(order_id, body)
+        return body
     
     async def get_delivery_info(self, order_id: str) -> dict:
         """
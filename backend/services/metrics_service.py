@@ -1,12 +1,16 @@
 from datetime import datetime, timedelta
 from typing import Dict, List
-import json
+from services.order_repository import OrderRepository
+
+# The only order fields the metrics are computed from
+METRIC_FIELDS = ['id', 'status', 'supplier_name', 'driver_name', 'updated_at']
 
 class MetricsService:
     """Service for generating metrics for monitoring and visualization"""
     
     def __init__(self, redis_client):
         self.redis = redis_client
+        self.orders = OrderRepository(redis_client)
     
     async def get_delivery_metrics(self) -> Dict:
         """
@@ -16,6 +20,7 @@ class MetricsService:
             Dictionary with delivery statistics and time-series data
         """
         orders = await self._get_all_orders()
+        version_conflicts = await self.orders.get_version_conflicts()
         
         # Calculate metrics
         total_orders = len(orders)
@@ -53,6 +58,9 @@ class MetricsService:
             "by_supplier": supplier_stats,
             "by_driver": driver_stats,
             "hourly_distribution": hourly_distribution,
+            "concurrency": {
+                "version_conflicts": version_conflicts
+            },
             "timestamp": datetime.utcnow().isoformat()
         }
     
@@ -97,6 +105,10 @@ class MetricsService:
             "# HELP pizza_delivered_month Orders delivered in last 30 days",
             "# TYPE pizza_delivered_month counter",
             f"pizza_delivered_month {metrics['time_series']['last_30_days']}",
+            "",
+            "# HELP pizza_order_version_conflicts_total Order writes rejected by optimistic concurrency checks",
+            "# TYPE pizza_order_version_conflicts_total counter",
+            f"pizza_order_version_conflicts_total {metrics['concurrency']['version_conflicts']}",
             ""
         ]
         
@@ -113,20 +125,8 @@ class MetricsService:
         return "\n".join(lines)
     
     async def _get_all_orders(self) -> List[Dict]:
-        """Fetch all orders from Redis"""
-        keys = []
-        cursor = 0
-        while True:
-            cursor, partial_keys = await self.redis.client.scan(cursor, match="order:*", count=100)
-            keys.extend(partial_keys)
-            if cursor == 0:
-                break
-        orders = []
-        for key in keys:
-            order_data = await self.redis.client.get(key)
-            if order_data:
-                orders.append(json.loads(order_data))
-        return orders
+        """Fetch all orders from Redis (metric fields only)"""
+        return await self.orders.get_all(fields=METRIC_FIELDS)
     
     def _count_orders_by_date(self, orders: List[Dict], days: int) -> int:
         """Count orders within the last N days"""
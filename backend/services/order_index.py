@@ -0,0 +1,159 @@
+from models import PizzaOrder, OrderStatus
+from services.order_storage import read_documents
+from services.order_scripts import DRIVER_REGISTRY_SCRIPT
+from datetime import datetime, timezone, time
+from typing import Optional, Union
+
+# Primary storage: one document per order
+ORDER_KEY_PREFIX = "order:"
+
+# Secondary indexes. All index keys live under "orders:" so that they never
+# match the "order:*" pattern used for the primary documents.
+# Unless noted otherwise, index sorted sets are scored by created_at so they
+# all share the same newest-first ordering and pagination cursors.
+CREATED_INDEX_KEY = "orders:created"       # every order
+STATUS_INDEX_PREFIX = "orders:status:"     # one sorted set per status
+SUPPLIER_INDEX_PREFIX = "orders:supplier:" # one sorted set per supplier
+DRIVER_INDEX_PREFIX = "orders:driver:"     # one sorted set per assigned driver
+COMPLETED_INDEX_KEY = "orders:completed"   # delivered orders, scored by delivery time
+TRACKING_INDEX_KEY = "orders:tracking"     # hash: tracking_id / supplier_tracking_id -> order ID
+# hash: driver name -> JSON object of the driver's orders in an active
+# delivery status ({order ID: {"status", "assigned_at"}}). Drivers without
+# an active delivery have no field.
+ACTIVE_DRIVERS_KEY = "orders:active_drivers"
+
+ACTIVE_DELIVERY_STATUSES = [OrderStatus.DISPATCHED.value, OrderStatus.IN_TRANSIT.value]
+COMPLETED_STATUSES = [OrderStatus.DELIVERED.value, OrderStatus.CANCELLED.value]
+
+
+def order_key(order_id: str) -> str:
+    """Redis key holding the order document"""
+    return f"{ORDER_KEY_PREFIX}{order_id}"
+
+
+def status_index_key(status: Union[OrderStatus, str]) -> str:
+    """Redis key of the sorted set holding order IDs in the given status"""
+    value = status.value if isinstance(status, OrderStatus) else status
+    return f"{STATUS_INDEX_PREFIX}{value}"
+
+
+def supplier_index_key(supplier_name: str) -> str:
+    """Redis key of the sorted set holding a supplier's order IDs"""
+    return f"{SUPPLIER_INDEX_PREFIX}{supplier_name}"
+
+
+def driver_index_key(driver_name: str) -> str:
+    """Redis key of the sorted set holding the order IDs assigned to a driver"""
+    return f"{DRIVER_INDEX_PREFIX}{driver_name}"
+
+
+def to_score(value: Union[datetime, str, None]) -> float:
+    """
+    Convert a timestamp into a sorted-set score
+
+    Order timestamps are naive UTC datetimes (or their ISO strings once
+    serialized), so they are pinned to UTC before taking the epoch value.
+    """
+    if value is None:
+        return 0.0
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def start_of_today_score() -> float:
+    """Score of midnight UTC today, used to count orders completed today"""
+    return to_score(datetime.combine(datetime.utcnow().date(), time.min))
+
+
+def stage_index_update(pipe, order: PizzaOrder, previous: Optional[PizzaOrder] = None):
+    """
+    Queue the index updates for a saved order onto a pipeline
+
+    Must be queued in the same MULTI/EXEC transaction as the document write
+    so that readers never see an order in two status indexes at once.
+
+    Args:
+        pipe: Redis pipeline (transactional) to queue commands on
+        order: The order as it is being saved
+        previous: The order as it was stored before this save. None means
+            the order is being indexed for the first time.
+    """
+    created_score = to_score(order.created_at)
+
+    if previous is None:
+        # Creation-time attributes never change afterwards
+        pipe.zadd(CREATED_INDEX_KEY, {order.id: created_score})
+        pipe.zadd(supplier_index_key(order.supplier_name), {order.id: created_score})
+        # NX: an entry for a tracking ID is never overwritten by another order
+        for tracking_id in (order.tracking_id, order.supplier_tracking_id):
+            if tracking_id:
+                pipe.hsetnx(TRACKING_INDEX_KEY, tracking_id, order.id)
+
+    previous_status = previous.status if previous else None
+    if previous_status != order.status:
+        if previous_status is not None:
+            pipe.zrem(status_index_key(previous_status), order.id)
+        pipe.zadd(status_index_key(order.status), {order.id: created_score})
+
+        if order.status == OrderStatus.DELIVERED:
+            # nx keeps the original delivery time if a delivered order is re-saved
+            pipe.zadd(COMPLETED_INDEX_KEY, {order.id: to_score(order.updated_at)}, nx=True)
+        elif previous_status == OrderStatus.DELIVERED:
+            pipe.zrem(COMPLETED_INDEX_KEY, order.id)
+
+    previous_driver = previous.driver_name if previous else None
+    if previous_driver != order.driver_name:
+        if previous_driver:
+            pipe.zrem(driver_index_key(previous_driver), order.id)
+        if order.driver_name:
+            pipe.zadd(driver_index_key(order.driver_name), {order.id: created_score})
+
+    if (previous_driver or order.driver_name) and (previous_driver != order.driver_name or previous_status != order.status):
+        # EVAL rather than EVALSHA: the pipeline cannot load a missing script
+        status = order.status.value if isinstance(order.status, OrderStatus) else order.status
+        pipe.eval(
+            DRIVER_REGISTRY_SCRIPT, 1, ACTIVE_DRIVERS_KEY,
+            order.id, status, order.driver_name or '', previous_driver or '',
+            order.updated_at.isoformat() if order.updated_at else ''
+        )
+
+
+async def rebuild_indexes(client, batch_size: int = 500) -> int:
+    """
+    Rebuild every order index from the primary order documents
+
+    Used to backfill data written before the indexes existed. Orders are
+    scanned incrementally (SCAN, never KEYS) and re-indexed in batches of
+    pipelined commands. Orders may be stored in either storage layout.
+
+    Run it with the API stopped: an order that transitions between being
+    read and being indexed would be re-added under its old status and end
+    up in two status indexes.
+
+    Args:
+        client: Raw redis.asyncio client
+        batch_size: Number of orders fetched and indexed per round trip
+
+    Returns:
+        Number of orders indexed
+    """
+    indexed = 0
+    cursor = 0
+    while True:
+        cursor, keys = await client.scan(cursor, match=f"{ORDER_KEY_PREFIX}*", count=batch_size)
+        if keys:
+            documents = await read_documents(client, keys)
+            async with client.pipeline(transaction=False) as pipe:
+                for document in documents:
+                    if not document:
+                        continue
+                    order = PizzaOrder(**document)
+                    stage_index_update(pipe, order)
+                    indexed += 1
+                await pipe.execute()
+        if cursor == 0:
+            break
+    return indexed
@@ -0,0 +1,330 @@
+from models import PizzaOrder, OrderStatus
+from services.order_index import (
+    order_key,
+    stage_index_update,
+    to_score,
+    CREATED_INDEX_KEY,
+    COMPLETED_INDEX_KEY,
+    ACTIVE_DRIVERS_KEY,
+    STATUS_INDEX_PREFIX,
+    DRIVER_INDEX_PREFIX,
+)
+from services.order_scripts import (
+    TRANSITION_SCRIPT,
+    TRANSITION_SCRIPT_SHA,
+    TRANSITION_HASH_SCRIPT,
+    TRANSITION_HASH_SCRIPT_SHA,
+    run_script,
+)
+from services.order_storage import (
+    encode_fields,
+    decode_fields,
+    STORAGE_HASH,
+    STORAGE_MODES,
+)
+from config import settings
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+from redis.exceptions import ResponseError, WatchError
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+WRITE_MODE_FAST = "fast"
+WRITE_MODE_VERIFIED = "verified"
+
+# Shared across all API workers so the exported metric covers the whole fleet
+VERSION_CONFLICTS_KEY = "metrics:order_version_conflicts"
+
+
+class InvalidTransitionError(ValueError):
+    """Raised when an order is not in a status the transition allows"""
+
+    def __init__(self, order_id: str, current_status: str):
+        super().__init__(f"Order {order_id} cannot transition from status {current_status}")
+        self.current_status = current_status
+
+
+class VersionConflictError(Exception):
+    """Raised when an order changed between being read and being written"""
+
+    def __init__(self, order_id: str, expected_version: int, current_version: Optional[int]):
+        super().__init__(
+            f"Order {order_id} was modified concurrently "
+            f"(expected version {expected_version}, found {current_version})"
+        )
+        self.expected_version = expected_version
+        self.current_version = current_version
+
+
+class OrderRepository:
+    """
+    Shared storage layer for order documents
+
+    Every service reads and writes orders through this class so that bulk
+    reads are always batched: documents are fetched with MGET in chunks of
+    `chunk_size` keys, and all chunks of one request are sent in a single
+    pipelined round trip. Chunking keeps each command small enough not to
+    stall other Redis clients.
+
+    Orders are stored as JSON strings or as Redis hashes depending on
+    `storage_mode` (see services/order_storage.py). In hash mode, reads
+    that pass `fields` only transfer those fields (HMGET) and updates only
+    rewrite the fields that changed.
+    """
+
+    def __init__(self, redis_client, chunk_size: Optional[int] = None, write_mode: Optional[str] = None,
+                 storage_mode: Optional[str] = None):
+        self.redis = redis_client
+        self.chunk_size = chunk_size or settings.order_fetch_chunk_size
+        self.write_mode = write_mode or settings.order_write_mode
+        if self.write_mode not in (WRITE_MODE_FAST, WRITE_MODE_VERIFIED):
+            raise ValueError(f"Unknown order write mode: {self.write_mode}")
+        self.storage_mode = storage_mode or settings.order_storage_mode
+        if self.storage_mode not in STORAGE_MODES:
+            raise ValueError(f"Unknown order storage mode: {self.storage_mode}")
+
+    async def get(self, order_id: str) -> Optional[dict]:
+        """Fetch a single order document, or None if it does not exist"""
+        if self.storage_mode == STORAGE_HASH:
+            fields = await self.redis.client.hgetall(order_key(order_id))
+            return decode_fields(fields) if fields else None
+        order_data = await self.redis.client.get(order_key(order_id))
+        return json.loads(order_data) if order_data else None
+
+    async def get_many(self, order_ids: List[str], fields: Optional[Sequence[str]] = None) -> Dict[str, dict]:
+        """
+        Fetch many order documents in one pipelined round trip
+
+        Args:
+            order_ids: IDs of the orders to fetch
+            fields: Only return these fields of each order (None = all).
+                The order ID is always included.
+
+        Returns:
+            Dictionary of order ID to order, in the order of `order_ids`.
+            Orders that no longer exist are left out.
+        """
+        if not order_ids:
+            return {}
+        if fields is not None and 'id' not in fields:
+            fields = ['id', *fields]
+
+        if self.storage_mode == STORAGE_HASH:
+            return await self._get_many_hashes(order_ids, fields)
+
+        chunks = [
+            order_ids[i:i + self.chunk_size]
+            for i in range(0, len(order_ids), self.chunk_size)
+        ]
+        async with self.redis.client.pipeline(transaction=False) as pipe:
+            for chunk in chunks:
+                pipe.mget([order_key(order_id) for order_id in chunk])
+            results = await pipe.execute()
+
+        orders = {}
+        for chunk, values in zip(chunks, results):
+            for order_id, value in zip(chunk, values):
+                if value:
+                    order = json.loads(value)
+                    if fields is not None:
+                        order = {field: order.get(field) for field in fields}
+                    orders[order_id] = order
+        return orders
+
+    async def _get_many_hashes(self, order_ids: List[str], fields: Optional[Sequence[str]]) -> Dict[str, dict]:
+        async with self.redis.client.pipeline(transaction=False) as pipe:
+            for order_id in order_ids:
+                if fields is None:
+                    pipe.hgetall(order_key(order_id))
+                else:
+                    pipe.hmget(order_key(order_id), fields)
+            results = await pipe.execute()
+
+        orders = {}
+        for order_id, values in zip(order_ids, results):
+            if fields is not None:
+                values = dict(zip(fields, values))
+                if values['id'] is None:
+                    continue
+                order = {field: None for field in fields}
+                order.update(decode_fields(values))
+                orders[order_id] = order
+            elif values:
+                orders[order_id] = decode_fields(values)
+        return orders
+
+    async def get_all(self, fields: Optional[Sequence[str]] = None) -> List[dict]:
+        """Fetch every order, newest first (optionally only some fields)"""
+        order_ids = await self.redis.client.zrevrange(CREATED_INDEX_KEY, 0, -1)
+        return list((await self.get_many(order_ids, fields)).values())
+
+    async def save(self, order: PizzaOrder, previous: Optional[PizzaOrder] = None):
+        """
+        Write an order document together with its index updates
+
+        Both are sent as one MULTI/EXEC transaction. New orders (no
+        `previous`) are written directly at version 1. Updates are a
+        compare-and-set: the key is WATCHed and the write only goes through
+        if the stored version still equals `previous.version`. In hash
+        storage mode an update only writes the fields that differ from
+        `previous`.
+
+        In "fast" mode the EXEC reply is trusted. In "verified" mode the
+        document is read back inside the same transaction, and if replicas
+        are configured a WAIT follows to confirm replication.
+
+        Args:
+            order: The order to store; its version is set by this call
+            previous: The order as it was read before being modified, if any
+
+        Raises:
+            VersionConflictError: If the stored order changed since `previous` was read
+            RuntimeError: If a verified write could not be confirmed
+        """
+        key = order_key(order.id)
+        verified = self.write_mode == WRITE_MODE_VERIFIED
+        hashed = self.storage_mode == STORAGE_HASH
+
+        async with self.redis.client.pipeline(transaction=True) as pipe:
+            if previous is None:
+                order.version = 1
+            else:
+                await pipe.watch(key)
+                stored_version = await self._read_version(pipe, key)
+                if stored_version != previous.version:
+                    await self._record_conflict()
+                    raise VersionConflictError(order.id, previous.version, stored_version)
+                order.version = previous.version + 1
+                pipe.multi()
+
+            if hashed:
+                payload = encode_fields(order.model_dump(mode='json'))
+                if previous is not None:
+                    unchanged = encode_fields(previous.model_dump(mode='json'))
+                    payload = {field: value for field, value in payload.items() if unchanged.get(field) != value}
+                pipe.hset(key, mapping=payload)
+            else:
+                payload = json.dumps(order.model_dump(mode='json'), default=str)
+                pipe.set(key, payload)
+            stage_index_update(pipe, order, previous)
+            if verified:
+                if hashed:
+                    pipe.hmget(key, list(payload))
+                else:
+                    pipe.get(key)
+
+            try:
+                results = await pipe.execute()
+            except WatchError:
+                await self._record_conflict()
+                raise VersionConflictError(order.id, previous.version, None)
+
+        if not verified:
+            return
+
+        expected = list(payload.values()) if hashed else payload
+        if results[-1] != expected:
+            raise RuntimeError(f"Failed to verify order {order.id} in Redis")
+
+        if settings.order_write_replicas > 0:
+            acked = await self.redis.client.wait(
+                settings.order_write_replicas,
+                settings.order_write_wait_timeout_ms
+            )
+            if acked < settings.order_write_replicas:
+                raise RuntimeError(
+                    f"Order {order.id} reached {acked} of {settings.order_write_replicas} replicas"
+                )
+
+        logger.debug("Verified order in Redis: %s", order.id)
+
+    async def _read_version(self, pipe, key: str) -> Optional[int]:
+        """Stored version of an order on a WATCHed pipeline (None if missing)"""
+        if self.storage_mode == STORAGE_HASH:
+            if not await pipe.exists(key):
+                return None
+            version = await pipe.hget(key, 'version')
+            return json.loads(version) if version else 0
+        stored = await pipe.get(key)
+        return json.loads(stored).get('version', 0) if stored else None
+
+    async def get_version_conflicts(self) -> int:
+        """Total number of version conflicts detected across all workers"""
+        return int(await self.redis.client.get(VERSION_CONFLICTS_KEY) or 0)
+
+    async def _record_conflict(self):
+        await self.redis.client.incr(VERSION_CONFLICTS_KEY)
+
+    async def transition(self, order_id: str, changes: dict, event_type: str, stream_name: str,
+                         channel: str, allowed_from: Optional[List[OrderStatus]] = None,
+                         price_from_markup: bool = False, timestamp: Optional[datetime] = None,
+                         expected_version: Optional[int] = None) -> PizzaOrder:
+        """
+        Atomically apply a state transition and emit its event
+
+        Runs TRANSITION_SCRIPT, which in a single round trip validates the
+        current status (and version, if given), applies the field changes,
+        bumps the version, updates the indexes, appends the event to the
+        stream and publishes it.
+
+        Args:
+            order_id: The order to transition
+            changes: Field values to set (JSON-serializable)
+            event_type: Event type recorded in the stream and pub/sub message
+            stream_name: Stream the event is appended to
+            channel: Pub/sub channel the event is published on
+            allowed_from: Statuses the order must currently be in (None = any)
+            price_from_markup: Derive customer_price from supplier_price and markup
+            timestamp: Transition time (defaults to now)
+            expected_version: Only apply if the stored order is at this version
+
+        Returns:
+            The order as stored after the transition
+
+        Raises:
+            ValueError: If the order does not exist
+            InvalidTransitionError: If the order is not in an allowed status
+            VersionConflictError: If the stored order is not at expected_version
+        """
+        timestamp = timestamp or datetime.utcnow()
+        keys = [order_key(order_id), CREATED_INDEX_KEY, COMPLETED_INDEX_KEY, stream_name, ACTIVE_DRIVERS_KEY]
+        args = [
+            order_id,
+            json.dumps([status.value for status in allowed_from or []]),
+            json.dumps(changes, default=str),
+            event_type,
+            timestamp.isoformat(),
+            to_score(timestamp),
+            channel,
+            STATUS_INDEX_PREFIX,
+            DRIVER_INDEX_PREFIX,
+            "1" if price_from_markup else "0",
+            "" if expected_version is None else str(expected_version),
+        ]
+
+        try:
+            payload = await run_script(self.redis.client, *self._transition_script(), keys, args)
+        except ResponseError as e:
+            message = str(e)
+            if message == "NOT_FOUND":
+                raise ValueError(f"Order {order_id} not found")
+            if message.startswith("INVALID_STATUS"):
+                raise InvalidTransitionError(order_id, message.split(" ", 1)[1])
+            if message.startswith("VERSION_CONFLICT"):
+                await self._record_conflict()
+                raise VersionConflictError(order_id, expected_version, int(message.split(" ", 1)[1]))
+            raise
+
+        return PizzaOrder(**json.loads(payload))
+
+    async def load_scripts(self):
+        """Preload the Lua scripts so the first EVALSHA does not miss"""
+        await self.redis.client.script_load(self._transition_script()[0])
+
+    def _transition_script(self) -> tuple:
+        """Transition script and its SHA for the configured storage mode"""
+        if self.storage_mode == STORAGE_HASH:
+            return TRANSITION_HASH_SCRIPT, TRANSITION_HASH_SCRIPT_SHA
+        return TRANSITION_SCRIPT, TRANSITION_SCRIPT_SHA
@@ -0,0 +1,385 @@
+"""
+Server-side Lua scripts for order writes, the state read model and locks
+
+Scripts are preloaded with SCRIPT LOAD at startup and invoked by SHA with
+EVALSHA (see run_script). They run atomically inside Redis, so a whole
+read-validate-write-publish cycle costs one round trip and cannot
+interleave with another writer.
+
+The transition and state view scripts derive per-status and per-driver
+index keys from prefixes passed in ARGV, because those keys depend on the
+stored document. They therefore touch keys not declared in KEYS, which
+only works on a single Redis shard (a standalone server, or a primary with
+replicas/Sentinel). Redis Cluster is not supported.
+"""
+
+from redis.exceptions import NoScriptError
+import hashlib
+
+
+async def run_script(client, script: str, sha: str, keys: list, args: list):
+    """EVALSHA a script, loading it first if the server does not have it cached"""
+    try:
+        return await client.evalsha(sha, len(keys), *keys, *args)
+    except NoScriptError:
+        await client.script_load(script)
+        return await client.evalsha(sha, len(keys), *keys, *args)
+
+
+# Applies a state transition to a stored order.
+#
+# KEYS[1]  order document
+# KEYS[2]  created_at index (source of the score for the other indexes)
+# KEYS[3]  completed index
+# KEYS[4]  event stream
+# KEYS[5]  active driver registry
+#
+# ARGV[1]  order ID
+# ARGV[2]  JSON array of statuses the order must currently be in ([] = any)
+# ARGV[3]  JSON object of field changes
+# ARGV[4]  event type
+# ARGV[5]  timestamp (ISO 8601), used for updated_at and the event
+# ARGV[6]  timestamp as a sorted-set score
+# ARGV[7]  pub/sub channel
+# ARGV[8]  status index key prefix
+# ARGV[9]  driver index key prefix
+# ARGV[10] "1" to derive customer_price from supplier_price and markup
+# ARGV[11] expected current version ("" = do not check)
+#
+# Status and driver index keys depend on the stored document, so they are
+# built from the prefixes inside the script (single shard only, see above).
+#
+# Every successful transition increments the order's version.
+#
+# Returns the updated order document (as JSON in both storage modes), or an
+# error reply of NOT_FOUND, VERSION_CONFLICT <current version> or
+# INVALID_STATUS <current status>.
+#
+# The script is assembled from a load step and a store step that depend on
+# the storage mode (see services/order_storage.py) around a shared body.
+
+# Keeps the active driver registry (a hash of driver name -> JSON object of
+# that driver's orders in an active delivery status, each with its status
+# and last update time) current for one order. Empty driver names, nil and
+# cjson.null all mean "no driver".
+_DRIVER_REGISTRY = """
+local function has_driver(name)
+    return type(name) == 'string' and name ~= ''
+end
+
+local function update_driver_registry(key, id, status, driver, previous_driver, updated_at)
+    if has_driver(previous_driver) and previous_driver ~= driver then
+        local raw = redis.call('HGET', key, previous_driver)
+        if raw then
+            local orders = cjson.decode(raw)
+            orders[id] = nil
+            if next(orders) == nil then
+                redis.call('HDEL', key, previous_driver)
+            else
+                redis.call('HSET', key, previous_driver, cjson.encode(orders))
+            end
+        end
+    end
+    if has_driver(driver) then
+        local raw = redis.call('HGET', key, driver)
+        local orders = raw and cjson.decode(raw) or {}
+        if status == 'dispatched' or status == 'in_transit' then
+            orders[id] = {status = status, assigned_at = updated_at}
+        else
+            orders[id] = nil
+        end
+        if next(orders) == nil then
+            redis.call('HDEL', key, driver)
+        else
+            redis.call('HSET', key, driver, cjson.encode(orders))
+        end
+    end
+end
+"""
+
+_LOAD_JSON = """
+local raw = redis.call('GET', KEYS[1])
+if not raw then
+    return redis.error_reply('NOT_FOUND')
+end
+local order = cjson.decode(raw)
+"""
+
+_LOAD_HASH = """
+local fields = redis.call('HGETALL', KEYS[1])
+if #fields == 0 then
+    return redis.error_reply('NOT_FOUND')
+end
+local order = {}
+for i = 1, #fields, 2 do
+    order[fields[i]] = cjson.decode(fields[i + 1])
+end
+"""
+
+_APPLY = """
+local id = ARGV[1]
+local previous_status = order['status']
+local previous_driver = order['driver_name']
+local version = tonumber(order['version']) or 0
+
+if ARGV[11] ~= '' and tonumber(ARGV[11]) ~= version then
+    return redis.error_reply('VERSION_CONFLICT ' .. version)
+end
+
+local allowed = cjson.decode(ARGV[2])
+if #allowed > 0 then
+    local permitted = false
+    for _, status in ipairs(allowed) do
+        if status == previous_status then
+            permitted = true
+        end
+    end
+    if not permitted then
+        return redis.error_reply('INVALID_STATUS ' .. tostring(previous_status))
+    end
+end
+
+local changed = {}
+for field, value in pairs(cjson.decode(ARGV[3])) do
+    order[field] = value
+    table.insert(changed, field)
+end
+if ARGV[10] == '1' then
+    local price = order['supplier_price'] * (1 + order['markup_percentage'] / 100)
+    order['customer_price'] = tonumber(string.format('%.2f', price))
+    table.insert(changed, 'customer_price')
+end
+order['updated_at'] = ARGV[5]
+order['version'] = version + 1
+table.insert(changed, 'updated_at')
+table.insert(changed, 'version')
+
+local payload = cjson.encode(order)
+"""
+
+_STORE_JSON = """
+redis.call('SET', KEYS[1], payload)
+"""
+
+# Only the changed fields are rewritten
+_STORE_HASH = """
+local updates = {}
+for _, field in ipairs(changed) do
+    table.insert(updates, field)
+    table.insert(updates, cjson.encode(order[field]))
+end
+redis.call('HSET', KEYS[1], unpack(updates))
+"""
+
+_INDEX_AND_PUBLISH = """
+local score = redis.call('ZSCORE', KEYS[2], id) or 0
+local status = order['status']
+if status ~= previous_status then
+    redis.call('ZREM', ARGV[8] .. previous_status, id)
+    redis.call('ZADD', ARGV[8] .. status, score, id)
+    if status == 'delivered' then
+        redis.call('ZADD', KEYS[3], 'NX', ARGV[6], id)
+    elseif previous_status == 'delivered' then
+        redis.call('ZREM', KEYS[3], id)
+    end
+end
+
+local driver = order['driver_name']
+if driver ~= previous_driver then
+    if type(previous_driver) == 'string' then
+        redis.call('ZREM', ARGV[9] .. previous_driver, id)
+    end
+    if type(driver) == 'string' then
+        redis.call('ZADD', ARGV[9] .. driver, score, id)
+    end
+end
+if driver ~= previous_driver or status ~= previous_status then
+    update_driver_registry(KEYS[5], id, status, driver, previous_driver, ARGV[5])
+end
+
+local event = cjson.encode({
+    event_type = ARGV[4],
+    order = order,
+    timestamp = ARGV[5],
+    correlation_id = cjson.null
+})
+redis.call('XADD', KEYS[4], '*',
+    'event_type', ARGV[4],
+    'order_id', id,
+    'timestamp', ARGV[5],
+    'codec', 'json',
+    'codec_version', '1',
+    'data', event)
+redis.call('PUBLISH', ARGV[7], event)
+
+return payload
+"""
+
+TRANSITION_SCRIPT = _DRIVER_REGISTRY + _LOAD_JSON + _APPLY + _STORE_JSON + _INDEX_AND_PUBLISH
+TRANSITION_HASH_SCRIPT = _DRIVER_REGISTRY + _LOAD_HASH + _APPLY + _STORE_HASH + _INDEX_AND_PUBLISH
+
+TRANSITION_SCRIPT_SHA = hashlib.sha1(TRANSITION_SCRIPT.encode()).hexdigest()
+TRANSITION_HASH_SCRIPT_SHA = hashlib.sha1(TRANSITION_HASH_SCRIPT.encode()).hexdigest()
+
+# Applies an order event to the state read model (see StateView).
+#
+# KEYS[1]  hash: order ID -> {"status", "version", "driver"} last applied
+# KEYS[2]  hash: status -> number of orders
+# KEYS[3]  hash: driver name -> that driver's active orders (same layout as
+#          the active driver registry, see _DRIVER_REGISTRY)
+# KEYS[4]  counter of orders delivered on the event's day
+#
+# ARGV[1]  order ID
+# ARGV[2]  status
+# ARGV[3]  order version
+# ARGV[4]  created_at as a sorted-set score
+# ARGV[5]  driver name ("" = none)
+# ARGV[6]  updated_at (ISO 8601)
+# ARGV[7]  per-status membership key prefix
+# ARGV[8]  TTL of the delivered-per-day counter, in seconds
+#
+# Events at or below the last applied version of the order are ignored,
+# which makes redelivered and out-of-order events harmless. Events of
+# orders without a version (stored before versions existed) always apply.
+#
+# Returns 1 if the event was applied, 0 if it was ignored.
+_STATE_VIEW = _DRIVER_REGISTRY + """
+local function apply_state_view()
+    local id = ARGV[1]
+    local status = ARGV[2]
+    local version = tonumber(ARGV[3])
+
+    local previous_status = nil
+    local previous_driver = ''
+    local stored = redis.call('HGET', KEYS[1], id)
+    if stored then
+        local previous = cjson.decode(stored)
+        if version > 0 and tonumber(previous['version']) >= version then
+            return 0
+        end
+        previous_status = previous['status']
+        previous_driver = previous['driver'] or ''
+    end
+    redis.call('HSET', KEYS[1], id, cjson.encode({status = status, version = version, driver = ARGV[5]}))
+
+    if status ~= previous_status then
+        if previous_status then
+            redis.call('HINCRBY', KEYS[2], previous_status, -1)
+            redis.call('ZREM', ARGV[7] .. previous_status, id)
+        end
+        redis.call('HINCRBY', KEYS[2], status, 1)
+        redis.call('ZADD', ARGV[7] .. status, ARGV[4], id)
+        if status == 'delivered' then
+            redis.call('INCR', KEYS[4])
+            redis.call('EXPIRE', KEYS[4], ARGV[8])
+        end
+    end
+
+    update_driver_registry(KEYS[3], id, status, ARGV[5], previous_driver, ARGV[6])
+    return 1
+end
+"""
+
+STATE_VIEW_SCRIPT = _STATE_VIEW + """
+return apply_state_view()
+"""
+
+STATE_VIEW_SCRIPT_SHA = hashlib.sha1(STATE_VIEW_SCRIPT.encode()).hexdigest()
+
+# Same as STATE_VIEW_SCRIPT, and if the event was applied also advances the
+# cache generation and announces it (as BUMP_GENERATION_SCRIPT does), so
+# applying an event and invalidating cached state cost one call.
+#
+# KEYS[5]  generation counter
+# ARGV[9]  invalidation channel
+STATE_VIEW_INVALIDATE_SCRIPT = _STATE_VIEW + """
+if apply_state_view() == 0 then
+    return 0
+end
+local generation = redis.call('INCR', KEYS[5])
+redis.call('PUBLISH', ARGV[9], cjson.encode({generation = generation, order_id = ARGV[1]}))
+return 1
+"""
+
+STATE_VIEW_INVALIDATE_SCRIPT_SHA = hashlib.sha1(STATE_VIEW_INVALIDATE_SCRIPT.encode()).hexdigest()
+
+# Releases a lock taken with SET NX, but only if it is still held by the
+# caller (it may have expired and been taken by someone else meanwhile).
+#
+# KEYS[1]  lock key
+# ARGV[1]  token the lock was taken with
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+RELEASE_LOCK_SCRIPT_SHA = hashlib.sha1(RELEASE_LOCK_SCRIPT.encode()).hexdigest()
+
+# Extends a lock taken with SET NX, but only if it is still held by the
+# caller.
+#
+# KEYS[1]  lock key
+# ARGV[1]  token the lock was taken with
+# ARGV[2]  new expiry in milliseconds
+EXTEND_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+EXTEND_LOCK_SCRIPT_SHA = hashlib.sha1(EXTEND_LOCK_SCRIPT.encode()).hexdigest()
+
+# Updates the active driver registry for an order saved outside a transition
+# (see stage_index_update).
+#
+# KEYS[1]  active driver registry
+# ARGV[1]  order ID
+# ARGV[2]  order status
+# ARGV[3]  assigned driver ("" = none)
+# ARGV[4]  previously assigned driver ("" = none)
+# ARGV[5]  updated_at (ISO 8601)
+DRIVER_REGISTRY_SCRIPT = _DRIVER_REGISTRY + """
+update_driver_registry(KEYS[1], ARGV[1], ARGV[2], ARGV[3], ARGV[4], ARGV[5])
+return 1
+"""
+
+DRIVER_REGISTRY_SCRIPT_SHA = hashlib.sha1(DRIVER_REGISTRY_SCRIPT.encode()).hexdigest()
+
+# Reserves a block of numbers from a sequence counter, skipping a range of
+# numbers that were handed out by other means: a block overlapping the
+# range is dropped and the counter moves past the range.
+#
+# KEYS[1]  counter
+# ARGV[1]  block size
+# ARGV[2]  first number of the skipped range (0 = no range)
+# ARGV[3]  last number of the skipped range
+#
+# Returns the last number of the reserved block.
+SEQUENCE_BLOCK_SCRIPT = """
+local size = tonumber(ARGV[1])
+local last = redis.call('INCRBY', KEYS[1], size)
+if tonumber(ARGV[2]) > 0 and last >= tonumber(ARGV[2]) and last - size < tonumber(ARGV[3]) then
+    redis.call('SET', KEYS[1], ARGV[3])
+    last = redis.call('INCRBY', KEYS[1], size)
+end
+return last
+"""
+
+SEQUENCE_BLOCK_SCRIPT_SHA = hashlib.sha1(SEQUENCE_BLOCK_SCRIPT.encode()).hexdigest()
+
+# Advances the cache generation and announces it to every API worker in the
+# same round trip.
+#
+# KEYS[1]  generation counter
+# ARGV[1]  invalidation channel
+# ARGV[2]  ID of the order that changed
+BUMP_GENERATION_SCRIPT = """
+local generation = redis.call('INCR', KEYS[1])
+redis.call('PUBLISH', ARGV[1], cjson.encode({generation = generation, order_id = ARGV[2]}))
+return generation
+"""
+
+BUMP_GENERATION_SCRIPT_SHA = hashlib.sha1(BUMP_GENERATION_SCRIPT.encode()).hexdigest()
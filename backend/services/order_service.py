@@ -1,24 +1,53 @@
 from models import PizzaOrder, OrderStatus, OrderEvent, EventBatch, BatchResult
+from services.order_index import (
+    status_index_key,
+    supplier_index_key,
+    driver_index_key,
+    CREATED_INDEX_KEY,
+    TRACKING_INDEX_KEY,
+)
+from services.order_repository import OrderRepository, InvalidTransitionError, VersionConflictError
+from services.codec import get_codec
+from services.sequence_allocator import (
+    SequenceAllocator,
+    TRACKING_SEQUENCE_PREFIX,
+    SUPPLIER_SEQUENCE_PREFIX,
+    LEGACY_TRACKING_RANGE,
+    LEGACY_SUPPLIER_RANGE,
+)
+from config import settings
+from typing import Callable, Optional
 from datetime import datetime
 import uuid
 import json
-import random
-import string
+import logging
+
+logger = logging.getLogger(__name__)
+
+EVENT_CHANNEL = "pizza_orders"
+EVENT_STREAM = "pizza_orders_stream"
+# Consumer group applying the events to the read model (see stream_consumer)
+EVENT_GROUP = "event_processors"
 
 class OrderService:
     def __init__(self, redis_client):
         self.redis = redis_client
+        self.orders = OrderRepository(redis_client)
+        self.codec = get_codec()
+        self.sequences = SequenceAllocator(redis_client)
     
     async def create_order(self, order: PizzaOrder) -> OrderEvent:
-        print(f"📝 Creating order: {order.pizza_name} from {order.supplier_name}")
+        logger.debug("Creating order: %s from %s", order.pizza_name, order.supplier_name)
         order.id = str(uuid.uuid4())
         order.created_at = datetime.utcnow()
         order.updated_at = order.created_at
         order.status = OrderStatus.PENDING_SUPPLIER
         
-        # Generate human-readable tracking IDs
-        order.tracking_id = self._generate_tracking_id()
-        order.supplier_tracking_id = self._generate_supplier_tracking_id(order.supplier_name)
+        # Generate human-readable tracking IDs. The sequences skip the range
+        # of the old random IDs, so no lookup is needed to avoid them; the
+        # tracking index entries are added (NX) in the save transaction.
+        order.tracking_id = await self._generate_tracking_id()
+        order.supplier_tracking_id = await self._generate_supplier_tracking_id(order.supplier_name)
         
         await self._save_order(order)
         
@@ -28,174 +57,286 @@ class OrderService:
             timestamp=datetime.utcnow()
         )
         await self._publish_event(event)
-        print(f"✅ Order created and published: {order.id}")
-        print(f"   📦 Tracking ID: {order.tracking_id}")
-        print(f"   🏪 Supplier Tracking ID: {order.supplier_tracking_id}")
+        logger.info(
+            "Order created: %s (tracking ID %s, supplier tracking ID %s)",
+            order.id, order.tracking_id, order.supplier_tracking_id
+        )
         return event
     
-    async def supplier_respond(self, order_id: str, accept: bool, notes: str = None, estimated_time: int = None) -> OrderEvent:
-        order = await self._get_order(order_id)
-        
+    async def supplier_respond(self, order_id: str, accept: bool, notes: str = None, estimated_time: int = None,
+                               expected_version: int = None) -> OrderEvent:
         if accept:
-            order.status = OrderStatus.SUPPLIER_ACCEPTED
-            order.supplier_notes = notes
-            order.estimated_delivery_time = estimated_time or 30
+            changes = {
+                "status": OrderStatus.SUPPLIER_ACCEPTED.value,
+                "supplier_notes": notes,
+                "estimated_delivery_time": estimated_time or 30
+            }
             event_type = "order.supplier_accepted"
         else:
-            order.status = OrderStatus.SUPPLIER_REJECTED
-            order.supplier_notes = notes or "Supplier declined"
+            changes = {
+                "status": OrderStatus.SUPPLIER_REJECTED.value,
+                "supplier_notes": notes or "Supplier declined"
+            }
             event_type = "order.supplier_rejected"
         
-        order.updated_at = datetime.utcnow()
-        await self._save_order(order)
-        
-        event = OrderEvent(
-            event_type=event_type,
-            order=order,
-            timestamp=datetime.utcnow()
-        )
-        await self._publish_event(event)
-        return event
+        return await self._transition(order_id, event_type, changes, expected_version=expected_version)
     
-    async def customer_accept(self, order_id: str, customer_name: str, delivery_address: str) -> OrderEvent:
-        order = await self._get_order(order_id)
+    async def customer_accept(self, order_id: str, customer_name: str, delivery_address: str,
+                              expected_version: int = None) -> OrderEvent:
+        changes = {
+            "customer_name": customer_name,
+            "delivery_address": delivery_address,
+            "status": OrderStatus.CUSTOMER_ACCEPTED.value
+        }
         
-        if order.status != OrderStatus.SUPPLIER_ACCEPTED:
+        try:
+            # customer_price is derived from the stored supplier price and markup
+            return await self._transition(
+                order_id,
+                "order.customer_accepted",
+                changes,
+                allowed_from=[OrderStatus.SUPPLIER_ACCEPTED],
+                price_from_markup=True,
+                expected_version=expected_version
+            )
+        except InvalidTransitionError:
             raise ValueError("Order must be accepted by supplier first")
-        
-        order.customer_price = round(order.supplier_price * (1 + order.markup_percentage / 100), 2)
-        order.customer_name = customer_name
-        order.delivery_address = delivery_address
-        order.status = OrderStatus.CUSTOMER_ACCEPTED
-        order.updated_at = datetime.utcnow()
-        
-        await self._save_order(order)
-        
-        event = OrderEvent(
-            event_type="order.customer_accepted",
-            order=order,
-            timestamp=datetime.utcnow()
+    
+    async def dispatch_order(self, order_id: str, driver_name: str, expected_version: int = None) -> OrderEvent:
+        changes = {
+            "driver_name": driver_name,
+            "status": OrderStatus.DISPATCHED.value
+        }
+        return await self._transition(order_id, "order.dispatched", changes, expected_version=expected_version)
+    
+    async def update_status(self, order_id: str, status: OrderStatus, expected_version: int = None,
+                            timestamp: datetime = None) -> OrderEvent:
+        return await self._transition(
+            order_id, f"order.{status.value}", {"status": status.value},
+            expected_version=expected_version, timestamp=timestamp
         )
-        await self._publish_event(event)
-        return event
     
-    async def dispatch_order(self, order_id: str, driver_name: str) -> OrderEvent:
-        order = await self._get_order(order_id)
+    async def update_order(self, order_id: str, mutate: Callable[[PizzaOrder], None]) -> PizzaOrder:
+        """
+        Apply an arbitrary change to an order with optimistic concurrency
         
-        order.driver_name = driver_name
-        order.status = OrderStatus.DISPATCHED
-        order.updated_at = datetime.utcnow()
+        The order is read, passed to `mutate` to be modified in place, and
+        written back with a compare-and-set on its version. If another
+        writer got there first, the whole read-modify-write is retried up
+        to ORDER_CAS_MAX_RETRIES times.
         
-        await self._save_order(order)
+        No event is published and nothing is appended to the stream, so the
+        change is not seen by the StateView, the state cache generations or
+        /api/state/changes until the order's next transition. Anything that
+        clients should observe has to go through a transition instead.
         
-        event = OrderEvent(
-            event_type="order.dispatched",
-            order=order,
-            timestamp=datetime.utcnow()
-        )
-        await self._publish_event(event)
-        return event
+        Args:
+            order_id: The order to update
+            mutate: Function that modifies the order in place
+            
+        Returns:
+            The order as stored
+            
+        Raises:
+            ValueError: If the order does not exist
+            VersionConflictError: If every attempt lost the race
+        """
+        for attempt in range(settings.order_cas_max_retries + 1):
+            order = await self._get_order(order_id)
+            previous = order.model_copy()
+            order.updated_at = datetime.utcnow()
+            mutate(order)
+            try:
+                await self._save_order(order, previous)
+                return order
+            except VersionConflictError:
+                if attempt == settings.order_cas_max_retries:
+                    raise
+                logger.info("Version conflict on order %s, retrying (attempt %d)", order_id, attempt + 1)
     
-    async def update_status(self, order_id: str, status: OrderStatus) -> OrderEvent:
-        order = await self._get_order(order_id)
-        order.status = status
-        order.updated_at = datetime.utcnow()
+    async def _transition(self, order_id: str, event_type: str, changes: dict,
+                          timestamp: datetime = None, **options) -> OrderEvent:
+        """
+        Apply a transition and publish its event in a single server-side call
         
-        await self._save_order(order)
+        Validation, the document write, index updates, the stream append and
+        the pub/sub publish all happen atomically in OrderRepository.transition,
+        so concurrent transitions on the same order cannot overwrite each other.
+        Callers acting on a version they have seen pass expected_version to
+        turn a stale decision into a VersionConflictError. The transition
+        time defaults to now; backfills pass an earlier one.
+        """
+        timestamp = timestamp or datetime.utcnow()
+        order = await self.orders.transition(
+            order_id,
+            changes,
+            event_type=event_type,
+            stream_name=EVENT_STREAM,
+            channel=EVENT_CHANNEL,
+            timestamp=timestamp,
+            **options
+        )
+        logger.debug("Event published to stream: %s for order %s", event_type, order_id)
         
-        event = OrderEvent(
-            event_type=f"order.{status.value}",
+        return OrderEvent(
+            event_type=event_type,
             order=order,
-            timestamp=datetime.utcnow()
+            timestamp=timestamp
         )
-        await self._publish_event(event)
-        return event
+    
+    async def latest_event_id(self) -> str:
+        """
+        Get the ID of the newest event in the stream
+        
+        Every transition appends to the stream atomically with its write,
+        so the ID changes whenever an order does. Used as a version token.
+        """
+        entries = await self.redis.client.xrevrange(EVENT_STREAM, "+", "-", count=1)
+        return entries[0][0] if entries else "0-0"
     
     async def get_all_orders(self):
-        keys = await self.redis.client.keys("order:*")
+        return await self.orders.get_all()
+    
+    async def list_orders(self, cursor: str = None, limit: int = 50, status: OrderStatus = None,
+                          supplier_name: str = None, driver_name: str = None) -> tuple[list[dict], Optional[str]]:
+        """
+        Get one page of orders, newest first
+        
+        The most selective index among the filters drives the scan (status,
+        then driver, then supplier, then all orders); any remaining filters
+        are applied to the fetched page. Each round trip reads one window
+        of the index with ZREVRANGEBYSCORE and the documents with one MGET.
+        
+        Args:
+            cursor: Opaque cursor returned by the previous page (None for the first page)
+            limit: Maximum number of orders to return
+            status: Only return orders in this status
+            supplier_name: Only return orders from this supplier
+            driver_name: Only return orders assigned to this driver
+            
+        Returns:
+            Tuple of (orders, next_cursor). next_cursor is None when there
+            are no more orders.
+        """
+        filters = {}
+        if status:
+            index_key = status_index_key(status)
+        elif driver_name:
+            index_key = driver_index_key(driver_name)
+        else:
+            index_key = supplier_index_key(supplier_name) if supplier_name else CREATED_INDEX_KEY
+        if supplier_name and index_key != supplier_index_key(supplier_name):
+            filters['supplier_name'] = supplier_name
+        if driver_name and index_key != driver_index_key(driver_name):
+            filters['driver_name'] = driver_name
+        
+        # The cursor is the score of the last scanned entry plus how many
+        # entries with that same score were already scanned (ties on created_at)
+        max_score, skip = "+inf", 0
+        if cursor:
+            try:
+                score, skip = cursor.split(":")
+                max_score, skip = float(score), int(skip)
+            except ValueError:
+                raise ValueError(f"Invalid cursor: {cursor}")
+        
         orders = []
-        for key in keys:
-            order_data = await self.redis.client.get(key)
-            if order_data:
-                orders.append(json.loads(order_data))
-        return sorted(orders, key=lambda x: x['created_at'], reverse=True)
+        scanned = 0
+        max_scanned = limit * 10  # bounds the work when post-filters are selective
+        while len(orders) < limit and scanned < max_scanned:
+            entries = await self.redis.client.zrevrangebyscore(
+                index_key, max_score, "-inf", start=skip, num=limit, withscores=True
+            )
+            if not entries:
+                return orders, None
+            
+            window = await self.orders.get_many([order_id for order_id, _ in entries])
+            for order_id, score in entries:
+                scanned += 1
+                if score == max_score:
+                    skip += 1
+                else:
+                    max_score, skip = score, 1
+                
+                order = window.get(order_id)
+                if order and all(order.get(field) == expected for field, expected in filters.items()):
+                    orders.append(order)
+                    if len(orders) == limit:
+                        break
+            
+            if len(entries) < limit and len(orders) < limit:
+                # Short window and page not full: the index is exhausted
+                return orders, None
+        
+        return orders, f"{max_score!r}:{skip}"
     
     async def get_order_by_tracking_id(self, tracking_id: str):
-        """Find an order by its tracking ID"""
-        all_orders = await self.get_all_orders()
-        for order in all_orders:
-            if order.get('tracking_id') == tracking_id or order.get('supplier_tracking_id') == tracking_id:
-                return order
-        return None
+        """Find an order by its tracking ID or supplier tracking ID"""
+        order_id = await self.redis.client.hget(TRACKING_INDEX_KEY, tracking_id)
+        if not order_id:
+            return None
+        return await self.orders.get(order_id)
     
-    async def _save_order(self, order: PizzaOrder):
-        order_dict = order.model_dump(mode='json')
-        key = f"order:{order.id}"
-        await self.redis.client.set(
-            key,
-            json.dumps(order_dict, default=str)
-        )
-        print(f"✅ Order saved to Redis: {key}")
-        
-        # Verify it was saved
-        saved = await self.redis.client.get(key)
-        if saved:
-            print(f"✅ Verified order in Redis: {order.id}")
-        else:
-            print(f"❌ Failed to verify order in Redis: {order.id}")
+    async def _save_order(self, order: PizzaOrder, previous: PizzaOrder = None):
+        await self.orders.save(order, previous)
+        logger.debug("Order saved to Redis: %s", order.id)
     
     async def _get_order(self, order_id: str) -> PizzaOrder:
-        order_data = await self.redis.client.get(f"order:{order_id}")
+        order_data = await self.orders.get(order_id)
         if not order_data:
             raise ValueError(f"Order {order_id} not found")
-        return PizzaOrder(**json.loads(order_data))
+        return PizzaOrder(**order_data)
     
     async def _publish_event(self, event: OrderEvent):
-        event_data = event.model_dump(mode='json')
+        # Serialize once; JSON-compatible codecs share the payload with pub/sub
+        payload = self.codec.dump_model(event)
+        message = payload if self.codec.json_compatible else event.model_dump_json()
         
         # Publish to Redis pub/sub for backward compatibility
-        await self.redis.publish(
-            "pizza_orders",
-            json.dumps(event_data, default=str)
-        )
+        await self.redis.publish(EVENT_CHANNEL, message)
         
         # Add to Redis Stream for persistence and advanced features
         stream_data = {
             "event_type": event.event_type,
             "order_id": event.order.id,
             "timestamp": event.timestamp.isoformat(),
-            "data": json.dumps(event_data, default=str)
+            **self.codec.stream_header(),
+            "data": payload
         }
         
         if event.correlation_id:
             stream_data["correlation_id"] = event.correlation_id
         
-        await self.redis.add_to_stream("pizza_orders_stream", stream_data)
-        print(f"✅ Event published to stream: {event.event_type} for order {event.order.id}")
+        await self.redis.add_to_stream(EVENT_STREAM, stream_data)
+        logger.debug("Event published to stream: %s for order %s", event.event_type, event.order.id)
     
-    def _generate_tracking_id(self) -> str:
+    async def _generate_tracking_id(self) -> str:
         """
         Generate a human-readable tracking ID
         Format: PIZZA-YYYY-NNNNNN (e.g., PIZZA-2024-001234)
+        
+        Numbers come from a per-year counter that skips the range of the
+        old random IDs (and widens to seven digits past it).
         """
         year = datetime.utcnow().year
-        # Generate 6-digit random number
-        number = random.randint(100000, 999999)
-        return f"PIZZA-{year}-{number}"
+        number = await self.sequences.next(f"{TRACKING_SEQUENCE_PREFIX}{year}", LEGACY_TRACKING_RANGE)
+        return f"PIZZA-{year}-{number:06d}"
     
-    def _generate_supplier_tracking_id(self, supplier_name: str) -> str:
+    async def _generate_supplier_tracking_id(self, supplier_name: str) -> str:
         """
         Generate a supplier-specific tracking ID
-        Format: SUPPLIER_PREFIX-NNNN (e.g., PP-1234 for Pizza Palace)
+        Format: SUPPLIER_PREFIX-NNNN (e.g., PP-0234 for Pizza Palace)
+        
+        Numbers come from a counter per prefix, so suppliers sharing
+        initials never collide either. The range of the old random IDs is
+        skipped (numbers widen to five digits past it).
         """
         # Create prefix from supplier name (first letters of each word)
         words = supplier_name.upper().split()
         prefix = ''.join(word[0] for word in words[:3])  # Max 3 letters
         
-        # Generate 4-digit number
-        number = random.randint(1000, 9999)
-        
-        return f"{prefix}-{number}"
+        number = await self.sequences.next(f"{SUPPLIER_SEQUENCE_PREFIX}{prefix}", LEGACY_SUPPLIER_RANGE)
+        return f"{prefix}-{number:04d}"
     
     def _generate_correlation_id(self) -> str:
         """Generate a unique correlation ID for event batching"""
@@ -232,21 +373,22 @@ class OrderService:
                     # Add correlation ID to each event
                     event_data['correlation_id'] = correlation_id
                     
+                    payload = self.codec.dumps(event_data)
+                    message = payload if self.codec.json_compatible else json.dumps(event_data, default=str)
+                    
                     # Publish to Redis pub/sub for backward compatibility
-                    await self.redis.publish(
-                        "pizza_orders",
-                        json.dumps(event_data, default=str)
-                    )
+                    await self.redis.publish(EVENT_CHANNEL, message)
                     
                     # Add to Redis Stream for persistence
                     stream_data = {
                         "event_type": event_data.get("event_type", "batch_event"),
                         "correlation_id": correlation_id,
                         "timestamp": datetime.utcnow().isoformat(),
-                        "data": json.dumps(event_data, default=str)
+                        **self.codec.stream_header(),
+                        "data": payload
                     }
                     
-                    await self.redis.add_to_stream("pizza_orders_stream", stream_data)
+                    await self.redis.add_to_stream(EVENT_STREAM, stream_data)
                     
                     processed_count += 1
                     
@@ -301,9 +443,9 @@ class OrderService:
         
         try:
             await self.redis.publish(
-                "pizza_orders",
+                EVENT_CHANNEL,
                 json.dumps(rollback_event, default=str)
             )
-            print(f"⚠️  Published rollback event for correlation_id: {correlation_id}")
+            logger.warning("Published rollback event for correlation_id: %s", correlation_id)
         except Exception as e:
-            print(f"❌ Failed to publish rollback event: {str(e)}")
+            logger.error("Failed to publish rollback event: %s", e)
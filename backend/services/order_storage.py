@@ -0,0 +1,73 @@
+"""
+Physical layouts of order documents in Redis
+
+Two layouts are supported, selected with ORDER_STORAGE_MODE:
+
+- "json": one JSON string per `order:{id}` key (GET/SET/MGET)
+- "hash": one Redis hash per `order:{id}` key with one field per order
+  attribute (HSET/HMGET). Each field value is JSON-encoded on its own so
+  that numbers and nulls round-trip exactly. Updates only rewrite the
+  fields that changed, and readers can fetch just the fields they need.
+
+OrderRepository hides the difference from the services. The helpers here
+are shared with the tools that operate on raw keys (index backfill and
+migrate_order_storage.py) and can read either layout, so they keep
+working while a database is half-way through a migration.
+"""
+
+from typing import Dict, List, Optional
+import json
+
+STORAGE_JSON = "json"
+STORAGE_HASH = "hash"
+STORAGE_MODES = (STORAGE_JSON, STORAGE_HASH)
+
+
+def encode_fields(document: dict) -> Dict[str, str]:
+    """Encode an order document as hash fields"""
+    return {field: json.dumps(value, default=str) for field, value in document.items()}
+
+
+def decode_fields(fields: Dict[str, Optional[str]]) -> dict:
+    """Decode hash fields back into an order document, skipping missing fields"""
+    return {field: json.loads(value) for field, value in fields.items() if value is not None}
+
+
+async def key_types(client, keys: List[str]) -> List[str]:
+    """Redis type of each key ("string", "hash" or "none"), in one round trip"""
+    async with client.pipeline(transaction=False) as pipe:
+        for key in keys:
+            pipe.type(key)
+        return await pipe.execute()
+
+
+async def read_documents(client, keys: List[str]) -> List[Optional[dict]]:
+    """
+    Read order documents stored in either layout
+
+    Args:
+        client: Raw redis.asyncio client
+        keys: Order keys to read
+
+    Returns:
+        One document per key, in the same order (None for missing keys)
+    """
+    if not keys:
+        return []
+
+    types = await key_types(client, keys)
+    async with client.pipeline(transaction=False) as pipe:
+        for key, key_type in zip(keys, types):
+            if key_type == "hash":
+                pipe.hgetall(key)
+            else:
+                pipe.get(key)
+        values = await pipe.execute()
+
+    documents = []
+    for value in values:
+        if isinstance(value, dict):
+            documents.append(decode_fields(value) if value else None)
+        else:
+            documents.append(json.loads(value) if value else None)
+    return documents
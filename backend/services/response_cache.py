@@ -0,0 +1,75 @@
+from collections import OrderedDict
+from typing import Optional, Tuple
+import time
+
+
+class ResponseCache:
+    """
+    In-process LRU cache of serialized responses
+
+    Sits in front of Redis (L1 in front of L2) and holds the exact bytes
+    sent to clients, so a hit costs neither a Redis round trip nor any
+    parsing, validation or re-serialization. Entries expire after `ttl`
+    seconds, and the least recently used entry is evicted once
+    `max_entries` is reached. Each API worker has its own instance, so the
+    TTL is kept short.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl  # seconds, 0 disables the cache
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Cached bytes for the key, or None on a miss"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: bytes):
+        """Store bytes under the key, evicting the least recently used entries"""
+        if self.ttl <= 0 or self.max_entries <= 0:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def discard(self, key: str):
+        """Drop the entry for the key, if any"""
+        self._entries.pop(key, None)
+
+    def clear(self):
+        """Drop every entry (counters are kept)"""
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        """Hit/miss/eviction counters and current size"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
@@ -0,0 +1,64 @@
+from config import settings
+from services.order_scripts import SEQUENCE_BLOCK_SCRIPT, SEQUENCE_BLOCK_SCRIPT_SHA, run_script
+from typing import Dict, List, Optional, Tuple
+import asyncio
+
+# Counter keys. Tracking numbers restart every year; supplier numbers are
+# per supplier prefix, since that is the part of the ID they must be
+# unique within.
+TRACKING_SEQUENCE_PREFIX = "counters:tracking:"
+SUPPLIER_SEQUENCE_PREFIX = "counters:supplier:"
+
+# Tracking IDs used to be random numbers in these ranges. The sequences
+# skip them, so they never re-issue an ID that may still be in use.
+LEGACY_TRACKING_RANGE = (100000, 999999)
+LEGACY_SUPPLIER_RANGE = (1000, 9999)
+
+
+class SequenceAllocator:
+    """
+    Hands out unique, increasing numbers from Redis counters
+
+    Instead of one INCR per number, each process reserves a block of
+    `block_size` numbers with a single INCRBY and serves them from memory.
+    Numbers are unique across all processes; the only cost of blocks is
+    that numbers left in a block when a process stops are never used, so
+    sequences can have gaps. A block overlapping the `skip` range of a
+    counter is dropped the same way.
+    """
+
+    def __init__(self, redis_client, block_size: Optional[int] = None):
+        self.redis = redis_client
+        self.block_size = block_size or settings.tracking_id_block_size
+        # counter key -> [next number, last number] of the reserved block
+        self._blocks: Dict[str, List[int]] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    async def next(self, key: str, skip: Optional[Tuple[int, int]] = None) -> int:
+        """
+        Get the next number of a counter
+
+        Args:
+            key: Redis key of the counter
+            skip: Inclusive range of numbers the counter never hands out
+
+        Returns:
+            A number never returned before for this key, by any process
+        """
+        block = self._blocks.get(key)
+        if block is None or block[0] > block[1]:
+            lock = self._locks.setdefault(key, asyncio.Lock())
+            async with lock:
+                # Another coroutine may have refilled the block while we waited
+                block = self._blocks.get(key)
+                if block is None or block[0] > block[1]:
+                    last = int(await run_script(
+                        self.redis.client, SEQUENCE_BLOCK_SCRIPT, SEQUENCE_BLOCK_SCRIPT_SHA,
+                        [key], [self.block_size, *(skip or (0, 0))]
+                    ))
+                    block = [last - self.block_size + 1, last]
+                    self._blocks[key] = block
+
+        number = block[0]
+        block[0] += 1
+        return number
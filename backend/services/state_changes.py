@@ -0,0 +1,127 @@
+from models import StateChanges
+from services.order_repository import OrderRepository
+from services.order_service import EVENT_STREAM, EVENT_GROUP
+from typing import Optional, Tuple
+import re
+
+STREAM_ID_PATTERN = re.compile(r"^\d+(-\d+)?$")
+
+
+def parse_stream_id(stream_id: str) -> Tuple[int, int]:
+    """
+    Split a stream entry ID into its (milliseconds, sequence) parts
+
+    Raises:
+        ValueError: If the ID is malformed
+    """
+    if not STREAM_ID_PATTERN.match(stream_id):
+        raise ValueError(f"Invalid stream ID: {stream_id}")
+    millis, _, sequence = stream_id.partition("-")
+    return int(millis), int(sequence or 0)
+
+
+def previous_stream_id(stream_id: str) -> str:
+    """The greatest stream ID lower than `stream_id`"""
+    millis, sequence = parse_stream_id(stream_id)
+    if sequence:
+        return f"{millis}-{sequence - 1}"
+    if millis:
+        return f"{millis - 1}-{2 ** 64 - 1}"
+    return "0-0"
+
+
+async def handled_mark(redis_client, stream_name: str = EVENT_STREAM, group_name: str = EVENT_GROUP) -> str:
+    """
+    Stream position up to which a consumer group has handled every entry
+
+    That is the entry before the oldest one still pending, or the last
+    entry delivered to the group when nothing is pending; "0-0" if the
+    group does not exist yet.
+    """
+    async with redis_client.client.pipeline(transaction=False) as pipe:
+        pipe.xinfo_groups(stream_name)
+        pipe.xpending(stream_name, group_name)
+        groups, pending = await pipe.execute(raise_on_error=False)
+    if isinstance(groups, Exception) or isinstance(pending, Exception):
+        return "0-0"
+    delivered = next((group["last-delivered-id"] for group in groups if group["name"] == group_name), "0-0")
+    if pending["pending"]:
+        return previous_stream_id(pending["min"])
+    return delivered
+
+
+class StateChangeFeed:
+    """
+    Incremental updates of the system state, read from the event stream
+
+    Clients remember the high-water mark of their last update (initially
+    the changes_mark field of their /api/state response) and ask only for the
+    stream entries after it, so the work per request grows with the
+    number of changes rather than with the number of orders. Each changed
+    order is returned once, in its current version; statistics and active
+    drivers are always included since they are small.
+
+    If the requested position has already been trimmed from the stream,
+    the response says so (`reset`) and the client reloads the full state.
+    """
+
+    def __init__(self, redis_client, state_service, stream_name: str = EVENT_STREAM):
+        self.redis = redis_client
+        self.state_service = state_service
+        self.stream_name = stream_name
+        self.orders = OrderRepository(redis_client)
+
+    async def get_changes(self, since: Optional[str] = None, limit: int = 500) -> StateChanges:
+        """
+        Get the orders changed after a stream entry
+
+        Args:
+            since: High-water mark returned by the previous call; omit to
+                get the current high-water mark only
+            limit: Maximum number of stream entries read
+
+        Returns:
+            StateChanges with the new high-water mark
+
+        Raises:
+            ValueError: If `since` is not a stream ID
+        """
+        if since is not None:
+            parse_stream_id(since)
+
+        async with self.redis.client.pipeline(transaction=False) as pipe:
+            pipe.xrange(self.stream_name, "-", "+", count=1)
+            pipe.xrevrange(self.stream_name, "+", "-", count=1)
+            if since is not None:
+                pipe.xrange(self.stream_name, min=f"({since}", max="+", count=limit)
+            results = await pipe.execute()
+
+        first, last = results[0], results[1]
+        latest_id = last[0][0] if last else "0-0"
+        # The entry right after `since` may have been trimmed away
+        trimmed = bool(first) and since is not None and parse_stream_id(since) < parse_stream_id(first[0][0])
+
+        if since is None or trimmed:
+            return StateChanges(
+                since=since,
+                high_water_mark=latest_id,
+                reset=True,
+                orders=[],
+                statistics=await self.state_service.get_statistics(),
+                active_drivers=await self.state_service.get_active_drivers()
+            )
+
+        entries = results[2]
+        order_ids = list(dict.fromkeys(
+            message_data["order_id"] for _, message_data in entries if message_data.get("order_id")
+        ))
+        orders = await self.orders.get_many(order_ids)
+
+        return StateChanges(
+            since=since,
+            high_water_mark=entries[-1][0] if entries else since,
+            has_more=len(entries) == limit,
+            orders=[orders[order_id] for order_id in order_ids if order_id in orders],
+            statistics=await self.state_service.get_statistics(),
+            active_drivers=await self.state_service.get_active_drivers()
+        )
@@ -1,18 +1,92 @@
 from models import SystemState, SystemStatistics, ActiveDriver, OrderStatus
+from services.order_repository import OrderRepository
+from services.codec import get_codec, ModelT
+from services.response_cache import ResponseCache
+from services.cache_invalidation import GENERATION_KEY, bump_generation, current_generation
+from services.order_scripts import RELEASE_LOCK_SCRIPT, RELEASE_LOCK_SCRIPT_SHA, run_script
+from services.order_service import EVENT_STREAM
+from services.order_index import (
+    status_index_key,
+    start_of_today_score,
+    COMPLETED_INDEX_KEY,
+    ACTIVE_DRIVERS_KEY,
+    ACTIVE_DELIVERY_STATUSES,
+    COMPLETED_STATUSES,
+)
 from datetime import datetime, timedelta
-from typing import Optional, Dict, List
+from typing import Awaitable, Callable, Optional, Dict, List, Tuple, Type
+from config import settings
+import asyncio
 import json
+import logging
+import math
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+def build_statistics(status_counts: Dict[str, int], completed_today: int) -> SystemStatistics:
+    """System statistics from the number of orders per status"""
+    return SystemStatistics(
+        total_orders=sum(status_counts.values()),
+        active_deliveries=sum(status_counts.get(status, 0) for status in ACTIVE_DELIVERY_STATUSES),
+        completed_today=completed_today,
+        pending_supplier=status_counts.get('pending_supplier', 0),
+        preparing=status_counts.get('preparing', 0),
+        ready=status_counts.get('ready', 0),
+        dispatched=status_counts.get('dispatched', 0),
+        in_transit=status_counts.get('in_transit', 0),
+        delivered=status_counts.get('delivered', 0)
+    )
+
+
+def group_by_status(ids_by_status: Dict[str, List[str]], orders: Dict[str, dict]) -> Dict[str, List[dict]]:
+    """Orders listed per status in index order, leaving out empty statuses and missing orders"""
+    orders_by_status = {}
+    for status, order_ids in ids_by_status.items():
+        status_orders = [orders[order_id] for order_id in order_ids if order_id in orders]
+        if status_orders:
+            orders_by_status[status] = status_orders
+    return orders_by_status
+
+
+def select_active_drivers(registry: Dict[str, str]) -> List[ActiveDriver]:
+    """
+    Active drivers from a driver registry (driver name -> JSON object of
+    the driver's active orders, each with its status and assigned_at)
+    """
+    active_drivers = []
+    for driver_name, assignments in registry.items():
+        # If driver has multiple orders, show the most recently updated
+        order_id, assignment = max(json.loads(assignments).items(), key=lambda item: item[1]['assigned_at'])
+        active_drivers.append(ActiveDriver(
+            driver_name=driver_name,
+            order_id=order_id,
+            status=assignment['status'],
+            assigned_at=datetime.fromisoformat(assignment['assigned_at'])
+        ))
+    return active_drivers
+
 
 class StateService:
     """Service for managing system state and statistics"""
     
     def __init__(self, redis_client):
         self.redis = redis_client
+        self.orders = OrderRepository(redis_client)
     
     async def get_system_state(self, include_completed: bool = True, limit: Optional[int] = None) -> SystemState:
         """
         Get complete system state
         
+        Statistics, grouped orders and active drivers are computed from one
+        shared snapshot: every index read (including the active driver
+        registry) goes out in a single pipeline, and the listed order
+        documents are fetched in one more round trip. The newest stream
+        entry is read at the head of that pipeline, so the state is at
+        least as new as its `changes_mark`.
+        
         Args:
             include_completed: Whether to include completed orders
             limit: Maximum number of orders per status to return
@@ -20,172 +94,173 @@ class StateService:
         Returns:
             SystemState object with all system information
         """
-        # Get statistics
-        statistics = await self.get_statistics()
+        statuses = [status.value for status in OrderStatus]
+        listed_statuses = self._listed_statuses(include_completed)
+        stop = limit - 1 if limit else -1
+        
+        async with self.redis.client.pipeline(transaction=False) as pipe:
+            pipe.xrevrange(EVENT_STREAM, "+", "-", count=1)
+            self._queue_statistics(pipe, statuses)
+            for status in listed_statuses:
+                pipe.zrevrange(status_index_key(status), 0, stop)
+            pipe.hgetall(ACTIVE_DRIVERS_KEY)
+            latest, *results = await pipe.execute()
         
-        # Get orders grouped by status
-        orders_by_status = await self.get_orders_by_status(include_completed, limit)
+        statistics = self._build_statistics(statuses, results[:len(statuses) + 1])
+        results = results[len(statuses) + 1:]
+        ids_by_status = dict(zip(listed_statuses, results[:len(listed_statuses)]))
         
-        # Get active drivers
-        active_drivers = await self.get_active_drivers()
+        orders = await self.orders.get_many([order_id for ids in ids_by_status.values() for order_id in ids])
         
         return SystemState(
             statistics=statistics,
-            orders_by_status=orders_by_status,
-            active_drivers=active_drivers,
-            last_updated=datetime.utcnow()
+            orders_by_status=group_by_status(ids_by_status, orders),
+            active_drivers=select_active_drivers(results[-1]),
+            last_updated=datetime.utcnow(),
+            changes_mark=latest[0][0] if latest else "0-0"
         )
     
     async def get_statistics(self) -> SystemStatistics:
         """
         Get system-wide statistics
         
+        Counts are read from the per-status indexes (ZCARD) in a single
+        pipelined round trip, so the cost does not depend on order volume.
+        
         Returns:
             SystemStatistics object with counts and metrics
         """
-        # Get all orders
-        keys = await self.redis.client.keys("order:*")
-        orders = []
-        
-        for key in keys:
-            order_data = await self.redis.client.get(key)
-            if order_data:
-                orders.append(json.loads(order_data))
-        
-        # Count orders by status
-        status_counts = {}
-        for status in OrderStatus:
-            status_counts[status.value] = 0
+        statuses = [status.value for status in OrderStatus]
         
-        today = datetime.utcnow().date()
-        completed_today = 0
-        active_deliveries = 0
-        
-        for order in orders:
-            status = order.get('status', 'unknown')
-            if status in status_counts:
-                status_counts[status] += 1
-            
-            # Count completed today
-            if status == 'delivered':
-                order_date = datetime.fromisoformat(order.get('updated_at', '1970-01-01')).date()
-                if order_date == today:
-                    completed_today += 1
-            
-            # Count active deliveries
-            if status in ['dispatched', 'in_transit']:
-                active_deliveries += 1
+        async with self.redis.client.pipeline(transaction=False) as pipe:
+            self._queue_statistics(pipe, statuses)
+            results = await pipe.execute()
         
-        return SystemStatistics(
-            total_orders=len(orders),
-            active_deliveries=active_deliveries,
-            completed_today=completed_today,
-            pending_supplier=status_counts.get('pending_supplier', 0),
-            preparing=status_counts.get('preparing', 0),
-            ready=status_counts.get('ready', 0),
-            dispatched=status_counts.get('dispatched', 0),
-            in_transit=status_counts.get('in_transit', 0),
-            delivered=status_counts.get('delivered', 0)
-        )
+        return self._build_statistics(statuses, results)
     
-    async def get_orders_by_status(self, include_completed: bool = True, limit: Optional[int] = None) -> Dict[str, List[dict]]:
+    async def get_orders_by_status(self, include_completed: bool = True, limit: Optional[int] = None,
+                                   offset: int = 0, status: Optional[OrderStatus] = None) -> Dict[str, List[dict]]:
         """
-        Get orders grouped by status
+        Get orders grouped by status, newest first
+        
+        Only the requested window of each status index is read, so paging
+        through a column costs the same wherever the page is.
         
         Args:
             include_completed: Whether to include delivered/cancelled orders
             limit: Maximum orders per status
+            offset: Number of newest orders to skip in each status
+            status: Only return this status
             
         Returns:
             Dictionary with status as key and list of orders as value
         """
-        # Get all orders
-        keys = await self.redis.client.keys("order:*")
-        orders = []
+        statuses = [OrderStatus(status).value] if status else self._listed_statuses(include_completed)
         
-        for key in keys:
-            order_data = await self.redis.client.get(key)
-            if order_data:
-                orders.append(json.loads(order_data))
+        # Status indexes are scored by created_at, so ZREVRANGE yields newest first
+        stop = offset + limit - 1 if limit else -1
+        async with self.redis.client.pipeline(transaction=False) as pipe:
+            for status in statuses:
+                pipe.zrevrange(status_index_key(status), offset, stop)
+            ids_by_status = dict(zip(statuses, await pipe.execute()))
         
-        # Group by status
-        orders_by_status = {}
-        
-        for order in orders:
-            status = order.get('status', 'unknown')
-            
-            # Skip completed orders if not requested
-            if not include_completed and status in ['delivered', 'cancelled']:
-                continue
-            
-            if status not in orders_by_status:
-                orders_by_status[status] = []
-            
-            orders_by_status[status].append(order)
-        
-        # Apply limit if specified
-        if limit:
-            for status in orders_by_status:
-                orders_by_status[status] = orders_by_status[status][:limit]
-        
-        # Sort orders within each status by created_at (newest first)
-        for status in orders_by_status:
-            orders_by_status[status].sort(
-                key=lambda x: x.get('created_at', '1970-01-01'),
-                reverse=True
-            )
-        
-        return orders_by_status
+        orders = await self.orders.get_many([order_id for ids in ids_by_status.values() for order_id in ids])
+        return group_by_status(ids_by_status, orders)
     
     async def get_active_drivers(self) -> List[ActiveDriver]:
         """
         Get list of active drivers and their assignments
         
+        Read from the active driver registry, which every transition keeps
+        current, in a single HGETALL.
+        
         Returns:
             List of ActiveDriver objects
         """
-        # Get all orders with drivers assigned
-        keys = await self.redis.client.keys("order:*")
-        active_drivers = {}
-        
-        for key in keys:
-            order_data = await self.redis.client.get(key)
-            if order_data:
-                order = json.loads(order_data)
-                driver_name = order.get('driver_name')
-                status = order.get('status')
-                
-                if driver_name and status in ['dispatched', 'in_transit']:
-                    if driver_name not in active_drivers:
-                        active_drivers[driver_name] = ActiveDriver(
-                            driver_name=driver_name,
-                            order_id=order.get('id'),
-                            status=status,
-                            assigned_at=datetime.fromisoformat(order.get('updated_at', '1970-01-01'))
-                        )
-                    else:
-                        # If driver has multiple orders, keep the most recent
-                        current_assigned = active_drivers[driver_name].assigned_at
-                        order_assigned = datetime.fromisoformat(order.get('updated_at', '1970-01-01'))
-                        if order_assigned > current_assigned:
-                            active_drivers[driver_name] = ActiveDriver(
-                                driver_name=driver_name,
-                                order_id=order.get('id'),
-                                status=status,
-                                assigned_at=order_assigned
-                            )
+        return select_active_drivers(await self.redis.client.hgetall(ACTIVE_DRIVERS_KEY))
+    
+    async def get_driver_load(self, driver_name: str) -> int:
+        """
+        Get the number of active deliveries assigned to a driver
         
-        return list(active_drivers.values())
+        Args:
+            driver_name: The driver
+            
+        Returns:
+            Number of the driver's orders that are dispatched or in transit
+        """
+        assignments = await self.redis.client.hget(ACTIVE_DRIVERS_KEY, driver_name)
+        return len(json.loads(assignments)) if assignments else 0
+    
+    def _listed_statuses(self, include_completed: bool) -> List[str]:
+        return [
+            status.value for status in OrderStatus
+            if include_completed or status.value not in COMPLETED_STATUSES
+        ]
+    
+    def _queue_statistics(self, pipe, statuses: List[str]):
+        """Queue the statistics reads: one ZCARD per status, then completed today"""
+        for status in statuses:
+            pipe.zcard(status_index_key(status))
+        pipe.zcount(COMPLETED_INDEX_KEY, start_of_today_score(), "+inf")
+    
+    def _build_statistics(self, statuses: List[str], results: list) -> SystemStatistics:
+        return build_statistics(dict(zip(statuses, results[:len(statuses)])), results[len(statuses)])
 
 
 class CachedStateService:
-    """Cached wrapper for StateService with 5-second TTL"""
+    """
+    Cached wrapper for StateService
+    
+    Cache misses are coalesced (single-flight): within a process, concurrent
+    requests for the same entry share one rebuild, and across workers a
+    short-lived Redis lock lets one worker rebuild while the others wait for
+    its result instead of rebuilding too.
+    
+    With stale-while-revalidate enabled (`max_stale` > `cache_ttl`), an
+    entry older than `cache_ttl` but younger than `max_stale` is served
+    immediately while a background task rebuilds it; only entries past
+    `max_stale` make a request wait for a rebuild. Entries are kept in
+    Redis for `hard_ttl` and served if a rebuild fails. An optional
+    refresher task rebuilds recently requested entries before they go
+    stale, so steady traffic never waits for a rebuild.
+    
+    In front of Redis, each process keeps a small LRU of serialized
+    /api/state responses (see ResponseCache) so most requests skip Redis
+    and serialization entirely.
     
-    def __init__(self, state_service: StateService, redis_client):
+    Entries are invalidated by order events rather than by their TTL: every
+    entry records the cache generation it was built from, and the stream
+    consumer bumps the generation on each transition (see
+    cache_invalidation). An entry from an older generation counts as stale
+    whatever its age: within `max_stale` it is still served while being
+    revalidated in the background, past that it is rebuilt inline. The
+    in-process LRU is cleared by the broadcast that accompanies each bump
+    (see clear_responses).
+    """
+    
+    def __init__(self, state_service: StateService, redis_client, cache_ttl: int = 5,
+                 max_stale: Optional[float] = None, hard_ttl: Optional[float] = None,
+                 lock_timeout: float = 2.0, lock_poll_interval: float = 0.05):
         self.state_service = state_service
         self.redis = redis_client
-        self.cache_ttl = 5  # 5 seconds
+        self.cache_ttl = cache_ttl  # seconds an entry is fresh, 0 disables caching
+        self.max_stale = max(max_stale if max_stale is not None else settings.state_cache_max_stale, cache_ttl)
+        self.hard_ttl = max(hard_ttl if hard_ttl is not None else settings.state_cache_hard_ttl, self.max_stale)
         self.cache_key_prefix = "state_cache:"
+        self.codec = get_codec()
+        self.lock_timeout = lock_timeout  # seconds a rebuild may hold the lock
+        self.lock_poll_interval = lock_poll_interval
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        # cache key -> (model class, loader, last requested), recorded only
+        # while the refresher runs, which prunes it
+        self._hot: Dict[str, tuple] = {}
+        self._refresher: Optional[asyncio.Task] = None
+        self.responses = ResponseCache(settings.response_cache_max_entries, min(settings.response_cache_ttl, cache_ttl))
+        self.redis_hits = 0
+        self.redis_stale_hits = 0
+        self.redis_misses = 0
+        self.rebuilds = 0
     
     async def get_system_state(self, include_completed: bool = True, limit: Optional[int] = None) -> SystemState:
         """
@@ -198,68 +273,224 @@ class CachedStateService:
         Returns:
             Cached or fresh SystemState
         """
-        # Create cache key based on parameters
-        cache_key = f"{self.cache_key_prefix}system_state:{include_completed}:{limit}"
+        state, _ = await self._get_system_state(include_completed, limit)
+        return state
+    
+    async def get_system_state_response(self, include_completed: bool = True, limit: Optional[int] = None,
+                                        generation: Optional[int] = None) -> Tuple[bytes, Optional[int]]:
+        """
+        Get the serialized /api/state response body
         
-        # Try to get from cache
-        cached_data = await self.redis.client.get(cache_key)
-        if cached_data:
-            try:
-                data = json.loads(cached_data)
-                return SystemState(**data)
-            except (json.JSONDecodeError, ValueError):
-                # Cache corrupted, continue to fetch fresh data
-                pass
+        Served from the in-process cache when possible, otherwise built
+        from get_system_state and cached.
         
-        # Get fresh data
-        state = await self.state_service.get_system_state(include_completed, limit)
+        Args:
+            generation: Cache generation the caller has seen (e.g. for its
+                ETag); in-process entries from other generations are not used
         
-        # Cache the result
-        await self.redis.client.setex(
-            cache_key,
-            self.cache_ttl,
-            json.dumps(state.model_dump(mode='json'), default=str)
+        Returns:
+            The body and the generation it reflects, which is older than
+            `generation` while a stale entry is being revalidated
+        """
+        body = self.responses.get(self._response_key(generation, include_completed, limit))
+        if body is not None:
+            return body, generation
+        state, built_generation = await self._get_system_state(include_completed, limit)
+        if generation is None or built_generation is None:
+            built_generation = generation
+        body = state.model_dump_json().encode()
+        self.responses.set(self._response_key(built_generation, include_completed, limit), body)
+        return body, built_generation
+    
+    async def _get_system_state(self, include_completed: bool, limit: Optional[int]) -> tuple:
+        return await self._get_cached_entry(
+            f"system_state:{include_completed}:{limit}",
+            SystemState,
+            lambda: self.state_service.get_system_state(include_completed, limit)
         )
-        
-        return state
+    
+    @staticmethod
+    def _response_key(generation: Optional[int], include_completed: bool, limit: Optional[int]) -> str:
+        return f"system_state:{generation}:{include_completed}:{limit}"
     
     async def get_statistics(self) -> SystemStatistics:
         """Get statistics with caching"""
-        cache_key = f"{self.cache_key_prefix}statistics"
+        return await self._get_cached("statistics", SystemStatistics, lambda: self.state_service.get_statistics())
+    
+    async def get_active_drivers(self) -> List[ActiveDriver]:
+        """Get active drivers (not cached, a single HGETALL of the active driver registry)"""
+        return await self.state_service.get_active_drivers()
+    
+    async def get_orders_by_status(self, include_completed: bool = True, limit: Optional[int] = None,
+                                   offset: int = 0, status: Optional[OrderStatus] = None) -> Dict[str, List[dict]]:
+        """Get one page of orders per status (not cached, reads only that page)"""
+        return await self.state_service.get_orders_by_status(include_completed, limit, offset, status)
+    
+    def start_refresher(self, interval: float, hot_window: float = 60.0):
+        """
+        Keep recently requested entries warm in the background
         
-        # Try cache first
-        cached_data = await self.redis.client.get(cache_key)
-        if cached_data:
+        Args:
+            interval: Seconds between refresher passes
+            hot_window: Entries not requested for this long are left to expire
+        """
+        if self._refresher is None and self.cache_ttl > 0:
+            self._refresher = asyncio.create_task(self._refresh_loop(interval, hot_window))
+    
+    async def stop_refresher(self):
+        """Stop the background refresher"""
+        if self._refresher is not None:
+            self._refresher.cancel()
             try:
-                data = json.loads(cached_data)
-                return SystemStatistics(**data)
-            except (json.JSONDecodeError, ValueError):
+                await self._refresher
+            except asyncio.CancelledError:
                 pass
+            self._refresher = None
+        self._hot.clear()
+    
+    async def _get_cached(self, name: str, model_class: Type[ModelT], load: Callable[[], Awaitable[ModelT]]) -> ModelT:
+        value, _ = await self._get_cached_entry(name, model_class, load)
+        return value
+    
+    async def _get_cached_entry(self, name: str, model_class: Type[ModelT],
+                                load: Callable[[], Awaitable[ModelT]]) -> tuple:
+        """Cached or rebuilt value and the generation it was built from (None when not cached)"""
+        if self.cache_ttl <= 0:
+            return await load(), None
         
-        # Get fresh data
-        stats = await self.state_service.get_statistics()
+        cache_key = self._cache_key(name)
+        if self._refresher is not None:
+            self._hot[cache_key] = (model_class, load, time.monotonic())
+        entry = await self._read(cache_key, model_class)
+        if entry is not None:
+            value, age, generation = entry
+            if age < self.cache_ttl:
+                self.redis_hits += 1
+                return value, generation
+            if age < self.max_stale:
+                # Serve stale, revalidate in the background
+                self.redis_stale_hits += 1
+                self._rebuild_once(cache_key, model_class, load)
+                return value, generation
+        self.redis_misses += 1
         
-        # Cache it
-        await self.redis.client.setex(
-            cache_key,
-            self.cache_ttl,
-            json.dumps(stats.model_dump(mode='json'), default=str)
-        )
+        try:
+            # shield: a cancelled request must not cancel the rebuild others await
+            return await asyncio.shield(self._rebuild_once(cache_key, model_class, load))
+        except Exception:
+            if entry is None:
+                raise
+            logger.exception("Rebuild of %s failed, serving stale entry", cache_key)
+            return entry[0], entry[2]
+    
+    def _rebuild_once(self, cache_key: str, model_class: Type[ModelT], load: Callable[[], Awaitable[ModelT]]) -> asyncio.Future:
+        """Start a rebuild of the entry, or join the one already running in this process"""
+        flight = self._in_flight.get(cache_key)
+        if flight is None:
+            self.rebuilds += 1
+            flight = asyncio.ensure_future(self._rebuild(cache_key, model_class, load))
+            self._in_flight[cache_key] = flight
+            flight.add_done_callback(lambda done: self._finish_rebuild(cache_key, done))
+        return flight
+    
+    def _finish_rebuild(self, cache_key: str, flight: asyncio.Future):
+        self._in_flight.pop(cache_key, None)
+        if not flight.cancelled() and flight.exception() is not None:
+            logger.error("Failed to rebuild %s: %s", cache_key, flight.exception())
+    
+    async def _rebuild(self, cache_key: str, model_class: Type[ModelT], load: Callable[[], Awaitable[ModelT]]) -> tuple:
+        lock_key = f"{cache_key}:lock"
+        token = uuid.uuid4().hex
+        
+        if await self.redis.client.set(lock_key, token, nx=True, px=int(self.lock_timeout * 1000)):
+            try:
+                return await self._load_and_store(cache_key, load)
+            finally:
+                await run_script(self.redis.client, RELEASE_LOCK_SCRIPT, RELEASE_LOCK_SCRIPT_SHA, [lock_key], [token])
+        
+        # Another worker is rebuilding: wait for its result
+        deadline = asyncio.get_running_loop().time() + self.lock_timeout
+        while asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(self.lock_poll_interval)
+            entry = await self._read(cache_key, model_class)
+            if entry is not None and entry[1] < self.cache_ttl:
+                return entry[0], entry[2]
         
-        return stats
+        logger.warning("Timed out waiting for another worker to rebuild %s", cache_key)
+        return await self._load_and_store(cache_key, load)
+    
+    async def _load_and_store(self, cache_key: str, load: Callable[[], Awaitable[ModelT]]) -> tuple:
+        # Read before loading, so a change made during the load outdates the entry
+        generation = await current_generation(self.redis)
+        value = await load()
+        async with self.redis.client.pipeline(transaction=True) as pipe:
+            pipe.hset(cache_key, mapping={
+                "data": self.codec.dump_model(value), "built_at": time.time(), "generation": generation
+            })
+            pipe.expire(cache_key, int(math.ceil(self.hard_ttl)))
+            await pipe.execute()
+        return value, generation
+    
+    async def _read(self, cache_key: str, model_class: Type[ModelT]) -> Optional[tuple]:
+        """
+        Cached value, its age in seconds and its generation, or None on a miss
+        
+        Entries from an older generation are returned as at least
+        `cache_ttl` old, so they are stale but still served within
+        `max_stale` while being revalidated.
+        """
+        async with self.redis.client.pipeline(transaction=False) as pipe:
+            pipe.hmget(cache_key, ["data", "built_at", "generation"])
+            pipe.get(GENERATION_KEY)
+            (data, built_at, generation), current = await pipe.execute()
+        if data and built_at:
+            age = time.time() - float(built_at)
+            generation = int(generation or 0)
+            if generation != int(current or 0):
+                age = max(age, self.cache_ttl)
+            try:
+                return self.codec.load_model(model_class, data), age, generation
+            except ValueError:
+                # Cache corrupted, treat as a miss
+                logger.warning("Discarding unreadable cache entry %s", cache_key)
+        return None
+    
+    async def _refresh_loop(self, interval: float, hot_window: float):
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            for cache_key, (model_class, load, last_requested) in list(self._hot.items()):
+                if now - last_requested > hot_window:
+                    del self._hot[cache_key]
+                    continue
+                entry = await self._read(cache_key, model_class)
+                # Rebuild anything that would go stale before the next pass
+                if entry is None or entry[1] + interval >= self.cache_ttl:
+                    self._rebuild_once(cache_key, model_class, load)
+    
+    def _cache_key(self, name: str) -> str:
+        # The codec is part of the key so workers using different codecs
+        # (e.g. during a rolling deploy) never read each other's entries
+        return f"{self.cache_key_prefix}{self.codec.name}:{name}"
     
     async def invalidate_cache(self):
-        """Invalidate all state cache entries"""
-        keys = await self.redis.client.keys(f"{self.cache_key_prefix}*")
-        if keys:
-            await self.redis.client.delete(*keys)
+        """Invalidate all state cache entries, in every worker"""
+        await bump_generation(self.redis)
+    
+    def clear_responses(self, order_id: str = ""):
+        """Drop the in-process responses, called on each invalidation broadcast"""
+        self.responses.clear()
     
     async def get_cache_stats(self) -> dict:
-        """Get cache hit/miss statistics"""
-        # This would require implementing cache metrics tracking
-        # For now, return basic info
-        keys = await self.redis.client.keys(f"{self.cache_key_prefix}*")
+        """Get cache hit/miss statistics of this process"""
         return {
-            "cached_entries": len(keys),
-            "cache_ttl_seconds": self.cache_ttl
+            "cache_ttl_seconds": self.cache_ttl,
+            "max_stale_seconds": self.max_stale,
+            "memory": self.responses.stats(),
+            "redis": {
+                "hits": self.redis_hits,
+                "stale_hits": self.redis_stale_hits,
+                "misses": self.redis_misses,
+                "rebuilds": self.rebuilds
+            }
         }   
\ No newline at end of file
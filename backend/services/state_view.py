@@ -0,0 +1,243 @@
+from models import SystemState, SystemStatistics, ActiveDriver, OrderStatus
+from services.order_repository import OrderRepository
+from services.order_index import to_score, CREATED_INDEX_KEY, COMPLETED_STATUSES
+from services.order_scripts import (
+    STATE_VIEW_SCRIPT,
+    STATE_VIEW_SCRIPT_SHA,
+    STATE_VIEW_INVALIDATE_SCRIPT,
+    STATE_VIEW_INVALIDATE_SCRIPT_SHA,
+    run_script,
+)
+from services.cache_invalidation import GENERATION_KEY, INVALIDATION_CHANNEL
+from services.state_service import build_statistics, group_by_status, select_active_drivers
+from services.state_changes import handled_mark
+from datetime import datetime
+from typing import Optional, Dict, List, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Read model keys. Everything lives under "state_view:" so the whole model
+# can be dropped and rebuilt without touching the orders themselves.
+VIEW_PREFIX = "state_view:"
+VIEW_ORDERS_KEY = "state_view:orders"            # hash: order ID -> last applied status/version/driver
+VIEW_COUNTS_KEY = "state_view:counts"            # hash: status -> order count
+VIEW_STATUS_PREFIX = "state_view:status:"        # sorted set per status, scored by created_at
+VIEW_DRIVERS_KEY = "state_view:drivers"          # hash: driver name -> that driver's active orders
+VIEW_DELIVERED_PREFIX = "state_view:delivered:"  # counter per UTC day
+VIEW_BUILT_KEY = "state_view:built"              # layout version, set once the model has been bootstrapped
+
+# Bumped whenever the layout of the model changes; a model built with
+# another layout is dropped and rebuilt by ensure_built
+VIEW_LAYOUT_VERSION = "2"
+
+DELIVERED_COUNTER_TTL = 2 * 24 * 3600
+
+# Order fields the read model is built from
+VIEW_FIELDS = ['id', 'status', 'version', 'created_at', 'updated_at', 'driver_name']
+
+
+class StateView:
+    """
+    Event-sourced read model of the system state
+
+    The stream consumer applies every order event to a handful of small
+    Redis structures (status counts, per-status membership, driver
+    assignments and a delivered-per-day counter), each update costing one
+    atomic script call. Dashboard reads then only fetch those structures
+    and the orders actually displayed, instead of recomputing everything
+    from the orders.
+
+    Exposes the same read methods as StateService so it can serve /api/state
+    directly.
+    """
+
+    def __init__(self, redis_client):
+        self.redis = redis_client
+        self.orders = OrderRepository(redis_client)
+
+    async def apply_event(self, event_data: dict, invalidate: bool = False) -> bool:
+        """
+        Apply an order event to the read model
+
+        Args:
+            event_data: Decoded event with the order as it was after the event
+            invalidate: Also bump the cache generation if the event was
+                applied (in the same script call)
+
+        Returns:
+            True if applied, False if the event was older than the model
+        """
+        order = event_data.get("order") or {}
+        if not order.get("id") or not order.get("status"):
+            return False
+        script, sha = self._script(invalidate)
+        keys, args = self._script_input(order, invalidate)
+        return bool(await run_script(self.redis.client, script, sha, keys, args))
+
+    def stage_events(self, pipe, events: List[dict], invalidate: bool = False) -> List[int]:
+        """
+        Queue applying a batch of events on a pipeline
+
+        The script is loaded at the head of the batch, so the EVALSHAs that
+        follow cannot fail with NOSCRIPT whatever the server has cached.
+        Events without an order are skipped.
+
+        Returns:
+            Number of script calls queued for each event (1, or 0 if skipped),
+            as a batch handler reports them
+        """
+        script, sha = self._script(invalidate)
+        inputs = [
+            self._script_input(order, invalidate) if order.get("id") and order.get("status") else None
+            for order in (event_data.get("order") or {} for event_data in events)
+        ]
+        if any(inputs):
+            pipe.script_load(script)
+        for keys, args in filter(None, inputs):
+            pipe.evalsha(sha, len(keys), *keys, *args)
+        return [0 if script_input is None else 1 for script_input in inputs]
+
+    async def rebuild(self, batch_size: int = 500) -> int:
+        """
+        Bootstrap the read model from the stored orders
+
+        Safe to run while events are being applied: both paths go through
+        the same version check, so whichever is newer wins.
+
+        Returns:
+            Number of orders applied
+        """
+        await self.redis.client.script_load(STATE_VIEW_SCRIPT)
+        order_ids = await self.redis.client.zrange(CREATED_INDEX_KEY, 0, -1)
+        applied = 0
+        for i in range(0, len(order_ids), batch_size):
+            orders = await self.orders.get_many(order_ids[i:i + batch_size], fields=VIEW_FIELDS)
+            async with self.redis.client.pipeline(transaction=False) as pipe:
+                for order in orders.values():
+                    keys, args = self._script_input(order)
+                    pipe.evalsha(STATE_VIEW_SCRIPT_SHA, len(keys), *keys, *args)
+                results = await pipe.execute()
+            applied += sum(results)
+        await self.redis.client.set(VIEW_BUILT_KEY, VIEW_LAYOUT_VERSION)
+        logger.info("Rebuilt state view from %d orders", applied)
+        return applied
+
+    async def ensure_built(self):
+        """Rebuild the read model unless it has been bootstrapped with the current layout"""
+        built = await self.redis.client.get(VIEW_BUILT_KEY)
+        if built == VIEW_LAYOUT_VERSION:
+            return
+        if built is not None:
+            logger.info("State view layout changed, dropping it before the rebuild")
+            await self.drop()
+        await self.rebuild()
+
+    async def drop(self):
+        """Delete every key of the read model"""
+        async for key in self.redis.client.scan_iter(match=f"{VIEW_PREFIX}*", count=500):
+            await self.redis.client.delete(key)
+
+    def _script(self, invalidate: bool) -> tuple:
+        if invalidate:
+            return STATE_VIEW_INVALIDATE_SCRIPT, STATE_VIEW_INVALIDATE_SCRIPT_SHA
+        return STATE_VIEW_SCRIPT, STATE_VIEW_SCRIPT_SHA
+
+    def _script_input(self, order: dict, invalidate: bool = False) -> tuple:
+        """KEYS and ARGV of STATE_VIEW_SCRIPT (or the invalidating variant) for an order"""
+        updated_at = order.get('updated_at') or ''
+        day = updated_at[:10] or datetime.utcnow().date().isoformat()
+        keys = [VIEW_ORDERS_KEY, VIEW_COUNTS_KEY, VIEW_DRIVERS_KEY, f"{VIEW_DELIVERED_PREFIX}{day}"]
+        args = [
+            order['id'],
+            order['status'],
+            order.get('version') or 0,
+            to_score(order.get('created_at')),
+            order.get('driver_name') or '',
+            updated_at,
+            VIEW_STATUS_PREFIX,
+            DELIVERED_COUNTER_TTL,
+        ]
+        if invalidate:
+            keys.append(GENERATION_KEY)
+            args.append(INVALIDATION_CHANNEL)
+        return keys, args
+
+    async def get_system_state(self, include_completed: bool = True, limit: Optional[int] = None) -> SystemState:
+        """
+        Get complete system state from the read model
+
+        The counts, memberships and drivers are read in one round trip and
+        the displayed orders in a second one. The model lags the stream by
+        the events still being handled, so `changes_mark` is the position
+        the consumer group has handled everything up to, read beforehand.
+        """
+        statuses = [
+            status.value for status in OrderStatus
+            if include_completed or status.value not in COMPLETED_STATUSES
+        ]
+        stop = limit - 1 if limit else -1
+        changes_mark = await handled_mark(self.redis)
+
+        async with self.redis.client.pipeline(transaction=False) as pipe:
+            pipe.hgetall(VIEW_COUNTS_KEY)
+            pipe.get(self._delivered_today_key())
+            pipe.hgetall(VIEW_DRIVERS_KEY)
+            for status in statuses:
+                pipe.zrevrange(f"{VIEW_STATUS_PREFIX}{status}", 0, stop)
+            results = await pipe.execute()
+
+        counts, delivered_today, drivers = results[:3]
+        ids_by_status = dict(zip(statuses, results[3:]))
+
+        return SystemState(
+            statistics=self._statistics(counts, delivered_today),
+            orders_by_status=await self._orders_by_status(ids_by_status),
+            active_drivers=select_active_drivers(drivers),
+            last_updated=datetime.utcnow(),
+            changes_mark=changes_mark
+        )
+
+    async def get_system_state_response(self, include_completed: bool = True, limit: Optional[int] = None,
+                                        generation: Optional[int] = None) -> Tuple[bytes, Optional[int]]:
+        """Get the serialized /api/state response body, which is never older than `generation`"""
+        return (await self.get_system_state(include_completed, limit)).model_dump_json().encode(), generation
+
+    async def get_statistics(self) -> SystemStatistics:
+        """Get system-wide statistics from the read model"""
+        async with self.redis.client.pipeline(transaction=False) as pipe:
+            pipe.hgetall(VIEW_COUNTS_KEY)
+            pipe.get(self._delivered_today_key())
+            counts, delivered_today = await pipe.execute()
+        return self._statistics(counts, delivered_today)
+
+    async def get_orders_by_status(self, include_completed: bool = True, limit: Optional[int] = None,
+                                   offset: int = 0, status: Optional[OrderStatus] = None) -> Dict[str, List[dict]]:
+        """Get orders grouped by status, newest first, skipping `offset` orders per status"""
+        if status:
+            statuses = [OrderStatus(status).value]
+        else:
+            statuses = [
+                status.value for status in OrderStatus
+                if include_completed or status.value not in COMPLETED_STATUSES
+            ]
+        stop = offset + limit - 1 if limit else -1
+        async with self.redis.client.pipeline(transaction=False) as pipe:
+            for status in statuses:
+                pipe.zrevrange(f"{VIEW_STATUS_PREFIX}{status}", offset, stop)
+            ids_by_status = dict(zip(statuses, await pipe.execute()))
+        return await self._orders_by_status(ids_by_status)
+
+    async def get_active_drivers(self) -> List[ActiveDriver]:
+        """Get the drivers currently assigned to an active delivery"""
+        return select_active_drivers(await self.redis.client.hgetall(VIEW_DRIVERS_KEY))
+
+    def _delivered_today_key(self) -> str:
+        return f"{VIEW_DELIVERED_PREFIX}{datetime.utcnow().date().isoformat()}"
+
+    def _statistics(self, counts: Dict[str, str], delivered_today: Optional[str]) -> SystemStatistics:
+        return build_statistics({status: int(count) for status, count in counts.items()}, int(delivered_today or 0))
+
+    async def _orders_by_status(self, ids_by_status: Dict[str, List[str]]) -> Dict[str, List[dict]]:
+        orders = await self.orders.get_many([order_id for ids in ids_by_status.values() for order_id in ids])
+        return group_by_status(ids_by_status, orders)
@@ -1,22 +1,115 @@
+import argparse
 import asyncio
-import json
 import logging
+import signal
+import socket
+import uuid
+import zlib
 from datetime import datetime
-from typing import Callable, Dict, Any
+from typing import Callable, Dict, Any, List, Optional, Tuple
+from config import settings
 from redis_client import redis_client
+from models import OrderStatus
+from services.codec import decode_stream_data
+from services.order_service import EVENT_STREAM, EVENT_GROUP
+from services.order_scripts import (
+    EXTEND_LOCK_SCRIPT,
+    EXTEND_LOCK_SCRIPT_SHA,
+    RELEASE_LOCK_SCRIPT,
+    RELEASE_LOCK_SCRIPT_SHA,
+    run_script,
+)
+from services.state_view import StateView
 
 logger = logging.getLogger(__name__)
 
+# Fields added to a message when it is moved to the dead-letter stream
+DEAD_LETTER_FIELDS = ("original_id", "deliveries", "dead_lettered_at", "error")
+
+
+def dead_letter_stream(stream_name: str) -> str:
+    """Name of the dead-letter stream of a stream"""
+    return f"{stream_name}:dlq"
+
 class StreamConsumer:
-    """Redis Streams consumer for processing events asynchronously"""
+    """
+    Redis Streams consumer for processing events asynchronously
+    
+    Messages are handled by a pool of worker tasks. Each message goes to
+    the worker chosen by its order ID, so the events of one order are
+    handled one after another, in stream order, while different orders are
+    handled in parallel. At most `max_in_flight` messages are read but not
+    yet handled; when that many are waiting, reading pauses until workers
+    catch up.
+    
+    Each worker takes up to `handler_batch` queued messages at a time.
+    Batch handlers (register_batch_handler) get the events of a batch
+    together with a pipeline to queue their Redis writes on, and report
+    which writes belong to which event. Those writes go out in a single
+    round trip, then one XACK covers every message whose handler and
+    writes succeeded; a message whose write failed stays pending. Plain
+    handlers are called per event, and their messages are acknowledged in
+    the same XACK.
+    
+    The read loop never sleeps: XREADGROUP returns at once while there is a
+    backlog and blocks server-side when the stream is idle. The batch size
+    doubles while reads come back full, up to `max_batch`, and halves again
+    as the backlog drains.
+    
+    Messages whose handler failed, or whose consumer died, stay pending in
+    the group. A background reclaimer takes over entries idle for longer
+    than `claim_idle_ms` (XAUTOCLAIM) and handles them again; once a
+    message has been delivered `max_deliveries` times it is moved to the
+    dead-letter stream (`<stream>:dlq`) and acknowledged, so a poison
+    message cannot stay pending forever. Messages that cannot be decoded
+    are dead-lettered on their first delivery, with the decode error in an
+    `error` field. inspect_streams.py can replay or purge the dead letters.
     
-    def __init__(self, stream_name: str = "pizza_orders_stream", group_name: str = "event_processors"):
+    The consumer name comes from STREAM_CONSUMER_NAME (or `consumer_name`)
+    and should be stable across restarts: on start, the consumer first
+    handles whatever it still had pending under that name. Without a
+    configured name it is the hostname. Consumers embedded in API workers,
+    which all share one configuration, suffix that name with a worker slot
+    (see claim_worker_name). Consumers idle for longer than
+    STREAM_CONSUMER_IDLE_TIMEOUT_MS are removed from the group (XGROUP
+    DELCONSUMER) by the others, after their pending messages are taken over.
+    """
+    
+    MIN_BATCH = 10
+    # Worker slots an embedded consumer may claim, and how long a claim
+    # lasts without being renewed
+    MAX_WORKER_SLOTS = 64
+    WORKER_SLOT_LEASE = 60.0
+    
+    def __init__(self, stream_name: str = EVENT_STREAM, group_name: str = EVENT_GROUP,
+                 workers: Optional[int] = None, max_in_flight: Optional[int] = None,
+                 max_batch: Optional[int] = None, block_ms: Optional[int] = None,
+                 claim_idle_ms: Optional[int] = None, max_deliveries: Optional[int] = None,
+                 consumer_name: Optional[str] = None, handler_batch: Optional[int] = None, redis=None):
         self.stream_name = stream_name
         self.group_name = group_name
-        self.consumer_name = f"consumer_{id(self)}"
-        self.redis = redis_client
+        self.base_name = consumer_name or settings.stream_consumer_name or socket.gethostname()
+        self.consumer_name = self.base_name
+        self.redis = redis or redis_client
         self.handlers: Dict[str, Callable] = {}
+        self.batch_handlers: Dict[str, Callable] = {}
         self.running = False
+        self.workers = max(1, workers or settings.stream_consumer_workers)
+        self.max_in_flight = max(1, max_in_flight or settings.stream_consumer_max_in_flight)
+        self.max_batch = max(self.MIN_BATCH, max_batch or settings.stream_consumer_max_batch)
+        self.block_ms = block_ms or settings.stream_consumer_block_ms
+        self.handler_batch = max(1, handler_batch or settings.stream_consumer_handler_batch)
+        self.batch_size = self.MIN_BATCH
+        self.dead_letter_stream = dead_letter_stream(stream_name)
+        self.claim_idle_ms = claim_idle_ms or settings.stream_claim_idle_ms
+        self.max_deliveries = max_deliveries or settings.stream_max_deliveries
+        self._reclaimer: Optional[asyncio.Task] = None
+        self._queues: List[asyncio.Queue] = []
+        self._worker_tasks: List[asyncio.Task] = []
+        self._in_flight: Optional[asyncio.Semaphore] = None
+        # (lease key, token) of the claimed worker slot, and the task renewing it
+        self._worker_slot: Optional[Tuple[str, str]] = None
+        self._slot_keeper: Optional[asyncio.Task] = None
     
     def register_handler(self, event_type: str, handler: Callable):
         """
@@ -29,44 +122,66 @@ class StreamConsumer:
         self.handlers[event_type] = handler
         logger.info(f"Registered handler for event type: {event_type}")
     
+    def register_batch_handler(self, event_type: str, handler: Callable):
+        """
+        Register a handler taking a batch of events of a specific type
+        
+        The handler is called as `await handler(events, pipe)` with a list
+        of decoded events and a non-transactional Redis pipeline. It queues
+        its writes on the pipeline instead of awaiting them, and returns one
+        outcome per event: the number of commands it queued for that event,
+        or None to leave the event pending for redelivery (without queuing
+        anything for it). Per-event commands are queued in event order,
+        after any commands shared by the whole batch (such as a SCRIPT LOAD).
+        
+        The queued writes are sent after the handler returns, and an event
+        is acknowledged only if its commands and the shared ones succeeded.
+        Writes are sent even if the handler raises after queuing some, and
+        failed events are redelivered, so writes must be safe to repeat.
+        
+        A batch handler takes precedence over a plain handler for the same
+        event type. One handler registered for several event types gets
+        consecutive events of those types in one call.
+        
+        Args:
+            event_type: The event type to handle (e.g., "order.created")
+            handler: Async function taking (events, pipe), returning a list
+                of command counts (None for a failed event)
+        """
+        self.batch_handlers[event_type] = handler
+        logger.info(f"Registered batch handler for event type: {event_type}")
+    
     async def start_consuming(self):
         """Start consuming events from the stream"""
         self.running = True
-        logger.info(f"Starting stream consumer for {self.stream_name} in group {self.group_name}")
+        logger.info(f"Starting stream consumer for {self.stream_name} in group {self.group_name} "
+                    f"with {self.workers} workers")
+        self._start_workers()
+        if self._reclaimer is None and settings.stream_claim_interval > 0:
+            self._reclaimer = asyncio.create_task(self._reclaim_loop(settings.stream_claim_interval))
         
         try:
+            await self.recover_own_pending()
             while self.running:
-                # Read messages from the stream
+                # Returns immediately if messages are waiting, otherwise
+                # blocks in Redis until one arrives or block_ms passes
                 messages = await self.redis.read_stream_group(
                     self.stream_name, 
                     self.group_name, 
                     self.consumer_name,
-                    count=10,
-                    block=5000  # Block for 5 seconds
+                    count=self.batch_size,
+                    block=self.block_ms
                 )
                 
-                if messages:
-                    message_ids = []
-                    
-                    for stream_messages in messages:
-                        stream_name, entries = stream_messages
-                        
-                        for message_id, message_data in entries:
-                            try:
-                                await self._process_message(message_id, message_data)
-                                message_ids.append(message_id)
-                            except Exception as e:
-                                logger.error(f"Failed to process message {message_id}: {e}")
+                received = 0
+                for stream_messages in messages or []:
+                    stream_name, entries = stream_messages
+                    received += len(entries)
                     
-                    # Acknowledge processed messages
-                    if message_ids:
-                        await self.redis.acknowledge_message(
-                            self.stream_name, 
-                            self.group_name, 
-                            message_ids
-                        )
+                    for message_id, message_data in entries:
+                        await self.dispatch(message_id, message_data)
                 
-                await asyncio.sleep(0.1)  # Small delay to prevent busy waiting
+                self.batch_size = self._next_batch_size(received)
                 
         except Exception as e:
             logger.error(f"Error in stream consumer: {e}")
@@ -74,83 +189,440 @@ class StreamConsumer:
                 # Restart consumer after error
                 await asyncio.sleep(5)
                 await self.start_consuming()
+        finally:
+            if not self.running:
+                await self._drain()
     
     async def stop_consuming(self):
         """Stop consuming events"""
         self.running = False
+        await self._release_worker_slot()
         logger.info("Stopped stream consumer")
     
+    async def claim_worker_name(self) -> str:
+        """
+        Suffix the consumer name with the lowest free worker slot
+        
+        Every API worker gets the same STREAM_CONSUMER_NAME (or hostname),
+        so an embedded consumer claims a numbered slot under that name and
+        becomes "<name>-<slot>". The claim is a lease, renewed while the
+        consumer runs and released when it stops: a restarted worker takes
+        the slot its predecessor freed, and with it the predecessor's name
+        and pending messages.
+        
+        Returns:
+            The consumer name
+        """
+        if self._worker_slot is not None:
+            return self.consumer_name
+        token = uuid.uuid4().hex
+        lease_ms = int(self.WORKER_SLOT_LEASE * 1000)
+        for slot in range(self.MAX_WORKER_SLOTS):
+            name = f"{self.base_name}-{slot}"
+            key = self._slot_key(name)
+            if await self.redis.client.set(key, token, nx=True, px=lease_ms):
+                self.consumer_name = name
+                self._worker_slot = (key, token)
+                self._slot_keeper = asyncio.create_task(self._keep_worker_slot(key, token, lease_ms))
+                logger.info("Claimed consumer name %s", name)
+                return name
+        raise RuntimeError(f"All {self.MAX_WORKER_SLOTS} consumer slots of {self.base_name} are taken")
+    
+    async def _keep_worker_slot(self, key: str, token: str, lease_ms: int):
+        """Renew the worker slot lease until the consumer stops"""
+        while True:
+            await asyncio.sleep(self.WORKER_SLOT_LEASE / 3)
+            try:
+                if not await run_script(self.redis.client, EXTEND_LOCK_SCRIPT, EXTEND_LOCK_SCRIPT_SHA,
+                                        [key], [token, lease_ms]):
+                    # Only happens if renewals failed for a whole lease
+                    logger.warning("Lost the lease on consumer name %s", self.consumer_name)
+                    await self.redis.client.set(key, token, nx=True, px=lease_ms)
+            except Exception as e:
+                logger.error(f"Failed to renew consumer name lease: {e}")
+    
+    async def _release_worker_slot(self):
+        if self._worker_slot is None:
+            return
+        self._slot_keeper.cancel()
+        key, token = self._worker_slot
+        self._worker_slot = self._slot_keeper = None
+        await run_script(self.redis.client, RELEASE_LOCK_SCRIPT, RELEASE_LOCK_SCRIPT_SHA, [key], [token])
+    
+    def _slot_key(self, name: str) -> str:
+        return f"{self.stream_name}:{self.group_name}:consumer:{name}"
+    
+    async def recover_own_pending(self) -> int:
+        """
+        Handle the messages still pending under this consumer's name
+        
+        These were read by a previous run with the same name but never
+        acknowledged (e.g. the process was killed mid-batch).
+        
+        Returns:
+            Number of messages handed to the workers
+        """
+        recovered = 0
+        last_id = "0"
+        while True:
+            messages = await self.redis.read_stream_group(
+                self.stream_name, self.group_name, self.consumer_name,
+                count=self.max_batch, start_id=last_id
+            )
+            entries = [entry for _, stream_entries in messages or [] for entry in stream_entries]
+            if not entries:
+                break
+            last_id = entries[-1][0]
+            recovered += await self._retry_or_dead_letter(
+                [(message_id, data) for message_id, data in entries if data]
+            )
+        if recovered:
+            logger.info("Recovered %d pending messages of %s", recovered, self.consumer_name)
+        return recovered
+    
+    async def cleanup_idle_consumers(self, idle_timeout_ms: Optional[int] = None) -> List[str]:
+        """
+        Remove other consumers of the group that have been idle too long
+        
+        Their pending messages are claimed by this consumer and handled
+        first, since XGROUP DELCONSUMER drops a consumer's pending entries.
+        
+        Returns:
+            Names of the removed consumers
+        """
+        idle_timeout_ms = idle_timeout_ms or settings.stream_consumer_idle_timeout_ms
+        removed = []
+        for consumer in await self.redis.client.xinfo_consumers(self.stream_name, self.group_name):
+            name = consumer["name"]
+            if name == self.consumer_name or consumer["idle"] < idle_timeout_ms:
+                continue
+            if consumer["pending"]:
+                pending = await self.redis.client.xpending_range(
+                    self.stream_name, self.group_name, "-", "+", consumer["pending"], consumername=name
+                )
+                claimed = await self.redis.client.xclaim(
+                    self.stream_name, self.group_name, self.consumer_name, 0,
+                    [entry["message_id"] for entry in pending]
+                )
+                await self._retry_or_dead_letter([(message_id, data) for message_id, data in claimed if data])
+            await self.redis.client.xgroup_delconsumer(self.stream_name, self.group_name, name)
+            logger.info("Removed idle consumer %s from group %s", name, self.group_name)
+            removed.append(name)
+        return removed
+    
+    async def reclaim_pending(self) -> int:
+        """
+        Take over pending messages that have been idle for claim_idle_ms
+        
+        Claimed messages are handled again, unless they have already been
+        delivered max_deliveries times, in which case they are moved to the
+        dead-letter stream.
+        
+        Returns:
+            Number of messages handed to the workers again
+        """
+        retried = 0
+        start_id = "0-0"
+        while True:
+            start_id, entries, _ = await self.redis.client.xautoclaim(
+                self.stream_name, self.group_name, self.consumer_name,
+                self.claim_idle_ms, start_id, count=self.max_batch
+            )
+            # Entries trimmed from the stream come back without data
+            retried += await self._retry_or_dead_letter(
+                [(message_id, data) for message_id, data in entries if data is not None]
+            )
+            if start_id == "0-0":
+                return retried
+    
+    async def _retry_or_dead_letter(self, entries: List[tuple]) -> int:
+        """Hand redelivered messages to the workers, or dead-letter those out of attempts"""
+        retried = 0
+        deliveries = await self._delivery_counts([message_id for message_id, _ in entries])
+        for message_id, message_data in entries:
+            if deliveries.get(message_id, 1) > self.max_deliveries:
+                await self._dead_letter(message_id, message_data, deliveries[message_id] - 1)
+            else:
+                logger.info("Retrying message %s (delivery %d)", message_id, deliveries.get(message_id, 1))
+                await self.dispatch(message_id, message_data)
+                retried += 1
+        return retried
+    
+    async def _delivery_counts(self, message_ids: List[str]) -> Dict[str, int]:
+        """How many times each pending message has been delivered, in one round trip"""
+        if not message_ids:
+            return {}
+        async with self.redis.client.pipeline(transaction=False) as pipe:
+            for message_id in message_ids:
+                pipe.xpending_range(self.stream_name, self.group_name, message_id, message_id, 1)
+            results = await pipe.execute()
+        return {
+            entry["message_id"]: entry["times_delivered"]
+            for pending in results for entry in pending
+        }
+    
+    async def _dead_letter(self, message_id: str, message_data: dict, attempts: int, error: str = ""):
+        """Move a message to the dead-letter stream and acknowledge it"""
+        logger.error("Moving message %s to %s after %d failed attempts%s",
+                     message_id, self.dead_letter_stream, attempts, f": {error}" if error else "")
+        dead_letter = {
+            **message_data,
+            "original_id": message_id,
+            "deliveries": attempts,
+            "dead_lettered_at": datetime.utcnow().isoformat()
+        }
+        if error:
+            dead_letter["error"] = error
+        async with self.redis.client.pipeline(transaction=True) as pipe:
+            pipe.xadd(self.dead_letter_stream, dead_letter)
+            pipe.xack(self.stream_name, self.group_name, message_id)
+            await pipe.execute()
+    
+    async def _reclaim_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reclaim_pending()
+                await self.cleanup_idle_consumers()
+            except Exception as e:
+                logger.error(f"Failed to reclaim pending messages: {e}")
+    
+    async def dispatch(self, message_id: str, message_data: dict):
+        """
+        Queue a message for the worker owning its order
+        
+        Waits while `max_in_flight` messages are already queued or being
+        handled.
+        """
+        self._start_workers()
+        await self._in_flight.acquire()
+        partition_key = message_data.get("order_id") or message_id
+        worker = zlib.crc32(partition_key.encode()) % self.workers
+        await self._queues[worker].put((message_id, message_data))
+    
+    async def wait_idle(self):
+        """Wait until every dispatched message has been handled and acknowledged"""
+        for queue in self._queues:
+            await queue.join()
+    
+    def _next_batch_size(self, received: int) -> int:
+        """Grow the batch while reads come back full, shrink it as the backlog drains"""
+        if received >= self.batch_size:
+            return min(self.batch_size * 2, self.max_batch)
+        if received < self.batch_size // 2:
+            return max(self.batch_size // 2, self.MIN_BATCH)
+        return self.batch_size
+    
+    def _start_workers(self):
+        if self._worker_tasks:
+            return
+        self._in_flight = asyncio.Semaphore(self.max_in_flight)
+        self._queues = [asyncio.Queue() for _ in range(self.workers)]
+        self._worker_tasks = [asyncio.create_task(self._work(queue)) for queue in self._queues]
+    
+    async def _drain(self):
+        """Finish the queued messages, then stop the workers"""
+        if self._reclaimer is not None:
+            self._reclaimer.cancel()
+            await asyncio.gather(self._reclaimer, return_exceptions=True)
+            self._reclaimer = None
+        await self.wait_idle()
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        self._queues = []
+    
+    async def _work(self, queue: asyncio.Queue):
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < self.handler_batch and not queue.empty():
+                batch.append(queue.get_nowait())
+            try:
+                await self._process_batch(batch)
+            except Exception as e:
+                # Left pending; the messages are redelivered and handled again
+                logger.error(f"Failed to process {len(batch)} messages: {e}")
+            finally:
+                for _ in batch:
+                    self._in_flight.release()
+                    queue.task_done()
+    
     async def _process_message(self, message_id: str, message_data: dict):
-        """Process a single message from the stream"""
-        try:
+        """Process a single message from the stream (as a batch of one)"""
+        await self._process_batch([(message_id, message_data)])
+    
+    async def _process_batch(self, batch: List[Tuple[str, dict]]):
+        """
+        Handle a batch of messages and acknowledge the successful ones
+        
+        Writes queued by batch handlers go out in one pipeline, followed by
+        one XACK for every message whose handler and writes succeeded (two
+        round trips, so that a failed write is never acknowledged).
+        Consecutive messages sharing a batch handler are passed to it in one
+        call; before a plain handler runs, writes queued so far are sent
+        first so that side effects keep stream order.
+        """
+        acks = []
+        # (message ID, positions of its commands in the pipeline) per staged message
+        staged = []
+        runs, undecodable = self._group_by_handler(batch)
+        for message_id, message_data, error in undecodable:
+            # Retrying cannot help, so it is dead-lettered on the first delivery
+            await self._dead_letter(message_id, message_data, 1, error)
+        async with self.redis.client.pipeline(transaction=False) as pipe:
+            for handler, is_batch, entries in runs:
+                if handler is None:
+                    acks.extend(message_id for message_id, _ in entries)
+                elif is_batch:
+                    staged.extend(await self._stage_batch(handler, entries, pipe))
+                else:
+                    acks.extend(await self._send_writes(pipe, staged))
+                    acks.extend([message_id for message_id, event_data in entries
+                                 if await self._call_handler(handler, message_id, event_data)])
+            acks.extend(await self._send_writes(pipe, staged))
+            
+            if acks:
+                pipe.xack(self.stream_name, self.group_name, *acks)
+                await pipe.execute()
+    
+    def _group_by_handler(self, batch: List[Tuple[str, dict]]) -> Tuple[List[tuple], List[tuple]]:
+        """
+        Decode a batch and split it into runs of consecutive messages with
+        the same handler, as (handler, is_batch_handler, [(message_id, event_data)])
+        
+        Messages without a handler get handler None and are acknowledged
+        without being handled. Messages that cannot be decoded are returned
+        apart, as (message_id, raw fields, decode error), for the dead-letter
+        stream.
+        """
+        runs = []
+        undecodable = []
+        for message_id, message_data in batch:
             event_type = message_data.get("event_type")
-            event_data = json.loads(message_data.get("data", "{}"))
+            try:
+                # Decoded with the codec named in the entry header
+                event_data = decode_stream_data(message_data)
+            except ValueError as e:
+                logger.error(f"Failed to parse event data of message {message_id}: {e}")
+                undecodable.append((message_id, message_data, str(e)))
+                continue
             
             logger.info(f"Processing event: {event_type} (ID: {message_id})")
-            
-            # Call registered handler if available
-            if event_type in self.handlers:
-                await self.handlers[event_type](event_data)
-            else:
+            handler = self.batch_handlers.get(event_type) or self.handlers.get(event_type)
+            is_batch = event_type in self.batch_handlers
+            if handler is None:
                 logger.warning(f"No handler registered for event type: {event_type}")
             
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse event data: {e}")
+            # Bound methods are compared with ==, a new object is made on each access
+            if runs and runs[-1][0] == handler and runs[-1][1] == is_batch:
+                runs[-1][2].append((message_id, event_data))
+            else:
+                runs.append((handler, is_batch, [(message_id, event_data)]))
+        return runs, undecodable
+    
+    async def _stage_batch(self, handler: Callable, entries: List[Tuple[str, dict]], pipe) -> List[tuple]:
+        """
+        Let a batch handler queue its writes, returning (message_id, command
+        positions) for each message it handled; failed messages are left out
+        """
+        start = len(pipe)
+        try:
+            counts = await handler([event_data for _, event_data in entries], pipe)
+            if len(counts) != len(entries):
+                raise ValueError(f"expected {len(entries)} outcomes, got {len(counts)}")
         except Exception as e:
+            logger.error(f"Batch handler failed for {len(entries)} events: {e}")
+            return []
+        
+        # Shared commands come first, then each event's own in event order
+        position = len(pipe) - sum(count or 0 for count in counts)
+        shared = list(range(start, position))
+        staged = []
+        for (message_id, _), count in zip(entries, counts):
+            if count is None or count is False:
+                continue
+            staged.append((message_id, shared + list(range(position, position + count))))
+            position += count
+        return staged
+    
+    async def _send_writes(self, pipe, staged: List[tuple]) -> List[str]:
+        """
+        Send the queued writes, if any, returning the staged messages whose
+        writes all succeeded (including those that queued none)
+        """
+        results = await pipe.execute(raise_on_error=False) if len(pipe) else []
+        self._log_write_errors(results)
+        succeeded = [
+            message_id for message_id, positions in staged
+            if not any(isinstance(results[i], Exception) for i in positions)
+        ]
+        staged.clear()
+        return succeeded
+    
+    async def _call_handler(self, handler: Callable, message_id: str, event_data: dict) -> bool:
+        try:
+            await handler(event_data)
+            return True
+        except Exception as e:
+            # Not acknowledged, so the message is redelivered
             logger.error(f"Error processing message {message_id}: {e}")
-            raise  # Re-raise to prevent acknowledgment
+            return False
+    
+    def _log_write_errors(self, results: list):
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"Queued write failed: {result}")
 
 class EventProcessor:
-    """Example event processor that demonstrates stream consumption"""
+    """
+    Processes order events from the stream
+    
+    Every order event is applied to the StateView read model, which is
+    what /api/state is served from, and invalidates the cached state in
+    all API workers. Events are handled in batches: the read model updates
+    of a batch (each one script call that also bumps the cache generation)
+    are sent in one round trip, and an event is acknowledged only once its
+    update has succeeded.
+    """
+    
+    # Events counted in the order metrics
+    METRIC_EVENTS = ("order.created", "order.supplier_accepted", "order.customer_accepted",
+                     "order.dispatched", "order.delivered")
     
     def __init__(self, redis_client):
         self.redis = redis_client
-        self.consumer = StreamConsumer()
+        self.consumer = StreamConsumer(redis=redis_client)
+        self.state_view = StateView(redis_client)
         self._setup_handlers()
     
     def _setup_handlers(self):
         """Set up event handlers"""
-        self.consumer.register_handler("order.created", self._handle_order_created)
-        self.consumer.register_handler("order.supplier_accepted", self._handle_supplier_accepted)
-        self.consumer.register_handler("order.customer_accepted", self._handle_customer_accepted)
-        self.consumer.register_handler("order.dispatched", self._handle_order_dispatched)
-        self.consumer.register_handler("order.delivered", self._handle_order_delivered)
-    
-    async def _handle_order_created(self, event_data: dict):
-        """Handle order creation events"""
-        order = event_data.get("order", {})
-        logger.info(f"Order created: {order.get('id')} - {order.get('pizza_name')} from {order.get('supplier_name')}")
-        
-        # Could trigger notifications, update metrics, etc.
-        await self._update_order_metrics("created")
-    
-    async def _handle_supplier_accepted(self, event_data: dict):
-        """Handle supplier acceptance events"""
-        order = event_data.get("order", {})
-        logger.info(f"Supplier accepted order: {order.get('id')}")
-        
-        await self._update_order_metrics("supplier_accepted")
-    
-    async def _handle_customer_accepted(self, event_data: dict):
-        """Handle customer acceptance events"""
-        order = event_data.get("order", {})
-        logger.info(f"Customer accepted order: {order.get('id')}")
-        
-        await self._update_order_metrics("customer_accepted")
+        # Status changes without metrics only need to reach the read model
+        event_types = list(self.METRIC_EVENTS) + [f"order.{status.value}" for status in OrderStatus]
+        for event_type in dict.fromkeys(event_types):
+            self.consumer.register_batch_handler(event_type, self._handle_events)
     
-    async def _handle_order_dispatched(self, event_data: dict):
-        """Handle order dispatch events"""
-        order = event_data.get("order", {})
-        logger.info(f"Order dispatched: {order.get('id')} - Driver: {order.get('driver_name')}")
-        
-        await self._update_order_metrics("dispatched")
+    async def _handle_events(self, events: List[dict], pipe) -> List[int]:
+        """Handle a batch of order events, queuing the read model updates on the pipeline"""
+        for event_data in events:
+            self._log_event(event_data)
+            event_type = event_data.get("event_type")
+            if event_type in self.METRIC_EVENTS:
+                # Could trigger notifications, update metrics, etc.
+                await self._update_order_metrics(event_type.replace("order.", "", 1))
+        # Replayed or out-of-date events change nothing and keep the caches
+        return self.state_view.stage_events(pipe, events, invalidate=True)
     
-    async def _handle_order_delivered(self, event_data: dict):
-        """Handle order delivery events"""
+    def _log_event(self, event_data: dict):
         order = event_data.get("order", {})
-        logger.info(f"Order delivered: {order.get('id')}")
-        
-        await self._update_order_metrics("delivered")
+        event_type = event_data.get("event_type")
+        if event_type == "order.created":
+            logger.info(f"Order created: {order.get('id')} - {order.get('pizza_name')} from {order.get('supplier_name')}")
+        elif event_type == "order.dispatched":
+            logger.info(f"Order dispatched: {order.get('id')} - Driver: {order.get('driver_name')}")
+        else:
+            logger.info(f"Order {order.get('id')} is now {order.get('status')}")
     
     async def _update_order_metrics(self, event_type: str):
         """Update metrics based on event type"""
@@ -158,8 +630,16 @@ class EventProcessor:
         # For now, just log the metric update
         logger.info(f"Updating metrics for event: {event_type}")
     
-    async def start(self):
-        """Start the event processor"""
+    async def start(self, per_worker: bool = False):
+        """
+        Start the event processor
+        
+        Args:
+            per_worker: Claim a worker slot for the consumer name first, for
+                consumers embedded in API workers (see claim_worker_name)
+        """
+        if per_worker:
+            await self.consumer.claim_worker_name()
         await self.consumer.start_consuming()
     
     async def stop(self):
@@ -167,4 +647,39 @@ class EventProcessor:
         await self.consumer.stop_consuming()
 
 # Global event processor instance
-event_processor = EventProcessor(redis_client)
\ No newline at end of file
+event_processor = EventProcessor(redis_client)
+
+
+async def run_standalone(consumer_name: Optional[str] = None, workers: Optional[int] = None):
+    """
+    Run the event processor as its own process until SIGINT/SIGTERM
+    
+    Lets event processing scale independently of the API: start as many
+    of these as needed (each with its own stable name) and set
+    STREAM_CONSUMER_EMBEDDED=false on the API processes.
+    """
+    if consumer_name:
+        event_processor.consumer.base_name = event_processor.consumer.consumer_name = consumer_name
+    if workers:
+        event_processor.consumer.workers = workers
+    
+    await redis_client.connect()
+    try:
+        await event_processor.state_view.ensure_built()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, lambda: asyncio.ensure_future(event_processor.stop()))
+        logger.info("Stream consumer %s running", event_processor.consumer.consumer_name)
+        await event_processor.start()
+    finally:
+        await redis_client.disconnect()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Process order events from the Redis stream")
+    parser.add_argument("--name", help="Consumer name, stable across restarts and unique per process "
+                                       "(default: STREAM_CONSUMER_NAME or the hostname)")
+    parser.add_argument("--workers", type=int, help="Concurrent handlers (default: STREAM_CONSUMER_WORKERS)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_standalone(args.name, args.workers))
\ No newline at end of file
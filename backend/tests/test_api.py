@@ -174,3 +174,98 @@ async def test_invalid_order_id(client):
     )
     
     assert response.status_code == 404
+
+@pytest.mark.asyncio
+async def test_stale_expected_version_returns_conflict(client):
+    """Transitions against an outdated version are rejected with 409"""
+    response = await client.post("/api/orders", json={
+        "supplier_name": "Test Pizza",
+        "pizza_name": "Margherita",
+        "supplier_price": 10.0
+    })
+    order_id = response.json()["order"]["id"]
+    
+    response = await client.post(
+        f"/api/orders/{order_id}/supplier-respond",
+        params={"accept": True, "expected_version": 1}
+    )
+    assert response.status_code == 200
+    
+    response = await client.post(
+        f"/api/orders/{order_id}/status",
+        params={"status": "cancelled", "expected_version": 1}
+    )
+    assert response.status_code == 409
+    assert response.json()["current_version"] == 2
+
+@pytest.mark.asyncio
+async def test_orders_conditional_get(client):
+    """Polling /api/orders with If-None-Match returns 304 until an order changes"""
+    response = await client.post("/api/orders", json={
+        "supplier_name": "Test Pizza",
+        "pizza_name": "Margherita",
+        "supplier_price": 10.0
+    })
+    order_id = response.json()["order"]["id"]
+    
+    response = await client.get("/api/orders")
+    etag = response.headers["ETag"]
+    
+    response = await client.get("/api/orders", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    
+    await client.post(f"/api/orders/{order_id}/supplier-respond", params={"accept": True})
+    response = await client.get("/api/orders", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert response.json()[0]["status"] == "supplier_accepted"
+
+@pytest.mark.asyncio
+async def test_state_conditional_get(client):
+    """Polling /api/state with If-None-Match returns 304 until the state generation moves"""
+    from services.cache_invalidation import bump_generation
+    import main
+    
+    response = await client.get("/api/state")
+    etag = response.headers["ETag"]
+    
+    response = await client.get("/api/state", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    
+    await bump_generation(main.redis_client)
+    response = await client.get("/api/state", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert "statistics" in response.json()
+
+@pytest.mark.asyncio
+async def test_state_endpoints_served_from_read_model(events_client, consume_events):
+    """With STATE_SOURCE=events, /api/state reflects the events once consumed"""
+    order_ids = []
+    for pizza in ("Margherita", "Pepperoni"):
+        response = await events_client.post("/api/orders", json={
+            "supplier_name": "Test Pizza",
+            "pizza_name": pizza,
+            "supplier_price": 10.0,
+            "markup_percentage": 30.0
+        })
+        order_ids.append(response.json()["order"]["id"])
+    await events_client.post(f"/api/orders/{order_ids[0]}/dispatch", params={"driver_name": "Mike Driver"})
+    
+    response = await events_client.get("/api/state")
+    assert response.json()["statistics"]["total_orders"] == 0
+    etag = response.headers["ETag"]
+    
+    await consume_events()
+    
+    response = await events_client.get("/api/state", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["statistics"]["total_orders"] == 2
+    assert data["statistics"]["dispatched"] == 1
+    assert [(d["driver_name"], d["order_id"]) for d in data["active_drivers"]] == [("Mike Driver", order_ids[0])]
+    
+    response = await events_client.get("/api/state/orders", params={"status": "pending_supplier"})
+    assert response.status_code == 200
+    assert [o["id"] for o in response.json()["pending_supplier"]] == [order_ids[1]]
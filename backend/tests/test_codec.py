@@ -0,0 +1,84 @@
+import pytest
+from models import PizzaOrder, OrderStatus, SystemStatistics
+from config import settings
+from services.codec import get_codec, decode_stream_data
+from services.order_service import OrderService, EVENT_STREAM
+from services.state_service import StateService, CachedStateService
+from services.stream_consumer import StreamConsumer
+
+CODEC_NAMES = ["json", "orjson", "msgpack"]
+
+
+@pytest.mark.parametrize("name", CODEC_NAMES)
+def test_codec_round_trips_models(name):
+    """Every codec restores the model it encoded"""
+    codec = get_codec(name)
+    order = PizzaOrder(
+        id="codec-order",
+        supplier_name="Codec Pizza",
+        pizza_name="Margherita",
+        supplier_price=10.0,
+        status=OrderStatus.READY,
+        supplier_notes="Crème fraîche"
+    )
+
+    assert codec.load_model(PizzaOrder, codec.dump_model(order)) == order
+    assert codec.loads(codec.dumps({"count": 3, "missing": None})) == {"count": 3, "missing": None}
+
+
+def test_unknown_codec_rejected():
+    with pytest.raises(ValueError, match="Unknown serialization codec"):
+        get_codec("yaml")
+
+
+def test_entries_without_header_decode_as_json():
+    """Stream entries written before the codec header existed are JSON"""
+    assert decode_stream_data({"event_type": "order.created", "data": '{"order": {"id": "old"}}'}) == {
+        "order": {"id": "old"}
+    }
+
+
+def test_newer_codec_version_rejected():
+    with pytest.raises(ValueError, match="Unsupported json codec version"):
+        decode_stream_data({"codec": "json", "codec_version": "2", "data": "{}"})
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("name", CODEC_NAMES)
+async def test_consumer_reads_entries_from_any_codec(name, monkeypatch, mock_redis):
+    """Producer and consumer agree through the entry header"""
+    monkeypatch.setattr(settings, "serialization_codec", name)
+    event = await OrderService(mock_redis).create_order(
+        PizzaOrder(supplier_name="Codec Pizza", pizza_name="Margherita", supplier_price=10.0)
+    )
+
+    entries = await mock_redis.client.xrange(EVENT_STREAM)
+    assert entries[0][1]["codec"] == name
+
+    received = []
+    consumer = StreamConsumer(redis=mock_redis)
+
+    async def handler(event_data):
+        received.append(event_data)
+
+    consumer.register_handler("order.created", handler)
+    await consumer._process_message(entries[0][0], entries[0][1])
+
+    assert received[0]["order"]["id"] == event.order.id
+    assert received[0]["order"]["status"] == OrderStatus.PENDING_SUPPLIER.value
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("name", CODEC_NAMES)
+async def test_cached_state_uses_configured_codec(name, monkeypatch, mock_redis, mocker):
+    """Cached statistics are written and read back with the configured codec"""
+    monkeypatch.setattr(settings, "serialization_codec", name)
+    base = StateService(mock_redis)
+    cached = CachedStateService(base, mock_redis, cache_ttl=60)
+    fresh = await cached.get_statistics()
+
+    spy = mocker.spy(base, "get_statistics")
+    assert await cached.get_statistics() == fresh
+    spy.assert_not_called()
+    assert await mock_redis.client.exists(f"state_cache:{name}:statistics")
+    assert isinstance(fresh, SystemStatistics)
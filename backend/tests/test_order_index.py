@@ -0,0 +1,222 @@
+import pytest
+import json
+from datetime import datetime, timedelta
+from models import PizzaOrder, OrderStatus
+from services.order_index import (
+    order_key,
+    status_index_key,
+    rebuild_indexes,
+    COMPLETED_INDEX_KEY,
+    TRACKING_INDEX_KEY,
+    ACTIVE_DRIVERS_KEY,
+)
+from services.state_service import StateService
+
+
+async def _deliver(order_service, order_id: str, driver_name: str = "Test Driver"):
+    await order_service.supplier_respond(order_id, accept=True)
+    await order_service.customer_accept(order_id, "Jane", "1 Test St")
+    await order_service.dispatch_order(order_id, driver_name)
+    await order_service.update_status(order_id, OrderStatus.IN_TRANSIT)
+    await order_service.update_status(order_id, OrderStatus.DELIVERED)
+
+
+@pytest.mark.asyncio
+async def test_save_order_indexes_status(create_order, mock_redis):
+    """New orders are indexed under their initial status"""
+    order_id = await create_order()
+
+    members = await mock_redis.client.zrange(status_index_key(OrderStatus.PENDING_SUPPLIER), 0, -1)
+    assert members == [order_id]
+
+
+@pytest.mark.asyncio
+async def test_transition_moves_order_between_status_indexes(order_service, create_order, mock_redis):
+    """A transition removes the order from its old status index"""
+    order_id = await create_order()
+
+    await order_service.supplier_respond(order_id, accept=True)
+
+    assert await mock_redis.client.zcard(status_index_key(OrderStatus.PENDING_SUPPLIER)) == 0
+    assert await mock_redis.client.zscore(status_index_key(OrderStatus.SUPPLIER_ACCEPTED), order_id) is not None
+
+
+@pytest.mark.asyncio
+async def test_delivered_orders_tracked_in_completed_index(order_service, create_order, mock_redis):
+    """Delivering an order records it in the completed index"""
+    order_id = await create_order()
+    await _deliver(order_service, order_id)
+
+    assert await mock_redis.client.zscore(COMPLETED_INDEX_KEY, order_id) is not None
+
+    await order_service.update_status(order_id, OrderStatus.CANCELLED)
+    assert await mock_redis.client.zscore(COMPLETED_INDEX_KEY, order_id) is None
+
+
+@pytest.mark.asyncio
+async def test_statistics_read_from_indexes(order_service, create_order, create_orders, mock_redis):
+    """Statistics are derived from index cardinalities"""
+    await create_orders(3)
+    await _deliver(order_service, await create_order("Delivered"))
+
+    stats = await StateService(mock_redis).get_statistics()
+
+    assert stats.total_orders == 4
+    assert stats.pending_supplier == 3
+    assert stats.delivered == 1
+    assert stats.completed_today == 1
+    assert stats.active_deliveries == 0
+
+
+@pytest.mark.asyncio
+async def test_backdated_delivery_not_completed_today(order_service, create_order, mock_redis):
+    """A delivery recorded in the past is scored at that time, not today"""
+    order_id = await create_order()
+    await order_service.supplier_respond(order_id, accept=True)
+    await order_service.customer_accept(order_id, "Jane", "1 Test St")
+    await order_service.dispatch_order(order_id, "Test Driver")
+    await order_service.update_status(order_id, OrderStatus.IN_TRANSIT)
+    await order_service.update_status(
+        order_id, OrderStatus.DELIVERED, timestamp=datetime.utcnow() - timedelta(days=5)
+    )
+
+    stats = await StateService(mock_redis).get_statistics()
+
+    assert stats.delivered == 1
+    assert stats.completed_today == 0
+
+
+@pytest.mark.asyncio
+async def test_orders_by_status_limit_returns_newest(create_orders, mock_redis):
+    """The per-status limit keeps the newest orders"""
+    ids = await create_orders(4)
+
+    orders_by_status = await StateService(mock_redis).get_orders_by_status(limit=2)
+
+    pending = orders_by_status[OrderStatus.PENDING_SUPPLIER.value]
+    assert [o["id"] for o in pending] == [ids[3], ids[2]]
+
+
+@pytest.mark.asyncio
+async def test_rebuild_indexes_backfills_existing_orders(mock_redis):
+    """Orders stored without indexes are picked up by the backfill"""
+    order = PizzaOrder(
+        id="legacy-order",
+        supplier_name="Legacy Pizza",
+        pizza_name="Margherita",
+        supplier_price=10.0,
+        status=OrderStatus.PREPARING,
+        created_at=datetime.utcnow(),
+        updated_at=datetime.utcnow()
+    )
+    await mock_redis.client.set(order_key(order.id), json.dumps(order.model_dump(mode='json')))
+
+    indexed = await rebuild_indexes(mock_redis.client)
+
+    assert indexed == 1
+    assert await mock_redis.client.zrange(status_index_key(OrderStatus.PREPARING), 0, -1) == ["legacy-order"]
+
+
+@pytest.mark.asyncio
+async def test_rebuild_indexes_backfills_tracking_ids(mock_redis, order_service):
+    """Legacy orders become trackable after the backfill"""
+    order = PizzaOrder(
+        id="legacy-tracked",
+        tracking_id="PIZZA-2023-123456",
+        supplier_tracking_id="LP-1234",
+        supplier_name="Legacy Pizza",
+        pizza_name="Margherita",
+        supplier_price=10.0,
+        status=OrderStatus.PENDING_SUPPLIER,
+        created_at=datetime.utcnow(),
+        updated_at=datetime.utcnow()
+    )
+    await mock_redis.client.set(order_key(order.id), json.dumps(order.model_dump(mode='json')))
+    assert await order_service.get_order_by_tracking_id("PIZZA-2023-123456") is None
+
+    await rebuild_indexes(mock_redis.client)
+
+    found = await order_service.get_order_by_tracking_id("LP-1234")
+    assert found["id"] == "legacy-tracked"
+
+
+@pytest.mark.asyncio
+async def test_tracking_ids_indexed_on_create(order_service, create_order, mock_redis):
+    """Both tracking IDs resolve to the order without scanning"""
+    order = await order_service.orders.get(await create_order())
+
+    tracking_index = await mock_redis.client.hgetall(TRACKING_INDEX_KEY)
+    assert tracking_index == {order["tracking_id"]: order["id"], order["supplier_tracking_id"]: order["id"]}
+
+    found = await order_service.get_order_by_tracking_id(order["supplier_tracking_id"])
+    assert found["id"] == order["id"]
+    assert await order_service.get_order_by_tracking_id("PIZZA-0000-000000") is None
+
+
+@pytest.mark.asyncio
+async def test_system_state_shares_one_snapshot(order_service, create_orders, mock_redis, mocker):
+    """A state rebuild fetches the order documents once for all three views"""
+    ids = await create_orders(3)
+    await order_service.dispatch_order(ids[0], "Snapshot Driver")
+    state_service = StateService(mock_redis)
+    get_many_spy = mocker.spy(state_service.orders, "get_many")
+
+    state = await state_service.get_system_state(limit=1)
+
+    get_many_spy.assert_called_once()
+    assert state.statistics == await state_service.get_statistics()
+    assert state.orders_by_status == await state_service.get_orders_by_status(limit=1)
+    assert [d.order_id for d in state.active_drivers] == [ids[0]]
+
+
+@pytest.mark.asyncio
+async def test_orders_by_status_pages_with_offset(order_service, create_orders, mock_redis):
+    """Offset pages through one status column, newest first"""
+    ids = await create_orders(5)
+    await order_service.supplier_respond(ids[0], accept=True)
+
+    state_service = StateService(mock_redis)
+    pending = OrderStatus.PENDING_SUPPLIER.value
+    first = await state_service.get_orders_by_status(limit=2, status=OrderStatus.PENDING_SUPPLIER)
+    second = await state_service.get_orders_by_status(limit=2, offset=2, status=OrderStatus.PENDING_SUPPLIER)
+
+    assert list(first) == [pending]
+    assert [o["id"] for o in first[pending]] == [ids[4], ids[3]]
+    assert [o["id"] for o in second[pending]] == [ids[2], ids[1]]
+
+
+@pytest.mark.asyncio
+async def test_active_driver_registry_follows_transitions(order_service, create_orders, mock_redis):
+    """Dispatch adds an assignment, delivery and cancellation remove it"""
+    ids = await create_orders(2)
+    for order_id in ids:
+        await order_service.supplier_respond(order_id, accept=True)
+        await order_service.customer_accept(order_id, "Jane", "1 Test St")
+        await order_service.dispatch_order(order_id, "Busy Driver")
+    state_service = StateService(mock_redis)
+
+    assert await state_service.get_driver_load("Busy Driver") == 2
+    drivers = await state_service.get_active_drivers()
+    assert [(d.driver_name, d.order_id) for d in drivers] == [("Busy Driver", ids[1])]
+
+    await order_service.update_status(ids[1], OrderStatus.IN_TRANSIT)
+    await order_service.update_status(ids[1], OrderStatus.DELIVERED)
+    assert await state_service.get_driver_load("Busy Driver") == 1
+    assert [d.order_id for d in await state_service.get_active_drivers()] == [ids[0]]
+
+    await order_service.update_status(ids[0], OrderStatus.CANCELLED)
+    assert await state_service.get_driver_load("Busy Driver") == 0
+    assert await mock_redis.client.hgetall(ACTIVE_DRIVERS_KEY) == {}
+
+
+@pytest.mark.asyncio
+async def test_rebuild_indexes_backfills_driver_registry(order_service, create_order, mock_redis):
+    """Active deliveries stored before the registry existed are picked up by the backfill"""
+    order_id = await create_order()
+    await order_service.dispatch_order(order_id, "Legacy Driver")
+    await mock_redis.client.delete(ACTIVE_DRIVERS_KEY)
+
+    await rebuild_indexes(mock_redis.client)
+
+    drivers = await StateService(mock_redis).get_active_drivers()
+    assert [(d.driver_name, d.order_id, d.status) for d in drivers] == [("Legacy Driver", order_id, "dispatched")]
@@ -0,0 +1,95 @@
+import pytest
+from models import OrderStatus
+from services.order_index import CREATED_INDEX_KEY
+
+
+@pytest.mark.asyncio
+async def test_list_orders_pages_newest_first(order_service, create_orders):
+    """Pages walk the created_at index from newest to oldest without overlap"""
+    ids = await create_orders(5)
+
+    first, cursor = await order_service.list_orders(limit=2)
+    second, cursor = await order_service.list_orders(cursor=cursor, limit=2)
+    third, cursor = await order_service.list_orders(cursor=cursor, limit=2)
+
+    assert [o["id"] for o in first + second + third] == list(reversed(ids))
+    assert cursor is None
+
+
+@pytest.mark.asyncio
+async def test_list_orders_handles_identical_timestamps(order_service, create_orders, mock_redis):
+    """Orders sharing a created_at score are neither skipped nor repeated"""
+    ids = await create_orders(5)
+    await mock_redis.client.zadd(CREATED_INDEX_KEY, {order_id: 1000.0 for order_id in ids})
+
+    seen = []
+    cursor = None
+    while True:
+        page, cursor = await order_service.list_orders(cursor=cursor, limit=2)
+        seen.extend(o["id"] for o in page)
+        if cursor is None:
+            break
+
+    assert sorted(seen) == sorted(ids)
+
+
+@pytest.mark.asyncio
+async def test_list_orders_filters(order_service, create_orders):
+    """Status, supplier and driver filters can be combined"""
+    ids = await create_orders(3, supplier_name="Filter Pizza")
+    await create_orders(2, supplier_name="Other Pizza")
+
+    await order_service.dispatch_order(ids[0], "Filter Driver")
+    await order_service.dispatch_order(ids[1], "Filter Driver")
+    await order_service.update_status(ids[1], OrderStatus.IN_TRANSIT)
+
+    by_supplier, _ = await order_service.list_orders(supplier_name="Filter Pizza")
+    assert {o["id"] for o in by_supplier} == set(ids)
+
+    by_driver, _ = await order_service.list_orders(driver_name="Filter Driver")
+    assert [o["id"] for o in by_driver] == [ids[1], ids[0]]
+
+    combined, _ = await order_service.list_orders(
+        status=OrderStatus.DISPATCHED, supplier_name="Filter Pizza", driver_name="Filter Driver"
+    )
+    assert [o["id"] for o in combined] == [ids[0]]
+
+
+@pytest.mark.asyncio
+async def test_driver_reassignment_updates_driver_index(order_service, create_orders):
+    """Re-dispatching to another driver moves the order between driver indexes"""
+    ids = await create_orders(1)
+
+    await order_service.dispatch_order(ids[0], "First Driver")
+    await order_service.dispatch_order(ids[0], "Second Driver")
+
+    first, _ = await order_service.list_orders(driver_name="First Driver")
+    second, _ = await order_service.list_orders(driver_name="Second Driver")
+    assert first == []
+    assert [o["id"] for o in second] == ids
+
+
+@pytest.mark.asyncio
+async def test_get_orders_endpoint_pagination(client):
+    """GET /api/orders returns a page and the next cursor in a header"""
+    for i in range(3):
+        await client.post(
+            "/api/orders",
+            json={"supplier_name": "Page Pizza", "pizza_name": f"Pizza {i}", "supplier_price": 10.0}
+        )
+
+    response = await client.get("/api/orders", params={"limit": 2})
+    assert response.status_code == 200
+    assert len(response.json()) == 2
+    cursor = response.headers["X-Next-Cursor"]
+
+    response = await client.get("/api/orders", params={"limit": 2, "cursor": cursor})
+    assert [o["pizza_name"] for o in response.json()] == ["Pizza 0"]
+    assert "X-Next-Cursor" not in response.headers
+
+
+@pytest.mark.asyncio
+async def test_get_orders_endpoint_invalid_cursor(client):
+    """Malformed cursors are rejected"""
+    response = await client.get("/api/orders", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
@@ -0,0 +1,136 @@
+import pytest
+from models import PizzaOrder, OrderStatus
+from services.order_repository import OrderRepository, VersionConflictError
+from services.metrics_service import MetricsService
+
+
+@pytest.mark.asyncio
+async def test_get_many_spans_chunks_and_keeps_order(create_orders, mock_redis):
+    """Chunked MGETs return every order in the requested order"""
+    ids = await create_orders(5)
+    repository = OrderRepository(mock_redis, chunk_size=2)
+
+    orders = await repository.get_many(list(reversed(ids)) + ["missing-order"])
+
+    assert list(orders) == list(reversed(ids))
+    assert orders[ids[0]]["pizza_name"] == "Pizza 0"
+
+
+@pytest.mark.asyncio
+async def test_get_all_returns_newest_first(create_orders, mock_redis):
+    """get_all walks the created_at index"""
+    ids = await create_orders(3)
+
+    orders = await OrderRepository(mock_redis, chunk_size=2).get_all()
+
+    assert [o["id"] for o in orders] == list(reversed(ids))
+
+
+@pytest.mark.asyncio
+async def test_metrics_read_through_repository(order_service, create_orders, mock_redis):
+    """Metrics aggregate every stored order"""
+    ids = await create_orders(3)
+    await order_service.dispatch_order(ids[0], "Metrics Driver")
+    await order_service.update_status(ids[0], OrderStatus.DELIVERED)
+
+    metrics = await MetricsService(mock_redis).get_delivery_metrics()
+
+    assert metrics["summary"]["total_orders"] == 3
+    assert metrics["summary"]["total_delivered"] == 1
+    assert metrics["by_driver"] == {"Metrics Driver": 1}
+
+
+@pytest.mark.asyncio
+async def test_fast_write_mode_issues_no_read_back(mock_redis, mocker):
+    """The default write path trusts the SET reply"""
+    order = PizzaOrder(id="fast-order", supplier_name="Repo Pizza", pizza_name="Margherita", supplier_price=10.0)
+    get_spy = mocker.spy(mock_redis.client, "get")
+
+    await OrderRepository(mock_redis, write_mode="fast").save(order)
+
+    get_spy.assert_not_called()
+    assert (await OrderRepository(mock_redis).get("fast-order"))["pizza_name"] == "Margherita"
+
+
+@pytest.mark.asyncio
+async def test_verified_write_mode_reads_back_in_transaction(mock_redis):
+    """Verified writes succeed when the read-back matches"""
+    order = PizzaOrder(id="verified-order", supplier_name="Repo Pizza", pizza_name="Margherita", supplier_price=10.0)
+
+    await OrderRepository(mock_redis, write_mode="verified").save(order)
+
+    assert (await OrderRepository(mock_redis).get("verified-order"))["id"] == "verified-order"
+
+
+def test_unknown_write_mode_rejected(mock_redis):
+    """Misconfigured write modes fail fast"""
+    with pytest.raises(ValueError, match="Unknown order write mode"):
+        OrderRepository(mock_redis, write_mode="eventually")
+
+
+@pytest.mark.asyncio
+async def test_every_write_bumps_version(order_service, create_order):
+    """Orders start at version 1 and each transition increments it"""
+    order_id = await create_order()
+    assert (await order_service.orders.get(order_id))["version"] == 1
+
+    accepted = await order_service.supplier_respond(order_id, accept=True)
+    assert accepted.order.version == 2
+
+    updated = await order_service.update_order(order_id, lambda o: setattr(o, "supplier_notes", "Extra cheese"))
+    assert updated.version == 3
+
+
+@pytest.mark.asyncio
+async def test_stale_expected_version_rejected(order_service, create_order, mock_redis):
+    """A transition based on an old read is refused and counted"""
+    order_id = await create_order()
+    await order_service.supplier_respond(order_id, accept=True, expected_version=1)
+
+    with pytest.raises(VersionConflictError) as exc_info:
+        await order_service.update_status(order_id, OrderStatus.CANCELLED, expected_version=1)
+
+    assert exc_info.value.current_version == 2
+    assert (await OrderRepository(mock_redis).get(order_id))["status"] == OrderStatus.SUPPLIER_ACCEPTED.value
+    assert await OrderRepository(mock_redis).get_version_conflicts() == 1
+
+
+@pytest.mark.asyncio
+async def test_save_rejects_stale_previous(order_service, create_order, mock_redis):
+    """Compare-and-set saves fail if the order moved on since it was read"""
+    order_id = await create_order()
+    stale = await order_service._get_order(order_id)
+    await order_service.supplier_respond(order_id, accept=True)
+
+    changed = stale.model_copy(update={"supplier_notes": "Lost update"})
+    with pytest.raises(VersionConflictError):
+        await OrderRepository(mock_redis).save(changed, stale)
+
+    assert (await OrderRepository(mock_redis).get(order_id))["supplier_notes"] is None
+
+
+@pytest.mark.asyncio
+async def test_update_order_retries_after_conflict(order_service, create_order):
+    """A lost race is retried against the fresh order"""
+    order_id = await create_order()
+    attempts = []
+
+    def mutate(order):
+        attempts.append(order.version)
+        order.supplier_notes = "Ring the bell"
+
+    original_save = order_service._save_order
+
+    async def racing_save(order, previous=None):
+        if len(attempts) == 1:
+            # A concurrent writer lands between the read and the write
+            await order_service.supplier_respond(order_id, accept=True)
+        await original_save(order, previous)
+
+    order_service._save_order = racing_save
+    updated = await order_service.update_order(order_id, mutate)
+
+    assert attempts == [1, 2]
+    assert updated.version == 3
+    assert updated.status == OrderStatus.SUPPLIER_ACCEPTED
+    assert updated.supplier_notes == "Ring the bell"
@@ -1,4 +1,6 @@
 import pytest
+import asyncio
+import json
 from models import PizzaOrder, OrderStatus
 
 @pytest.mark.asyncio
@@ -208,3 +210,69 @@ async def test_get_all_orders(order_service):
     
     assert len(orders) == 3
     assert all('pizza_name' in order for order in orders)
+
+@pytest.mark.asyncio
+async def test_transition_is_single_server_side_call(order_service, mock_redis, mocker):
+    """A transition runs as one EVALSHA with no client-side reads or writes"""
+    order = PizzaOrder(supplier_name="Test Pizza", pizza_name="Margherita", supplier_price=10.0)
+    create_event = await order_service.create_order(order)
+    await order_service.orders.load_scripts()
+    
+    evalsha = mocker.spy(mock_redis.client, "evalsha")
+    get = mocker.spy(mock_redis.client, "get")
+    
+    await order_service.supplier_respond(create_event.order.id, accept=True)
+    
+    assert evalsha.call_count == 1
+    get.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_transition_publishes_event_to_stream(order_service, mock_redis):
+    """The transition script appends the full event to the stream"""
+    order = PizzaOrder(supplier_name="Test Pizza", pizza_name="Margherita", supplier_price=10.0)
+    create_event = await order_service.create_order(order)
+    order_id = create_event.order.id
+    
+    await order_service.dispatch_order(order_id, "Stream Driver")
+    
+    entries = await mock_redis.read_stream("pizza_orders_stream")
+    _, fields = entries[-1]
+    assert fields["event_type"] == "order.dispatched"
+    assert fields["order_id"] == order_id
+    data = json.loads(fields["data"])
+    assert data["order"]["driver_name"] == "Stream Driver"
+    assert data["order"]["status"] == "dispatched"
+
+@pytest.mark.asyncio
+async def test_transition_unknown_order(order_service):
+    """Transitions on missing orders raise ValueError"""
+    with pytest.raises(ValueError, match="not found"):
+        await order_service.update_status("missing-order", OrderStatus.READY)
+
+@pytest.mark.asyncio
+async def test_transition_reloads_flushed_script(order_service, mock_redis):
+    """EVALSHA falls back to SCRIPT LOAD when the script cache was flushed"""
+    order = PizzaOrder(supplier_name="Test Pizza", pizza_name="Margherita", supplier_price=10.0)
+    create_event = await order_service.create_order(order)
+    await mock_redis.client.script_flush()
+    
+    event = await order_service.update_status(create_event.order.id, OrderStatus.PREPARING)
+    
+    assert event.order.status == OrderStatus.PREPARING
+
+@pytest.mark.asyncio
+async def test_concurrent_transitions_do_not_clobber(order_service):
+    """Concurrent transitions each apply their own fields"""
+    order = PizzaOrder(supplier_name="Test Pizza", pizza_name="Margherita", supplier_price=10.0)
+    create_event = await order_service.create_order(order)
+    order_id = create_event.order.id
+    
+    await asyncio.gather(
+        order_service.supplier_respond(order_id, accept=True, notes="On it", estimated_time=20),
+        order_service.dispatch_order(order_id, "Race Driver")
+    )
+    
+    final = await order_service._get_order(order_id)
+    assert final.driver_name == "Race Driver"
+    assert final.supplier_notes == "On it"
+    assert final.estimated_delivery_time == 20
@@ -0,0 +1,117 @@
+import pytest
+from models import OrderStatus
+from config import settings
+from migrate_order_storage import migrate_orders
+from services.order_index import order_key, status_index_key, rebuild_indexes
+from services.order_repository import OrderRepository
+from services.metrics_service import MetricsService
+from services.state_service import StateService
+
+
+@pytest.fixture
+def hash_storage(monkeypatch):
+    monkeypatch.setattr(settings, "order_storage_mode", "hash")
+
+
+@pytest.fixture(params=["json", "hash"])
+def storage_mode(request, monkeypatch):
+    monkeypatch.setattr(settings, "order_storage_mode", request.param)
+    return request.param
+
+
+@pytest.mark.asyncio
+async def test_hash_mode_stores_orders_as_hashes(hash_storage, order_service, create_order, mock_redis):
+    """Orders round-trip through the hash layout, including script transitions"""
+    order_id = await create_order()
+
+    await order_service.supplier_respond(order_id, accept=True, estimated_time=25)
+    await order_service.customer_accept(order_id, "Jane", "1 Test St")
+    await order_service.dispatch_order(order_id, "Hash Driver")
+
+    assert await mock_redis.client.type(order_key(order_id)) == "hash"
+    assert await mock_redis.client.hget(order_key(order_id), "driver_name") == '"Hash Driver"'
+
+    order = await order_service._get_order(order_id)
+    assert order.status == OrderStatus.DISPATCHED
+    assert order.customer_price == 13.0
+    assert order.estimated_delivery_time == 25
+    assert order.version == 4
+    assert order.supplier_notes is None
+
+
+@pytest.mark.asyncio
+async def test_hash_mode_update_writes_changed_fields_only(hash_storage, order_service, create_order, mock_redis, mocker):
+    """A save in hash mode sends only the fields that differ"""
+    order_id = await create_order()
+    hset_calls = []
+    original_pipeline = mock_redis.client.pipeline
+
+    def recording_pipeline(*args, **kwargs):
+        pipe = original_pipeline(*args, **kwargs)
+        original_hset = pipe.hset
+
+        def hset(name, *hset_args, mapping=None, **hset_kwargs):
+            if name == order_key(order_id):
+                hset_calls.append(mapping)
+            return original_hset(name, *hset_args, mapping=mapping, **hset_kwargs)
+
+        pipe.hset = hset
+        return pipe
+
+    mocker.patch.object(mock_redis.client, "pipeline", side_effect=recording_pipeline)
+
+    await order_service.update_order(order_id, lambda o: setattr(o, "supplier_notes", "Extra basil"))
+
+    assert set(hset_calls[0]) == {"supplier_notes", "updated_at", "version"}
+    stored = await order_service.orders.get(order_id)
+    assert stored["supplier_notes"] == "Extra basil"
+    assert stored["pizza_name"] == "Margherita"
+
+
+@pytest.mark.asyncio
+async def test_get_many_projects_fields(storage_mode, order_service, create_order):
+    """Projected reads return the requested fields plus the ID in either layout"""
+    order_id = await create_order()
+
+    orders = await order_service.orders.get_many([order_id, "missing-order"], fields=["status", "driver_name"])
+
+    assert orders == {order_id: {"id": order_id, "status": "pending_supplier", "driver_name": None}}
+
+
+@pytest.mark.asyncio
+async def test_state_and_metrics_in_hash_mode(hash_storage, order_service, create_order, mock_redis):
+    """The dashboard and metrics work on hash-stored orders"""
+    order_id = await create_order()
+    await order_service.dispatch_order(order_id, "Hash Driver")
+
+    drivers = await StateService(mock_redis).get_active_drivers()
+    metrics = await MetricsService(mock_redis).get_delivery_metrics()
+
+    assert [driver.order_id for driver in drivers] == [order_id]
+    assert metrics["summary"]["dispatched"] == 1
+
+
+@pytest.mark.asyncio
+async def test_migration_round_trip(order_service, create_order, mock_redis):
+    """JSON orders convert to hashes and back without losing data"""
+    order_id = await create_order()
+    await order_service.supplier_respond(order_id, accept=True)
+    original = await order_service.orders.get(order_id)
+
+    assert await migrate_orders(mock_redis.client, "hash") == 1
+    assert await mock_redis.client.type(order_key(order_id)) == "hash"
+    assert await OrderRepository(mock_redis, storage_mode="hash").get(order_id) == original
+    assert await migrate_orders(mock_redis.client, "hash") == 0
+
+    assert await migrate_orders(mock_redis.client, "json") == 1
+    assert await order_service.orders.get(order_id) == original
+
+
+@pytest.mark.asyncio
+async def test_rebuild_indexes_reads_hash_orders(hash_storage, create_order, mock_redis):
+    """The index backfill understands the hash layout"""
+    order_id = await create_order()
+    await mock_redis.client.delete(status_index_key(OrderStatus.PENDING_SUPPLIER))
+
+    assert await rebuild_indexes(mock_redis.client) == 1
+    assert await mock_redis.client.zrange(status_index_key(OrderStatus.PENDING_SUPPLIER), 0, -1) == [order_id]
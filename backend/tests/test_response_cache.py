@@ -0,0 +1,62 @@
+import pytest
+import json
+import time
+from models import PizzaOrder
+from services.response_cache import ResponseCache
+from services.state_service import StateService, CachedStateService
+
+
+def test_evicts_least_recently_used():
+    """The entry not read for longest is evicted first"""
+    cache = ResponseCache(max_entries=2, ttl=60)
+    cache.set("a", b"1")
+    cache.set("b", b"2")
+    assert cache.get("a") == b"1"
+    cache.set("c", b"3")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == b"1"
+    assert cache.get("c") == b"3"
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["hits"] == 3
+    assert stats["misses"] == 1
+    assert stats["entries"] == 2
+
+
+def test_entries_expire(mocker):
+    """Entries are dropped once their TTL has passed"""
+    cache = ResponseCache(max_entries=10, ttl=1)
+    cache.set("a", b"1")
+    mocker.patch("services.response_cache.time.monotonic", return_value=time.monotonic() + 2)
+
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1
+    assert cache.stats()["entries"] == 0
+
+
+def test_zero_ttl_disables_cache():
+    cache = ResponseCache(max_entries=10, ttl=0)
+    cache.set("a", b"1")
+    assert cache.get("a") is None
+
+
+@pytest.mark.asyncio
+async def test_state_response_served_from_memory(order_service, mock_redis, mocker):
+    """Repeated reads within the TTL skip Redis and serialization"""
+    await order_service.create_order(
+        PizzaOrder(supplier_name="Memory Pizza", pizza_name="Margherita", supplier_price=10.0)
+    )
+    cached = CachedStateService(StateService(mock_redis), mock_redis, cache_ttl=60)
+    body, _ = await cached.get_system_state_response()
+    redis_read = mocker.spy(mock_redis.client, "hmget")
+
+    assert (await cached.get_system_state_response())[0] == body
+    redis_read.assert_not_called()
+    assert json.loads(body)["statistics"]["total_orders"] == 1
+
+    stats = await cached.get_cache_stats()
+    assert stats["memory"]["hits"] == 1
+    assert stats["memory"]["misses"] == 1
+    assert stats["redis"]["misses"] == 1
+    assert stats["redis"]["rebuilds"] == 1
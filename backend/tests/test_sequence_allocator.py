@@ -0,0 +1,110 @@
+import pytest
+import asyncio
+from datetime import datetime
+from models import PizzaOrder
+from services.order_index import TRACKING_INDEX_KEY
+from services.order_scripts import SEQUENCE_BLOCK_SCRIPT
+from services.sequence_allocator import SequenceAllocator, SUPPLIER_SEQUENCE_PREFIX
+
+
+@pytest.mark.asyncio
+async def test_numbers_served_from_reserved_block(mock_redis, mocker):
+    """A block of numbers costs a single round trip"""
+    allocator = SequenceAllocator(mock_redis, block_size=5)
+    await mock_redis.client.script_load(SEQUENCE_BLOCK_SCRIPT)
+    evalsha_spy = mocker.spy(mock_redis.client, "evalsha")
+
+    numbers = [await allocator.next("counters:test") for _ in range(7)]
+
+    assert numbers == [1, 2, 3, 4, 5, 6, 7]
+    assert evalsha_spy.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_processes_never_share_numbers(mock_redis):
+    """Allocators in different processes reserve disjoint blocks"""
+    first = SequenceAllocator(mock_redis, block_size=3)
+    second = SequenceAllocator(mock_redis, block_size=3)
+
+    numbers = await asyncio.gather(*[
+        allocator.next("counters:test")
+        for _ in range(10)
+        for allocator in (first, second)
+    ])
+
+    assert len(set(numbers)) == 20
+
+
+@pytest.mark.asyncio
+async def test_tracking_ids_are_sequential_per_year(order_service):
+    """Customer tracking IDs count up within the current year"""
+    ids = []
+    for i in range(3):
+        event = await order_service.create_order(
+            PizzaOrder(supplier_name="Sequence Pizza", pizza_name=f"Pizza {i}", supplier_price=10.0)
+        )
+        ids.append(event.order.tracking_id)
+
+    year = datetime.utcnow().year
+    assert ids == [f"PIZZA-{year}-000001", f"PIZZA-{year}-000002", f"PIZZA-{year}-000003"]
+
+
+@pytest.mark.asyncio
+async def test_suppliers_sharing_initials_get_unique_ids(order_service):
+    """Supplier numbers are counted per prefix"""
+    palace = await order_service.create_order(
+        PizzaOrder(supplier_name="Pizza Palace", pizza_name="Margherita", supplier_price=10.0)
+    )
+    place = await order_service.create_order(
+        PizzaOrder(supplier_name="Pizza Place", pizza_name="Margherita", supplier_price=10.0)
+    )
+    other = await order_service.create_order(
+        PizzaOrder(supplier_name="Napoli Express", pizza_name="Margherita", supplier_price=10.0)
+    )
+
+    assert palace.order.supplier_tracking_id == "PP-0001"
+    assert place.order.supplier_tracking_id == "PP-0002"
+    assert other.order.supplier_tracking_id == "NE-0001"
+
+
+@pytest.mark.asyncio
+async def test_skipped_range_is_never_handed_out(mock_redis):
+    """A block reaching the skipped range is dropped and numbering resumes past it"""
+    allocator = SequenceAllocator(mock_redis, block_size=3)
+
+    numbers = [await allocator.next("counters:test", skip=(5, 9)) for _ in range(6)]
+
+    assert numbers == [1, 2, 3, 10, 11, 12]
+
+
+@pytest.mark.asyncio
+async def test_tracking_ids_cost_no_lookups(order_service, mock_redis, mocker):
+    """Creating orders claims no IDs outside the save; existing index entries are kept"""
+    await mock_redis.client.hset(TRACKING_INDEX_KEY, "SP-9999", "legacy-order")
+    hsetnx = mocker.spy(mock_redis.client, "hsetnx")
+
+    event = await order_service.create_order(
+        PizzaOrder(supplier_name="Sequence Pizza", pizza_name="Margherita", supplier_price=10.0)
+    )
+
+    hsetnx.assert_not_called()
+    assert await mock_redis.client.hget(TRACKING_INDEX_KEY, "SP-9999") == "legacy-order"
+    assert await mock_redis.client.hget(TRACKING_INDEX_KEY, event.order.supplier_tracking_id) == event.order.id
+
+
+@pytest.mark.asyncio
+async def test_supplier_numbers_skip_legacy_range(order_service, mock_redis):
+    """Near 1000, supplier numbers jump over the range used by the old random IDs"""
+    await mock_redis.client.set(f"{SUPPLIER_SEQUENCE_PREFIX}SP", 998)
+
+    ids = []
+    for i in range(3):
+        event = await order_service.create_order(
+            PizzaOrder(supplier_name="Sequence Pizza", pizza_name=f"Pizza {i}", supplier_price=10.0)
+        )
+        ids.append(event.order.supplier_tracking_id)
+
+    numbers = [int(tracking_id.split("-")[1]) for tracking_id in ids]
+    assert numbers == sorted(set(numbers))
+    assert all(number >= 10000 for number in numbers)
+
@@ -0,0 +1,233 @@
+import pytest
+import json
+import asyncio
+from models import SystemStatistics
+from services.state_service import StateService, CachedStateService
+from services.cache_invalidation import InvalidationListener, bump_generation
+from services.order_service import EVENT_STREAM
+from services.state_changes import StateChangeFeed
+from services.stream_consumer import EventProcessor
+
+
+def _slow(coro_fn, delay: float = 0.05):
+    """Wrap a loader so concurrent callers overlap"""
+    async def load(*args, **kwargs):
+        await asyncio.sleep(delay)
+        return await coro_fn(*args, **kwargs)
+    return load
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_share_one_rebuild(create_order, mock_redis, mocker):
+    """Only one rebuild runs per cache key in a process"""
+    await create_order()
+    base = StateService(mock_redis)
+    rebuild = mocker.patch.object(base, "get_system_state", side_effect=_slow(base.get_system_state))
+    cached = CachedStateService(base, mock_redis, cache_ttl=60)
+
+    states = await asyncio.gather(*[cached.get_system_state() for _ in range(10)])
+
+    assert rebuild.call_count == 1
+    assert all(state == states[0] for state in states)
+    assert states[0].statistics.total_orders == 1
+
+
+@pytest.mark.asyncio
+async def test_waits_for_rebuild_in_another_worker(mock_redis, mocker):
+    """A worker that loses the lock picks up the winner's result"""
+    winner_base = StateService(mock_redis)
+    winner = CachedStateService(winner_base, mock_redis, cache_ttl=60)
+    loser_base = StateService(mock_redis)
+    loser_rebuild = mocker.spy(loser_base, "get_statistics")
+    loser = CachedStateService(loser_base, mock_redis, cache_ttl=60, lock_poll_interval=0.01)
+
+    lock_key = f"{winner._cache_key('statistics')}:lock"
+    await mock_redis.client.set(lock_key, "other-worker")
+    waiting = asyncio.ensure_future(loser.get_statistics())
+    await asyncio.sleep(0.03)
+    await mock_redis.client.delete(lock_key)
+    expected = await winner.get_statistics()
+
+    assert await waiting == expected
+    loser_rebuild.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_rebuilds_itself_when_lock_holder_stalls(mock_redis, mocker):
+    """Waiting on another worker is bounded by the lock timeout"""
+    base = StateService(mock_redis)
+    rebuild = mocker.spy(base, "get_statistics")
+    cached = CachedStateService(base, mock_redis, cache_ttl=60, lock_timeout=0.05, lock_poll_interval=0.01)
+    await mock_redis.client.set(f"{cached._cache_key('statistics')}:lock", "stalled-worker")
+
+    stats = await cached.get_statistics()
+
+    assert stats.total_orders == 0
+    assert rebuild.call_count == 1
+
+
+async def _age_entry(cached: CachedStateService, name: str, seconds: float):
+    """Pretend a cache entry was built `seconds` ago"""
+    cache_key = cached._cache_key(name)
+    built_at = float(await cached.redis.client.hget(cache_key, "built_at"))
+    await cached.redis.client.hset(cache_key, "built_at", built_at - seconds)
+
+
+@pytest.mark.asyncio
+async def test_stale_entry_served_while_revalidating(create_order, mock_redis, mocker):
+    """Past the soft TTL the old value is returned and refreshed in the background"""
+    base = StateService(mock_redis)
+    cached = CachedStateService(base, mock_redis, cache_ttl=5, max_stale=60)
+    await cached.get_statistics()
+    await create_order("New")
+    await _age_entry(cached, "statistics", 10)
+    rebuild = mocker.spy(base, "get_statistics")
+
+    stale = await cached.get_statistics()
+    assert stale.total_orders == 0
+    await asyncio.sleep(0.01)  # let the background rebuild finish
+
+    assert rebuild.call_count == 1
+    assert (await cached.get_statistics()).total_orders == 1
+    assert rebuild.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_entry_past_max_stale_is_rebuilt_inline(create_order, mock_redis):
+    """Staleness is capped: very old entries make the request wait"""
+    cached = CachedStateService(StateService(mock_redis), mock_redis, cache_ttl=5, max_stale=30)
+    await cached.get_statistics()
+    await create_order("New")
+    await _age_entry(cached, "statistics", 31)
+
+    assert (await cached.get_statistics()).total_orders == 1
+
+
+@pytest.mark.asyncio
+async def test_stale_entry_served_when_rebuild_fails(order_service, mock_redis, mocker):
+    """Entries within the hard TTL cover for a failing rebuild"""
+    base = StateService(mock_redis)
+    cached = CachedStateService(base, mock_redis, cache_ttl=5, max_stale=30, hard_ttl=300)
+    await cached.get_statistics()
+    await _age_entry(cached, "statistics", 60)
+    mocker.patch.object(base, "get_statistics", side_effect=ConnectionError("Redis replica down"))
+
+    assert (await cached.get_statistics()).total_orders == 0
+
+
+@pytest.mark.asyncio
+async def test_refresher_keeps_hot_entries_warm(mock_redis, mocker):
+    """Recently requested entries are rebuilt before they go stale"""
+    base = StateService(mock_redis)
+    cached = CachedStateService(base, mock_redis, cache_ttl=5, max_stale=30)
+    cached.start_refresher(interval=0.01)
+    await cached.get_statistics()
+    await _age_entry(cached, "statistics", 4.99)
+    rebuild = mocker.spy(base, "get_statistics")
+
+    await asyncio.sleep(0.05)
+    await cached.stop_refresher()
+
+    assert rebuild.call_count >= 1
+    _, age, _ = await cached._read(cached._cache_key("statistics"), SystemStatistics)
+    assert age < 1
+
+
+@pytest.mark.asyncio
+async def test_requests_not_tracked_without_refresher(mock_redis):
+    """Without the refresher, requested keys are not retained"""
+    cached = CachedStateService(StateService(mock_redis), mock_redis, cache_ttl=5, max_stale=30)
+
+    for limit in range(1, 20):
+        await cached.get_system_state(limit=limit)
+
+    assert cached._hot == {}
+
+
+@pytest.mark.asyncio
+async def test_order_events_invalidate_cached_state(create_order, mock_redis):
+    """A transition seen by the consumer shows up before the TTL expires"""
+    cached = CachedStateService(StateService(mock_redis), mock_redis, cache_ttl=300, max_stale=300)
+    assert (await cached.get_statistics()).total_orders == 0
+    await create_order()
+    assert (await cached.get_statistics()).total_orders == 0
+
+    processor = EventProcessor(mock_redis)
+    for message_id, message_data in await mock_redis.client.xrange(EVENT_STREAM):
+        await processor.consumer._process_message(message_id, message_data)
+
+    assert (await cached.get_statistics()).total_orders == 1
+
+
+@pytest.mark.asyncio
+async def test_invalidated_entry_served_stale_while_revalidating(create_order, mock_redis, mocker):
+    """An entry from an older generation is stale, not expired: served once, rebuilt in the background"""
+    base = StateService(mock_redis)
+    cached = CachedStateService(base, mock_redis, cache_ttl=300, max_stale=600)
+    await cached.get_statistics()
+    await create_order()
+    await bump_generation(mock_redis)
+    rebuild = mocker.spy(base, "get_statistics")
+
+    assert (await cached.get_statistics()).total_orders == 0
+    await asyncio.sleep(0.01)  # let the background rebuild finish
+
+    assert rebuild.call_count == 1
+    assert (await cached.get_statistics()).total_orders == 1
+    assert cached.redis_stale_hits == 1
+
+
+@pytest.mark.asyncio
+async def test_cached_state_keeps_its_changes_mark(create_order, mock_redis):
+    """A cached state reports the stream position it was built at, not the current one"""
+    cached = CachedStateService(StateService(mock_redis), mock_redis, cache_ttl=300)
+    await create_order("Old")
+    state = await cached.get_system_state()
+    new_id = await create_order("New")
+
+    assert (await cached.get_system_state()).changes_mark == state.changes_mark
+    changes = await StateChangeFeed(mock_redis, cached).get_changes(state.changes_mark)
+    assert [order["id"] for order in changes.orders] == [new_id]
+
+
+@pytest.mark.asyncio
+async def test_stale_state_response_tagged_with_its_generation(create_order, mock_redis):
+    """A body served while revalidating reports the older generation it was built from"""
+    cached = CachedStateService(StateService(mock_redis), mock_redis, cache_ttl=300, max_stale=600)
+    _, built = await cached.get_system_state_response(generation=0)
+    await create_order()
+    generation = await bump_generation(mock_redis)
+
+    body, stale = await cached.get_system_state_response(generation=generation)
+    await asyncio.sleep(0.01)
+    body, fresh = await cached.get_system_state_response(generation=generation)
+
+    assert (built, stale, fresh) == (0, 0, generation)
+    assert json.loads(body)["statistics"]["total_orders"] == 1
+
+
+@pytest.mark.asyncio
+async def test_invalidation_is_broadcast_to_workers(mock_redis):
+    """Every listening worker drops its in-process responses"""
+    cached = CachedStateService(StateService(mock_redis), mock_redis, cache_ttl=300)
+    cached.responses.ttl = 60
+    await cached.get_system_state_response()
+    changed = []
+    listener = InvalidationListener(mock_redis)
+    listener.on_invalidate(cached.clear_responses)
+    listener.on_invalidate(changed.append)
+    listener.start()
+    await asyncio.sleep(0.05)
+
+    try:
+        generation = await bump_generation(mock_redis, "order-1")
+        for _ in range(50):
+            if changed:
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        await listener.stop()
+
+    assert changed == ["order-1"]
+    assert listener.generation == generation
+    assert cached.responses.stats()["entries"] == 0
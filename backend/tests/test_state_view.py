@@ -0,0 +1,234 @@
+import pytest
+from models import OrderStatus
+from services.cache_invalidation import current_generation
+from services.codec import decode_stream_data
+from services.order_service import EVENT_STREAM
+from services.state_changes import StateChangeFeed, parse_stream_id
+from services.state_service import StateService
+from services.state_view import StateView, VIEW_BUILT_KEY, VIEW_DRIVERS_KEY, VIEW_LAYOUT_VERSION
+from services.stream_consumer import EventProcessor
+
+
+async def _consume_group(consumer, mock_redis):
+    """Read and handle everything new for the consumer's group"""
+    messages = await mock_redis.read_stream_group(EVENT_STREAM, consumer.group_name, consumer.consumer_name, count=100)
+    for _, entries in messages or []:
+        await consumer._process_batch(entries)
+
+
+async def _consume(processor: EventProcessor, mock_redis, last_id: str = "-") -> str:
+    """Feed every stream entry after last_id through the processor's handlers"""
+    entries = await mock_redis.client.xrange(EVENT_STREAM, min=last_id)
+    for message_id, message_data in entries:
+        if message_id != last_id:
+            await processor.consumer._process_message(message_id, message_data)
+    return entries[-1][0] if entries else last_id
+
+
+@pytest.mark.asyncio
+async def test_events_maintain_read_model(order_service, create_order, mock_redis):
+    """The read model matches the index-based state after consuming events"""
+    processor = EventProcessor(mock_redis)
+    pending = await create_order("Pending")
+    delivered = await create_order("Delivered")
+    dispatched = await create_order("Dispatched")
+    await order_service.supplier_respond(delivered, accept=True)
+    await order_service.customer_accept(delivered, "Jane", "1 Test St")
+    await order_service.dispatch_order(delivered, "Driver A")
+    await order_service.update_status(delivered, OrderStatus.IN_TRANSIT)
+    await order_service.update_status(delivered, OrderStatus.DELIVERED)
+    await order_service.dispatch_order(dispatched, "Driver B")
+
+    await _consume(processor, mock_redis)
+
+    view_state = await processor.state_view.get_system_state()
+    index_state = await StateService(mock_redis).get_system_state()
+
+    assert view_state.statistics == index_state.statistics
+    assert view_state.statistics.completed_today == 1
+    assert view_state.orders_by_status == index_state.orders_by_status
+    assert [o["id"] for o in view_state.orders_by_status["pending_supplier"]] == [pending]
+    assert [(d.driver_name, d.order_id) for d in view_state.active_drivers] == [("Driver B", dispatched)]
+
+
+@pytest.mark.asyncio
+async def test_redelivered_and_stale_events_are_ignored(order_service, create_order, mock_redis):
+    """Applying an event twice or out of order does not corrupt the counts"""
+    view = StateView(mock_redis)
+    order_id = await create_order()
+    await order_service.supplier_respond(order_id, accept=True)
+    entries = await mock_redis.client.xrange(EVENT_STREAM)
+    created, accepted = [decode_stream_data(data) for _, data in entries]
+
+    assert await view.apply_event(created)
+    assert await view.apply_event(accepted)
+    assert not await view.apply_event(accepted)
+    assert not await view.apply_event(created)
+
+    stats = await view.get_statistics()
+    assert stats.total_orders == 1
+    assert stats.pending_supplier == 0
+
+
+@pytest.mark.asyncio
+async def test_rebuild_bootstraps_existing_orders(order_service, create_order, mock_redis):
+    """Orders created before the view existed are picked up by the rebuild"""
+    order_id = await create_order()
+    await order_service.dispatch_order(order_id, "Driver A")
+    view = StateView(mock_redis)
+
+    await view.ensure_built()
+    assert await view.rebuild() == 0  # already up to date
+
+    stats = await view.get_statistics()
+    drivers = await view.get_active_drivers()
+    assert stats.dispatched == 1
+    assert [d.order_id for d in drivers] == [order_id]
+
+
+@pytest.mark.asyncio
+async def test_event_batch_applied_and_acknowledged_through_one_pipeline(order_service, create_order, mock_redis, mocker):
+    """A batch of events updates the view, bumps the generation per change and is acknowledged together"""
+    processor = EventProcessor(mock_redis)
+    consumer = processor.consumer
+    first = await create_order("First")
+    await create_order("Second")
+    await order_service.supplier_respond(first, accept=True)
+    messages = await mock_redis.read_stream_group(EVENT_STREAM, consumer.group_name, consumer.consumer_name, count=10)
+    entries = messages[0][1]
+    pipeline = mocker.spy(mock_redis.client, "pipeline")
+
+    await consumer._process_batch(entries)
+
+    assert pipeline.call_count == 1
+    assert (await processor.state_view.get_statistics()).total_orders == 2
+    assert await current_generation(mock_redis) == 3
+    assert (await mock_redis.client.xpending(EVENT_STREAM, consumer.group_name))["pending"] == 0
+
+    # Replayed events change nothing and keep the caches
+    await consumer._process_batch(entries)
+    assert await current_generation(mock_redis) == 3
+
+
+
+@pytest.mark.asyncio
+async def test_driver_with_several_orders_stays_active(order_service, create_order, mock_redis):
+    """Delivering one of a driver's orders keeps the driver listed for the others"""
+    processor = EventProcessor(mock_redis)
+    first = await create_order("First")
+    second = await create_order("Second")
+    await order_service.dispatch_order(first, "Driver A")
+    await order_service.dispatch_order(second, "Driver A")
+    await order_service.update_status(first, OrderStatus.IN_TRANSIT)
+    await order_service.update_status(first, OrderStatus.DELIVERED)
+
+    await _consume(processor, mock_redis)
+
+    drivers = await processor.state_view.get_active_drivers()
+    assert [(d.driver_name, d.order_id) for d in drivers] == [("Driver A", second)]
+    assert drivers == await StateService(mock_redis).get_active_drivers()
+
+
+@pytest.mark.asyncio
+async def test_reassigned_order_leaves_previous_driver(order_service, create_order, mock_redis):
+    """An order dispatched again to another driver is no longer listed for the first one"""
+    view = StateView(mock_redis)
+    order_id = await create_order()
+    await order_service.dispatch_order(order_id, "Driver A")
+    dispatched = decode_stream_data((await mock_redis.client.xrange(EVENT_STREAM))[-1][1])
+    reassigned = {**dispatched, "order": {**dispatched["order"], "driver_name": "Driver B",
+                                          "version": dispatched["order"]["version"] + 1}}
+
+    assert await view.apply_event(dispatched)
+    assert await view.apply_event(reassigned)
+
+    drivers = await view.get_active_drivers()
+    assert [(d.driver_name, d.order_id) for d in drivers] == [("Driver B", order_id)]
+
+
+@pytest.mark.asyncio
+async def test_unversioned_events_always_apply(order_service, create_order, mock_redis):
+    """Events of orders stored before versioning (version 0) are not dropped as stale"""
+    view = StateView(mock_redis)
+    order_id = await create_order()
+    await order_service.supplier_respond(order_id, accept=True)
+    created, accepted = [decode_stream_data(data) for _, data in await mock_redis.client.xrange(EVENT_STREAM)]
+    for event in (created, accepted):
+        event["order"]["version"] = 0
+
+    assert await view.apply_event(created)
+    assert await view.apply_event(accepted)
+
+    stats = await view.get_statistics()
+    assert stats.total_orders == 1
+    assert stats.pending_supplier == 0
+
+
+@pytest.mark.asyncio
+async def test_model_with_outdated_layout_is_rebuilt(order_service, create_order, mock_redis):
+    """ensure_built drops a model built with an older layout and rebuilds it"""
+    order_id = await create_order()
+    await order_service.dispatch_order(order_id, "Driver A")
+    await mock_redis.client.hset(VIEW_DRIVERS_KEY, "Driver A", order_id)
+    await mock_redis.client.set(VIEW_BUILT_KEY, "1")
+    view = StateView(mock_redis)
+
+    await view.ensure_built()
+
+    assert await mock_redis.client.get(VIEW_BUILT_KEY) == VIEW_LAYOUT_VERSION
+    assert [(d.driver_name, d.order_id) for d in await view.get_active_drivers()] == [("Driver A", order_id)]
+
+
+@pytest.mark.asyncio
+async def test_event_whose_update_failed_stays_pending(order_service, create_order, mock_redis):
+    """An event is not acknowledged when its read model update fails"""
+    processor = EventProcessor(mock_redis)
+    consumer = processor.consumer
+    await create_order()
+    await mock_redis.client.set("state_view:counts", "not a hash")
+    messages = await mock_redis.read_stream_group(EVENT_STREAM, consumer.group_name, consumer.consumer_name, count=10)
+
+    await consumer._process_batch(messages[0][1])
+
+    assert (await mock_redis.client.xpending(EVENT_STREAM, consumer.group_name))["pending"] == 1
+
+
+@pytest.mark.asyncio
+async def test_changes_mark_precedes_unhandled_events(create_order, mock_redis):
+    """The read model's changes mark stays before events the consumers have not handled yet"""
+    processor = EventProcessor(mock_redis)
+    consumer = processor.consumer
+    await create_order("Handled")
+    await _consume_group(consumer, mock_redis)
+    handled = (await mock_redis.client.xrevrange(EVENT_STREAM, count=1))[0][0]
+    await create_order("Pending")
+    messages = await mock_redis.read_stream_group(EVENT_STREAM, consumer.group_name, consumer.consumer_name, count=10)
+    pending = messages[0][1][0][0]
+    await create_order("Unread")
+
+    state = await processor.state_view.get_system_state()
+    changes = await StateChangeFeed(mock_redis, processor.state_view).get_changes(state.changes_mark)
+
+    assert parse_stream_id(handled) <= parse_stream_id(state.changes_mark) < parse_stream_id(pending)
+    assert state.statistics.total_orders == 1
+    assert [order["pizza_name"] for order in changes.orders] == ["Pending", "Unread"]
+
+    await consumer._process_batch(messages[0][1])
+    await _consume_group(consumer, mock_redis)
+    assert (await processor.state_view.get_system_state()).changes_mark == changes.high_water_mark
+
+
+@pytest.mark.asyncio
+async def test_batch_without_view_updates_is_acknowledged(mock_redis):
+    """Events the view skips (no order ID or status) queue no writes and are still acknowledged"""
+    processor = EventProcessor(mock_redis)
+    consumer = processor.consumer
+    await mock_redis.client.xadd(EVENT_STREAM, {
+        "event_type": "order.created", "order_id": "",
+        "data": '{"event_type": "order.created", "order": {}}'
+    })
+    messages = await mock_redis.read_stream_group(EVENT_STREAM, consumer.group_name, consumer.consumer_name, count=10)
+
+    await consumer._process_batch(messages[0][1])
+
+    assert (await mock_redis.client.xpending(EVENT_STREAM, consumer.group_name))["pending"] == 0
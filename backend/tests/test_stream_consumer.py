@@ -0,0 +1,404 @@
+import pytest
+import asyncio
+import json
+import socket
+from config import settings
+from services.stream_consumer import StreamConsumer, dead_letter_stream
+
+STREAM = "test_consumer_stream"
+GROUP = "test_consumer_group"
+
+
+async def _add_events(mock_redis, order_ids):
+    """Append one order.created event per order ID, returning the entry IDs"""
+    message_ids = []
+    for seq, order_id in enumerate(order_ids):
+        message_ids.append(await mock_redis.client.xadd(STREAM, {
+            "event_type": "order.created",
+            "order_id": order_id,
+            "data": json.dumps({"event_type": "order.created", "order": {"id": order_id}, "seq": seq})
+        }))
+    return message_ids
+
+
+async def _dispatch_all(consumer: StreamConsumer, mock_redis):
+    """Read everything new for the consumer group and hand it to the workers"""
+    messages = await mock_redis.read_stream_group(STREAM, GROUP, consumer.consumer_name, count=100)
+    for _, entries in messages:
+        for message_id, message_data in entries:
+            await consumer.dispatch(message_id, message_data)
+    await consumer.wait_idle()
+
+
+@pytest.mark.asyncio
+async def test_orders_handled_in_parallel_and_in_order(mock_redis):
+    """Events of one order keep their order while different orders overlap"""
+    consumer = StreamConsumer(STREAM, GROUP, workers=4, redis=mock_redis)
+    handled = []
+    running = 0
+    max_running = 0
+
+    async def handler(event_data):
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        # Earlier events of an order take longer, so overtaking would show
+        await asyncio.sleep(0.03 - 0.002 * event_data["seq"])
+        handled.append((event_data["order"]["id"], event_data["seq"]))
+        running -= 1
+
+    consumer.register_handler("order.created", handler)
+    await _add_events(mock_redis, ["a", "b", "c", "d"] * 3)
+
+    await _dispatch_all(consumer, mock_redis)
+    await consumer._drain()
+
+    assert max_running > 1
+    for order_id in "abcd":
+        seqs = [seq for handled_id, seq in handled if handled_id == order_id]
+        assert seqs == sorted(seqs) and len(seqs) == 3
+    pending = await mock_redis.client.xpending(STREAM, GROUP)
+    assert pending["pending"] == 0
+
+
+@pytest.mark.asyncio
+async def test_in_flight_limit_pauses_dispatch(mock_redis):
+    """Dispatch waits once max_in_flight messages are outstanding"""
+    consumer = StreamConsumer(STREAM, GROUP, workers=2, max_in_flight=2, redis=mock_redis)
+    release = asyncio.Event()
+
+    async def handler(event_data):
+        await release.wait()
+
+    consumer.register_handler("order.created", handler)
+    await mock_redis.create_consumer_group(STREAM, GROUP)
+    await _add_events(mock_redis, ["a", "b", "c"])
+    entries = await mock_redis.client.xrange(STREAM)
+
+    await consumer.dispatch(*entries[0])
+    await consumer.dispatch(*entries[1])
+    third = asyncio.ensure_future(consumer.dispatch(*entries[2]))
+    await asyncio.sleep(0.02)
+    assert not third.done()
+
+    release.set()
+    await asyncio.wait_for(third, 1)
+    await consumer._drain()
+
+
+@pytest.mark.asyncio
+async def test_failed_message_is_not_acknowledged(mock_redis):
+    """A handler error leaves the message pending for redelivery"""
+    consumer = StreamConsumer(STREAM, GROUP, workers=2, redis=mock_redis)
+
+    async def handler(event_data):
+        if event_data["order"]["id"] == "bad":
+            raise RuntimeError("boom")
+
+    consumer.register_handler("order.created", handler)
+    bad_id, _ = await _add_events(mock_redis, ["bad", "good"])
+
+    await _dispatch_all(consumer, mock_redis)
+    await consumer._drain()
+
+    pending = await mock_redis.client.xpending_range(STREAM, GROUP, "-", "+", 10)
+    assert [entry["message_id"] for entry in pending] == [bad_id]
+
+
+def test_batch_size_follows_backlog():
+    """Full reads double the batch up to the ceiling, short reads halve it"""
+    consumer = StreamConsumer(STREAM, GROUP, max_batch=50)
+    sizes = []
+    for received in [10, 20, 40, 50, 50, 3, 3, 3]:
+        consumer.batch_size = consumer._next_batch_size(received)
+        sizes.append(consumer.batch_size)
+
+    assert sizes == [20, 40, 50, 50, 50, 25, 12, 10]
+
+
+@pytest.mark.asyncio
+async def test_read_loop_drains_backlog_without_sleeping(mock_redis, mocker, monkeypatch):
+    """A backlog is read back to back in growing batches"""
+    monkeypatch.setattr(settings, "stream_claim_interval", 0)
+    consumer = StreamConsumer(STREAM, GROUP, workers=2, max_batch=40, block_ms=10, redis=mock_redis)
+    handled = []
+
+    async def handler(event_data):
+        handled.append(event_data["seq"])
+        if len(handled) == 70:
+            await consumer.stop_consuming()
+
+    consumer.register_handler("order.created", handler)
+    await _add_events(mock_redis, [f"order-{i}" for i in range(70)])
+    read = mocker.spy(mock_redis, "read_stream_group")
+    sleep = mocker.spy(asyncio, "sleep")
+
+    await asyncio.wait_for(consumer.start_consuming(), 2)
+
+    assert len(handled) == 70
+    new_reads = [call for call in read.call_args_list if call.kwargs.get("start_id", ">") == ">"]
+    assert [call.kwargs["count"] for call in new_reads][:3] == [10, 20, 40]
+    sleep.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_reclaimer_retries_then_dead_letters(mock_redis):
+    """A message that keeps failing is retried, then moved to the dead-letter stream"""
+    consumer = StreamConsumer(STREAM, GROUP, workers=1, claim_idle_ms=1, max_deliveries=2, redis=mock_redis)
+    attempts = []
+
+    async def handler(event_data):
+        attempts.append(event_data["order"]["id"])
+        if event_data["order"]["id"] == "poison":
+            raise RuntimeError("boom")
+
+    consumer.register_handler("order.created", handler)
+    poison_id, _ = await _add_events(mock_redis, ["poison", "fine"])
+    await _dispatch_all(consumer, mock_redis)
+
+    await asyncio.sleep(0.01)
+    assert await consumer.reclaim_pending() == 1
+    await consumer.wait_idle()
+    await asyncio.sleep(0.01)
+    assert await consumer.reclaim_pending() == 0
+    await consumer._drain()
+
+    assert attempts == ["poison", "fine", "poison"]
+    assert (await mock_redis.client.xpending(STREAM, GROUP))["pending"] == 0
+    dead = await mock_redis.client.xrange(dead_letter_stream(STREAM))
+    assert len(dead) == 1
+    assert dead[0][1]["original_id"] == poison_id
+    assert dead[0][1]["deliveries"] == "2"
+    assert dead[0][1]["order_id"] == "poison"
+
+
+@pytest.mark.asyncio
+async def test_undecodable_message_is_dead_lettered(mock_redis):
+    """A message that cannot be decoded goes to the dead-letter stream with its raw fields and the error"""
+    consumer = StreamConsumer(STREAM, GROUP, workers=1, redis=mock_redis)
+    handled = []
+
+    async def handler(event_data):
+        handled.append(event_data["order"]["id"])
+
+    consumer.register_handler("order.created", handler)
+    bad_id = await mock_redis.client.xadd(STREAM, {"event_type": "order.created", "order_id": "bad", "data": "{not json"})
+    await _add_events(mock_redis, ["fine"])
+
+    await _dispatch_all(consumer, mock_redis)
+    await consumer._drain()
+
+    assert handled == ["fine"]
+    assert (await mock_redis.client.xpending(STREAM, GROUP))["pending"] == 0
+    dead = await mock_redis.client.xrange(dead_letter_stream(STREAM))
+    assert len(dead) == 1
+    assert dead[0][1]["original_id"] == bad_id
+    assert dead[0][1]["data"] == "{not json"
+    assert dead[0][1]["error"]
+
+
+@pytest.mark.asyncio
+async def test_dead_letters_replay_and_purge(mock_redis):
+    """inspect_streams moves dead letters back onto the stream or drops them"""
+    from inspect_streams import StreamInspector
+
+    consumer = StreamConsumer(STREAM, GROUP, redis=mock_redis)
+    await mock_redis.create_consumer_group(STREAM, GROUP)
+    await _add_events(mock_redis, ["a", "b"])
+    for message_id, message_data in await mock_redis.client.xrange(STREAM):
+        await consumer._dead_letter(message_id, message_data, 5)
+    inspector = StreamInspector()
+    inspector.redis = mock_redis
+
+    assert await inspector.replay_dead_letters(STREAM, count=1) == 1
+    replayed = (await mock_redis.client.xrevrange(STREAM, count=1))[0][1]
+    assert replayed["order_id"] == "a"
+    assert "original_id" not in replayed
+
+    assert await inspector.purge_dead_letters(STREAM) == 1
+    assert await mock_redis.client.xlen(dead_letter_stream(STREAM)) == 0
+
+
+@pytest.mark.asyncio
+async def test_consumer_name_is_stable_and_configurable(mock_redis, monkeypatch):
+    """An explicit name wins over STREAM_CONSUMER_NAME, which wins over the hostname"""
+    assert StreamConsumer(STREAM, GROUP, consumer_name="worker-a", redis=mock_redis).consumer_name == "worker-a"
+    monkeypatch.setattr(settings, "stream_consumer_name", "worker-b")
+    assert StreamConsumer(STREAM, GROUP, redis=mock_redis).consumer_name == "worker-b"
+    monkeypatch.setattr(settings, "stream_consumer_name", "")
+    assert StreamConsumer(STREAM, GROUP, redis=mock_redis).consumer_name == socket.gethostname()
+
+
+@pytest.mark.asyncio
+async def test_embedded_consumers_claim_worker_slots(mock_redis):
+    """Workers sharing one name get a slot each, and a restarted worker takes over the freed one"""
+    first = StreamConsumer(STREAM, GROUP, consumer_name="api", redis=mock_redis)
+    second = StreamConsumer(STREAM, GROUP, consumer_name="api", redis=mock_redis)
+
+    assert await first.claim_worker_name() == "api-0"
+    assert await second.claim_worker_name() == "api-1"
+    assert await first.claim_worker_name() == "api-0"
+
+    await first.stop_consuming()
+    restarted = StreamConsumer(STREAM, GROUP, consumer_name="api", redis=mock_redis)
+    assert await restarted.claim_worker_name() == "api-0"
+
+    await second.stop_consuming()
+    await restarted.stop_consuming()
+
+
+@pytest.mark.asyncio
+async def test_restarted_consumer_recovers_its_own_pending(mock_redis, monkeypatch):
+    """Messages read but not acknowledged before a restart are handled again under the same name"""
+    monkeypatch.setattr(settings, "stream_claim_interval", 0)
+    await _add_events(mock_redis, ["order-1", "order-2"])
+    # A previous run read the messages and died before acknowledging them
+    await mock_redis.read_stream_group(STREAM, GROUP, "worker-a", count=10)
+
+    consumer = StreamConsumer(STREAM, GROUP, workers=1, consumer_name="worker-a", redis=mock_redis)
+    handled = []
+
+    async def handler(event_data):
+        handled.append(event_data["order"]["id"])
+        if len(handled) == 2:
+            await consumer.stop_consuming()
+
+    consumer.register_handler("order.created", handler)
+    await asyncio.wait_for(consumer.start_consuming(), 2)
+
+    assert handled == ["order-1", "order-2"]
+    assert (await mock_redis.client.xpending(STREAM, GROUP))["pending"] == 0
+
+
+@pytest.mark.asyncio
+async def test_cleanup_idle_consumers_takes_over_pending_then_deletes(mock_redis):
+    """An idle consumer's pending messages are handled by another consumer before it is removed"""
+    await _add_events(mock_redis, ["order-1"])
+    await mock_redis.read_stream_group(STREAM, GROUP, "gone", count=10)
+    consumer = StreamConsumer(STREAM, GROUP, workers=1, consumer_name="alive", redis=mock_redis)
+    handled = []
+
+    async def handler(event_data):
+        handled.append(event_data["order"]["id"])
+
+    consumer.register_handler("order.created", handler)
+    await mock_redis.client.xgroup_createconsumer(STREAM, GROUP, "alive")
+    await asyncio.sleep(0.01)
+
+    removed = await consumer.cleanup_idle_consumers(idle_timeout_ms=1)
+    await consumer.wait_idle()
+    await consumer._drain()
+
+    consumers = await mock_redis.client.xinfo_consumers(STREAM, GROUP)
+    assert removed == ["gone"]
+    assert [c["name"] for c in consumers] == ["alive"]
+    assert handled == ["order-1"]
+    assert (await mock_redis.client.xpending(STREAM, GROUP))["pending"] == 0
+
+
+@pytest.mark.asyncio
+async def test_batch_handler_writes_and_acks_together(mock_redis):
+    """A batch handler gets queued events at once; rejected ones stay pending"""
+    consumer = StreamConsumer(STREAM, GROUP, workers=1, redis=mock_redis)
+    batches = []
+
+    async def handler(events, pipe):
+        batches.append([event["order"]["id"] for event in events])
+        outcomes = []
+        for event in events:
+            if event["order"]["id"] == "bad":
+                outcomes.append(None)
+            else:
+                pipe.incr(f"handled:{event['order']['id']}")
+                outcomes.append(1)
+        return outcomes
+
+    consumer.register_batch_handler("order.created", handler)
+    message_ids = await _add_events(mock_redis, ["a", "bad", "b", "c"])
+
+    await _dispatch_all(consumer, mock_redis)
+    await consumer._drain()
+
+    assert batches == [["a", "bad", "b", "c"]]
+    assert await mock_redis.client.get("handled:c") == "1"
+    pending = await mock_redis.client.xpending_range(STREAM, GROUP, "-", "+", 10)
+    assert [entry["message_id"] for entry in pending] == [message_ids[1]]
+
+
+@pytest.mark.asyncio
+async def test_plain_handler_sees_earlier_batch_writes(mock_redis):
+    """Writes queued before a plain handler runs are sent first, keeping stream order"""
+    consumer = StreamConsumer(STREAM, GROUP, workers=1, redis=mock_redis)
+    seen = []
+
+    async def batch_handler(events, pipe):
+        for event in events:
+            pipe.set("last", event["order"]["id"])
+        return [1] * len(events)
+
+    async def handler(event_data):
+        seen.append(await mock_redis.client.get("last"))
+
+    consumer.register_batch_handler("order.created", batch_handler)
+    consumer.register_handler("order.noted", handler)
+    await _add_events(mock_redis, ["a"])
+    await mock_redis.client.xadd(STREAM, {
+        "event_type": "order.noted", "order_id": "a",
+        "data": json.dumps({"event_type": "order.noted", "order": {"id": "a"}})
+    })
+
+    await _dispatch_all(consumer, mock_redis)
+    await consumer._drain()
+
+    assert seen == ["a"]
+    assert (await mock_redis.client.xpending(STREAM, GROUP))["pending"] == 0
+
+
+@pytest.mark.asyncio
+async def test_failing_batch_handler_leaves_batch_pending(mock_redis):
+    """A batch handler that raises or miscounts its outcomes acknowledges nothing"""
+    consumer = StreamConsumer(STREAM, GROUP, workers=1, redis=mock_redis)
+
+    async def handler(events, pipe):
+        return [0]
+
+    consumer.register_batch_handler("order.created", handler)
+    await _add_events(mock_redis, ["a", "b"])
+
+    await _dispatch_all(consumer, mock_redis)
+    await consumer._drain()
+
+    assert (await mock_redis.client.xpending(STREAM, GROUP))["pending"] == 2
+
+
+@pytest.mark.asyncio
+async def test_message_with_failed_write_stays_pending(mock_redis):
+    """Only messages whose own and shared writes succeeded are acknowledged"""
+    consumer = StreamConsumer(STREAM, GROUP, workers=1, redis=mock_redis)
+    await mock_redis.client.hset("handled:b", "field", "value")
+
+    async def handler(events, pipe):
+        pipe.incr("batches")
+        for event in events:
+            pipe.incr(f"handled:{event['order']['id']}")
+        return [1] * len(events)
+
+    consumer.register_batch_handler("order.created", handler)
+    message_ids = await _add_events(mock_redis, ["a", "b", "c"])
+
+    await _dispatch_all(consumer, mock_redis)
+    await consumer._drain()
+
+    assert await mock_redis.client.get("handled:c") == "1"
+    pending = await mock_redis.client.xpending_range(STREAM, GROUP, "-", "+", 10)
+    assert [entry["message_id"] for entry in pending] == [message_ids[1]]
+
+    # A failed shared write keeps the whole batch pending
+    await mock_redis.client.delete("handled:b", "batches")
+    await mock_redis.client.hset("batches", "field", "value")
+    await _add_events(mock_redis, ["d", "e"])
+
+    await _dispatch_all(consumer, mock_redis)
+    await consumer._drain()
+
+    assert (await mock_redis.client.xpending(STREAM, GROUP))["pending"] == 3
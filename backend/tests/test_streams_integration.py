@@ -4,101 +4,15 @@ Tests stream publishing, consuming, and consumer group operations
 """
 
 import pytest
-import json
-import asyncio
-from unittest.mock import AsyncMock, MagicMock
 from datetime import datetime
-from models import PizzaOrder, OrderEvent, OrderStatus
+from models import PizzaOrder
 from services.order_service import OrderService
-from redis_client import RedisClient
 
 
 @pytest.fixture
-def mock_redis_streams():
+def mock_redis_streams(mock_redis):
     """Create a mock Redis client with streams support"""
-    mock = MagicMock()
-    mock.client = AsyncMock()
-    
-    # Storage for orders and streams
-    mock._storage = {}
-    mock._streams = {}
-    
-    # Mock set/get for orders
-    async def mock_set(key, value):
-        mock._storage[key] = value
-        return True
-    
-    async def mock_get(key):
-        return mock._storage.get(key)
-    
-    async def mock_keys(pattern):
-        return [k for k in mock._storage.keys() if pattern.replace("*", "") in k]
-    
-    # Mock pub/sub
-    mock.publish = AsyncMock(return_value=1)
-    
-    # Mock stream operations
-    async def mock_add_to_stream(stream_name, event_data, stream_id="*"):
-        if stream_name not in mock._streams:
-            mock._streams[stream_name] = []
-        if stream_id == "*":
-            stream_id = f"{len(mock._streams[stream_name])+1}-0"
-        mock._streams[stream_name].append((stream_id, event_data))
-        return stream_id
-    
-    async def mock_read_stream(stream_name, start_id="0", stop_id="+", count=None):
-        if stream_name not in mock._streams:
-            return []
-        entries = mock._streams[stream_name]
-        if count:
-            return entries[-count:]
-        return entries
-    
-    async def mock_get_stream_info(stream_name):
-        if stream_name in mock._streams:
-            return {
-                "length": len(mock._streams[stream_name]),
-                "first-entry": mock._streams[stream_name][0] if mock._streams[stream_name] else None,
-                "last-entry": mock._streams[stream_name][-1] if mock._streams[stream_name] else None,
-            }
-        return None
-    
-    async def mock_create_consumer_group(stream_name, group_name, start_id="0", mkstream=True):
-        return True
-    
-    async def mock_acknowledge_message(stream_name, group_name, message_ids):
-        return len(message_ids)
-    
-    async def mock_read_stream_group(stream_name, group_name, consumer_name, count=1, block=None):
-        if stream_name not in mock._streams:
-            return []
-        entries = mock._streams[stream_name]
-        if count and len(entries) > 0:
-            return [(stream_name, entries[-count:])]
-        return []
-    
-    async def mock_trim_stream(stream_name, max_len, approximate=True):
-        if stream_name in mock._streams:
-            mock._streams[stream_name] = mock._streams[stream_name][-max_len:]
-        return len(mock._streams.get(stream_name, []))
-    
-    async def mock_get_pending_messages(stream_name, group_name, consumer_name=None):
-        return []
-    
-    # Assign all methods
-    mock.client.set = mock_set
-    mock.client.get = mock_get
-    mock.client.keys = mock_keys
-    mock.add_to_stream = mock_add_to_stream
-    mock.read_stream = mock_read_stream
-    mock.get_stream_info = mock_get_stream_info
-    mock.create_consumer_group = mock_create_consumer_group
-    mock.acknowledge_message = mock_acknowledge_message
-    mock.read_stream_group = mock_read_stream_group
-    mock.trim_stream = mock_trim_stream
-    mock.get_pending_messages = mock_get_pending_messages
-    
-    return mock
+    return mock_redis
 
 
 @pytest.mark.asyncio
@@ -117,11 +31,11 @@ async def test_stream_event_publication(mock_redis_streams):
     event = await order_service.create_order(order)
     
     # Verify event was published to stream
-    assert "pizza_orders_stream" in mock_redis_streams._streams
-    assert len(mock_redis_streams._streams["pizza_orders_stream"]) > 0
+    entries = await mock_redis_streams.read_stream("pizza_orders_stream")
+    assert len(entries) > 0
     
     # Verify stream entry contains event data
-    stream_id, stream_data = mock_redis_streams._streams["pizza_orders_stream"][-1]
+    stream_id, stream_data = entries[-1]
     assert stream_data["event_type"] == "order.created"
     assert stream_data["order_id"] == order.id
 
@@ -227,9 +141,14 @@ async def test_stream_message_acknowledgment(mock_redis_streams):
     )
     await order_service.create_order(order)
     
-    # Get message IDs
-    entries = await mock_redis_streams.read_stream("pizza_orders_stream")
-    message_ids = [entry[0] for entry in entries]
+    # Deliver the messages to a consumer of the group
+    messages = await mock_redis_streams.read_stream_group(
+        "pizza_orders_stream",
+        "test_group",
+        "test_consumer",
+        count=10
+    )
+    message_ids = [entry[0] for _, entries in messages for entry in entries]
     
     # Acknowledge messages
     ack_count = await mock_redis_streams.acknowledge_message(
@@ -261,7 +180,7 @@ async def test_stream_trim_operation(mock_redis_streams):
     initial_length = info["length"]
     
     # Trim stream to keep only 2 entries
-    await mock_redis_streams.trim_stream("pizza_orders_stream", 2)
+    await mock_redis_streams.trim_stream("pizza_orders_stream", 2, approximate=False)
     
     # Check trimmed size
     info = await mock_redis_streams.get_stream_info("pizza_orders_stream")
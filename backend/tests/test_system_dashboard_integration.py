@@ -351,3 +351,76 @@ async def test_last_updated_timestamp(client):
         assert dt is not None
     except ValueError:
         pytest.fail(f"Invalid timestamp format: {last_updated}")
+
+
+@pytest.mark.asyncio
+async def test_state_changes_since_high_water_mark(client):
+    """Test that /api/state/changes returns only orders changed after the mark."""
+    
+    order_data = {"pizza_name": "Old Pizza", "supplier_name": "Delta Supplier", "supplier_price": 10.0}
+    await client.post("/api/orders", json=order_data)
+    
+    # Without `since` only the current mark is returned
+    response = await client.get("/api/state/changes")
+    assert response.status_code == 200
+    initial = response.json()
+    assert initial["reset"] is True
+    assert initial["orders"] == []
+    mark = initial["high_water_mark"]
+    
+    order_data["pizza_name"] = "New Pizza"
+    new_id = (await client.post("/api/orders", json=order_data)).json()["order"]["id"]
+    await client.post(f"/api/orders/{new_id}/supplier-respond", params={"accept": True})
+    
+    response = await client.get("/api/state/changes", params={"since": mark})
+    assert response.status_code == 200
+    changes = response.json()
+    assert changes["reset"] is False
+    assert [order["id"] for order in changes["orders"]] == [new_id]
+    assert changes["orders"][0]["status"] == "supplier_accepted"
+    assert changes["statistics"]["total_orders"] >= 2
+    assert changes["high_water_mark"] != mark
+    
+    # Nothing new since the latest mark
+    response = await client.get("/api/state/changes", params={"since": changes["high_water_mark"]})
+    assert response.json()["orders"] == []
+    assert response.json()["high_water_mark"] == changes["high_water_mark"]
+
+
+@pytest.mark.asyncio
+async def test_state_carries_changes_mark(client):
+    """Test that changes are followed from the mark returned with /api/state."""
+    
+    order_data = {"pizza_name": "Old Pizza", "supplier_name": "Delta Supplier", "supplier_price": 10.0}
+    await client.post("/api/orders", json=order_data)
+    state = (await client.get("/api/state")).json()
+    
+    order_data["pizza_name"] = "New Pizza"
+    new_id = (await client.post("/api/orders", json=order_data)).json()["order"]["id"]
+    
+    response = await client.get("/api/state/changes", params={"since": state["changes_mark"]})
+    changes = response.json()
+    assert changes["reset"] is False
+    assert [order["id"] for order in changes["orders"]] == [new_id]
+
+
+@pytest.mark.asyncio
+async def test_state_changes_rejects_invalid_mark(client):
+    """Test that a malformed `since` is a client error."""
+    
+    response = await client.get("/api/state/changes", params={"since": "yesterday"})
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_state_orders_pages_one_status(client):
+    """Test that /api/state/orders returns one page of a single status column."""
+    
+    order_data = {"pizza_name": "Paged Pizza", "supplier_name": "Page Supplier", "supplier_price": 10.0}
+    ids = [(await client.post("/api/orders", json=order_data)).json()["order"]["id"] for _ in range(3)]
+    
+    response = await client.get("/api/state/orders", params={"status": "pending_supplier", "offset": 1, "limit": 1})
+    assert response.status_code == 200
+    page = response.json()
+    assert list(page) == ["pending_supplier"]
+    assert [order["id"] for order in page["pending_supplier"]] == [ids[1]]
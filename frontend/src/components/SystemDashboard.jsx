@@ -176,6 +176,23 @@ ErrorState.propTypes = {
   onRetry: PropTypes.func.isRequired,
 };
 
+// Merge changed orders into orders_by_status, keeping each list newest first
+const applyOrderChanges = (ordersByStatus, changedOrders) => {
+  const changedIds = new Set(changedOrders.map((order) => order.id));
+  const merged = {};
+  Object.entries(ordersByStatus).forEach(([status, orders]) => {
+    merged[status] = orders.filter((order) => !changedIds.has(order.id));
+  });
+  changedOrders.forEach((order) => {
+    merged[order.status] = [order, ...(merged[order.status] || [])];
+  });
+  Object.keys(merged).forEach((status) => {
+    merged[status].sort((a, b) => (b.created_at || '').localeCompare(a.created_at || ''));
+    if (merged[status].length === 0) delete merged[status];
+  });
+  return merged;
+};
+
 // Main Component
 const SystemDashboard = () => {
   const [systemState, setSystemState] = useState(null);
@@ -186,6 +203,8 @@ const SystemDashboard = () => {
   
   // Use ref to track notification timeout and prevent memory leaks
   const notificationTimeoutRef = useRef(null);
+  // Stream ID of the last event reflected in systemState
+  const highWaterMarkRef = useRef(null);
 
   // Show notification helper with cleanup
   const showNotification = useCallback((message, type = 'info') => {
@@ -223,7 +242,11 @@ const SystemDashboard = () => {
         throw new Error('Failed to fetch system state');
       }
       
+      // The state carries its own mark, taken before the state was read
+      // (it may come from a cache or lag the stream), so changes racing it
+      // are replayed rather than missed
       const data = await response.json();
+      highWaterMarkRef.current = data.changes_mark || null;
       setSystemState(data);
       setLastUpdated(new Date());
     } catch (err) {
@@ -233,11 +256,47 @@ const SystemDashboard = () => {
     }
   }, []);
 
+  // Fetch only what changed since the last update
+  const fetchChanges = useCallback(async () => {
+    if (!highWaterMarkRef.current) {
+      return fetchSystemState();
+    }
+    try {
+      let hasMore = true;
+      while (hasMore) {
+        const params = new URLSearchParams({ since: highWaterMarkRef.current });
+        const response = await fetch(`${API_BASE_URL}/api/state/changes?${params}`);
+        
+        if (!response.ok) {
+          throw new Error('Failed to fetch state changes');
+        }
+        
+        const changes = await response.json();
+        if (changes.reset) {
+          return fetchSystemState();
+        }
+        
+        highWaterMarkRef.current = changes.high_water_mark;
+        hasMore = changes.has_more;
+        setSystemState((previous) => ({
+          ...previous,
+          statistics: changes.statistics,
+          active_drivers: changes.active_drivers,
+          orders_by_status: applyOrderChanges(previous?.orders_by_status || {}, changes.orders),
+        }));
+      }
+      setError(null);
+      setLastUpdated(new Date());
+    } catch (err) {
+      setError(err.message);
+    }
+  }, [fetchSystemState]);
+
   // WebSocket callback wrapped with useCallback to prevent stale closures
   const handleWebSocketMessage = useCallback((event) => {
-    // Refetch system state on any order event
+    // Apply the changes on any order event
     if (event.event_type?.startsWith('order.')) {
-      fetchSystemState();
+      fetchChanges();
       
       // Show notification for important events
       const eventMessages = {
@@ -252,7 +311,7 @@ const SystemDashboard = () => {
         showNotification(message, 'success');
       }
     }
-  }, [fetchSystemState, showNotification]);
+  }, [fetchChanges, showNotification]);
 
   const { isConnected } = useWebSocket(handleWebSocketMessage);
 
@@ -265,12 +324,12 @@ const SystemDashboard = () => {
   useEffect(() => {
     const interval = setInterval(() => {
       if (!loading) {
-        fetchSystemState();
+        fetchChanges();
       }
     }, 5000);
 
     return () => clearInterval(interval);
-  }, [loading, fetchSystemState]);
+  }, [loading, fetchChanges]);
 
   if (loading && !systemState) {
     return <LoadingState />;